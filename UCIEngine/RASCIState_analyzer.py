@@ -1,18 +1,188 @@
+import os
 import re
-from gLog_tools import match_partial_line
+import time
+import glob
+import asyncio
+import json
+import argparse
+import numpy as np
+import pandas as pd
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from gLog_tools import ParseCache
+from addressing import ArrayCache, config_strings
 from RAS_addressing import RASAddrEngine
 
+# built once, tokens of a line are the fields between brackets, commas
+# and white spaces
+_SEPARATORS = str.maketrans('(),', '   ')
+_ADDRESS = re.compile(r'\d+|\*+')
+
+def _tokens(line):
+    return line.translate(_SEPARATORS).split()
+
+class RASCIState(object):
+    """One CI state read from the log
+
+    Attributes:
+        energy: float
+        addrs: numpy 1d int64 array, addresses of the printed
+               configurations in printed order, -1 if unaddressed
+        coeffs: numpy 1d complex128 array, coefficients
+        na: numpy 1d boolean array, True for '*' entries without address
+    """
+    __slots__ = ('energy', 'addrs', 'coeffs', 'na')
+
+    def __init__(self, energy, addrs, coeffs, na):
+        self.energy = energy
+        self.addrs  = addrs
+        self.coeffs = coeffs
+        self.na     = na
+
+    def __len__(self):
+        return self.addrs.shape[0]
+
+    def as_dict(self, i_na=0):
+        """ coefficients as dict keyed by address, unaddressed entries are
+            keyed as 'na0', 'na1', ... counting from i_na
+
+        Returns:
+            coeffs: dict
+            i_na: int, counter after this state
+        """
+        coeffs = {}
+        for addr, coeff, na in zip(self.addrs.tolist(), self.coeffs.tolist(),
+                                   self.na.tolist()):
+            if na:
+                addr = 'na' + str(i_na)
+                i_na += 1
+            coeffs[addr] = coeff
+        return coeffs, i_na
+
+class _StateParser(object):
+    """Line by line parser of RASCI states
+
+       Tokens of the current state are collected up to maxNCoeff entries
+       and converted at once into preallocated buffers, memory does not
+       grow with the file.
+
+    Attributes:
+        CAS_spec: list of int, specification of CAS
+        RAS_spec: list of int, specificaiton of RAS
+        complex: boolean, coefficients are printed as complex numbers
+    """
+    # version of parsed results in ParseCache
+    version = 1
+
+    def __init__(self, maxNCoeff=50):
+        self.maxNCoeff = maxNCoeff
+        self.CAS_spec = None
+        self.RAS_spec = None
+        self.complex  = True
+
+        self._energy = None
+        self._n = -1
+        self._tokens = []
+        self._addrs = np.empty(maxNCoeff, dtype=np.int64)
+        self._re    = np.empty(maxNCoeff, dtype=np.float64)
+        self._im    = np.empty(maxNCoeff, dtype=np.float64)
+
+    def feed_line(self, line):
+        """ parse one line
+
+        Returns:
+            RASCIState if the line completes a state, otherwise None
+        """
+        if line.startswith(' RAS('):
+            self.RAS_spec = list(map(int, _tokens(line)[1:]))
+        elif line.startswith(' CAS('):
+            self.CAS_spec = list(map(int, _tokens(line)[1:]))
+        elif line.startswith(' State:'):
+            self._energy = float(line.split()[-1])
+            self._n = 0
+            self._tokens.clear()
+        elif self._n >= 0:
+            return self._feed_coeffs(line)
+        return None
+
+    def _feed_coeffs(self, line):
+        tokens = _tokens(line)
+
+        if self._n == 0 and self.complex:
+            # a complex line holds triples (addr, real, imag)
+            if not (len(tokens) == 3 or
+                    (len(tokens) > 3 and _ADDRESS.fullmatch(tokens[3]))):
+                self.complex = False
+
+        width = 3 if self.complex else 2
+        n = min(len(tokens)//width, self.maxNCoeff - self._n)
+        if n > 0:
+            self._tokens.extend(tokens[:width*n])
+            self._n += n
+
+        if len(tokens) == 0 or self._n == self.maxNCoeff:
+            return self._finish_state(width)
+        return None
+
+    def _finish_state(self, width):
+        n = self._n
+        self._n = -1
+        tokens = self._tokens
+
+        na = np.array([addr[0] == '*' for addr in tokens[0::width]], dtype=bool)
+        self._addrs[:n] = [('-1' if addr[0] == '*' else addr)
+                           for addr in tokens[0::width]]
+        self._re[:n] = tokens[1::width]
+        if width == 3:
+            self._im[:n] = tokens[2::width]
+        else:
+            self._im[:n] = 0.
+        tokens.clear()
+
+        coeffs = np.empty(n, dtype=np.complex128)
+        coeffs.real = self._re[:n]
+        coeffs.imag = self._im[:n]
+        return RASCIState(self._energy, self._addrs[:n].copy(), coeffs, na)
+
+def iter_states(filename, maxNCoeff=50, parser=None):
+    """ yield RASCIState of a log file one by one
+
+    Args:
+        filename: str, Gaussian log file
+        maxNCoeff: int, maximal number of coefficients kept per state
+        parser: _StateParser, holds CAS_spec and RAS_spec once they are
+                read, a new one is used if None
+    """
+    if parser is None: parser = _StateParser(maxNCoeff)
+    with open(filename, 'r', buffering=2**20) as f:
+        for line in f:
+            state = parser.feed_line(line)
+            if state is not None: yield state
+
 class RASCIStates:
     """
     Attributes:
         Energies: list
-        Coeffs: list of dictionary
+        states: list of RASCIState
+        coeffs: list of dictionary, built from states on first access
         CAS_spec: specification of CAS
         RAS_spec: specificaiton of RAS
     """
-    def __init__(self, filename, maxNCoeff=50):
-
-        self._readStates(filename, maxNCoeff)
+    def __init__(self, filename, maxNCoeff=50, cache=False):
+        """
+        Args:
+            filename: str, Gaussian log file
+            maxNCoeff: int, maximal number of coefficients kept per state
+            cache: boolean, keep the parsed states in a ParseCache of
+                   filename and load them from it when it is valid
+        """
+        if cache:
+            pcache = ParseCache(filename)
+            key = ParseCache.key('RASCIStates', maxNCoeff)
+            if not self._loadStates(pcache, key):
+                self._readStates(filename, maxNCoeff)
+                self._saveStates(pcache, key)
+        else:
+            self._readStates(filename, maxNCoeff)
 
         return
 
@@ -20,129 +190,410 @@ class RASCIStates:
         """
         Read RAS configuration and State info
         """
-        f = open(filename,'r')
-        iterCoeff = -1
-        i_na = 0
-        self.coeffs = []
-        self.energies = []
-        self.CAS_spec = None
-        self.RAS_spec = None
-        self.complex = True
+        parser = _StateParser(maxNCoeff)
+        self.states = list(iter_states(filename, maxNCoeff, parser))
+        self.energies = [state.energy for state in self.states]
+        self.CAS_spec = parser.CAS_spec
+        self.RAS_spec = parser.RAS_spec
+        self.complex  = parser.complex
+        self._coeffs  = None
 
-        for line in f:
-            if match_partial_line(' RAS(',line): 
-                info = list(filter(None, re.split('[(),\s]', line)))[1:]
-                self.RAS_spec = list(map(int, info))
-
-            elif match_partial_line(' CAS(',line):
-                info = list(filter(None, re.split('[(),\s]', line)))[1:]
-                self.CAS_spec = list(map(int, info))
-
-            elif match_partial_line(' State:',line):
-                self.energies.append(float(line.split()[-1]))
-                iterCoeff = 0
-                coeffs_i = {}
-
-            elif iterCoeff >= 0:
-                coeffs = list(filter(None, re.split('[(),\s]',line)))
-                
-                if(iterCoeff == 0):
-                    try:
-                        int(coeffs[3])
-                    except:
-                        self.complex = False
-                
-                if(self.complex):
-                    n_coeffs = int(len(coeffs)/3)
-                else:
-                    n_coeffs = int(len(coeffs)/2)
-
-                n_left_to_record = maxNCoeff - iterCoeff
-
-                if n_left_to_record >= n_coeffs:
-                    n_record = n_coeffs
-                else:
-                    n_record = n_left_to_record
-
-                for j in range(n_record):
-                    jj = j*3 if self.complex else j*2
-
-                    if coeffs[jj][0] == '*':
-                        addr = 'na' + str(i_na)
-                        i_na += 1
-                    else:
-                        addr = int(coeffs[jj])
-
-                    coeffs_i[addr] = float(coeffs[jj+1])
-                    coeffs_i[addr] += 1j*float(coeffs[jj+2]) if self.complex else 0
-
-                iterCoeff += n_record
-
-                if len(coeffs) == 0 or iterCoeff == maxNCoeff:
-                    iterCoeff = -1
-                    self.coeffs.append(coeffs_i)
+        return
+
+    def _saveStates(self, pcache, key):
+        """ states as concatenated arrays with offsets of each state """
+        lens = [len(state) for state in self.states]
+        arrays = {'energies':np.array(self.energies, dtype=np.float64),
+                  'offsets':np.cumsum([0] + lens, dtype=np.int64)}
+        for name, dtype in [('addrs', np.int64), ('coeffs', np.complex128),
+                            ('na', bool)]:
+            arrays[name] = np.concatenate([np.zeros(0, dtype=dtype)] +
+                                          [getattr(state, name) for state in self.states])
+        info = {'CAS_spec':self.CAS_spec, 'RAS_spec':self.RAS_spec,
+                'complex':self.complex}
+        pcache.save(key, _StateParser.version, arrays, info)
+
+    def _loadStates(self, pcache, key):
+        cached = pcache.load(key, _StateParser.version)
+        if cached is None: return False
+        arrays, info = cached
+
+        offs = arrays['offsets'].tolist()
+        self.energies = arrays['energies'].tolist()
+        self.states = [RASCIState(self.energies[i],
+                                  arrays['addrs'][offs[i]:offs[i+1]],
+                                  arrays['coeffs'][offs[i]:offs[i+1]],
+                                  arrays['na'][offs[i]:offs[i+1]])
+                       for i in range(len(self.energies))]
+        self.CAS_spec = info['CAS_spec']
+        self.RAS_spec = info['RAS_spec']
+        self.complex  = info['complex']
+        self._coeffs  = None
+        return True
+
+    @property
+    def coeffs(self):
+        if self._coeffs is None:
+            i_na = 0
+            self._coeffs = []
+            for state in self.states:
+                coeffs_i, i_na = state.as_dict(i_na)
+                self._coeffs.append(coeffs_i)
+        return self._coeffs
+
+    def engine(self):
+        """ RASAddrEngine of the CAS and RAS specification of the log """
+        if self.RAS_spec is None: self.RAS_spec = [0, 0, 0, 0]
+        return RASAddrEngine(NOrb=self.CAS_spec[1], NElec=self.CAS_spec[0],
+                             MxHole=self.RAS_spec[0], NORAS1=self.RAS_spec[1],
+                             MxElec=self.RAS_spec[2], NORAS3=self.RAS_spec[3])
+
+    def state_config_table(self, threshold=0.1, orb_assign=None, engine=None):
+        """ leading configurations of all states as a table
+
+        Args:
+            threshold: float, keep coefficients with |C|^2 >= threshold
+            orb_assign: dict, {group name: orbitals (starting from 1)},
+                        adds the number of electrons in each group
+            engine: RASAddrEngine of the log, built if None
+
+        Returns:
+            pandas DataFrame with a row per kept coefficient in printed
+            order and columns
+                state: int, starting from 1
+                energy: float
+                addr: int, -1 for unaddressed entries
+                coeff: complex
+                weight: float, |C|^2
+                config: str of 0 and 1, missing (None or NaN) for
+                        unaddressed entries
+                one int column per group of orb_assign, -1 for
+                unaddressed entries
+        """
+        if orb_assign is not None: assert isinstance(orb_assign, dict)
+        if engine is None: engine = self.engine()
+
+        lens = [len(state) for state in self.states]
+        addrs  = np.concatenate([np.zeros(0, dtype=np.int64)] +
+                                [state.addrs for state in self.states])
+        coeffs = np.concatenate([np.zeros(0, dtype=np.complex128)] +
+                                [state.coeffs for state in self.states])
+        na     = np.concatenate([np.zeros(0, dtype=bool)] +
+                                [state.na for state in self.states])
+        i_state = np.repeat(np.arange(len(self.states)), lens)
+
+        weights = np.abs(coeffs**2)
+        keep = weights >= threshold
+        addrs, coeffs, na, i_state, weights = (addrs[keep], coeffs[keep], na[keep],
+                                               i_state[keep], weights[keep])
+
+        occ = np.zeros(shape=(addrs.shape[0], engine.NOrb), dtype=np.uint8)
+        if (~na).any(): occ[~na] = engine.de_addressing_batch(addrs[~na])
+        configs = np.array(config_strings(occ), dtype=object)
+        configs[na] = None
+
+        table = pd.DataFrame({'state':i_state + 1,
+                              'energy':np.array(self.energies)[i_state],
+                              'addr':addrs, 'coeff':coeffs, 'weight':weights,
+                              'config':configs})
+
+        if orb_assign is not None:
+            groups = list(orb_assign.keys())
+            member = np.zeros(shape=(engine.NOrb, len(groups)), dtype=np.int32)
+            for g, orbs in enumerate(orb_assign.values()):
+                np.add.at(member[:,g], np.asarray(list(orbs), dtype=np.int64) - 1, 1)
+            group_occ = occ @ member
+            group_occ[na] = -1
+            for g, name in enumerate(groups):
+                table[name] = group_occ[:,g]
+
+        return table
+
+    def gen_state_config_report(self, threshold = 0.1, orb_assign = None,
+                                verbose = True, engine = None):
+        """ leading configurations of all states, see state_config_table
+
+        Args:
+            verbose: boolean, print the report
+
+        Returns:
+            pandas DataFrame, see state_config_table
+        """
+        table = self.state_config_table(threshold, orb_assign, engine)
+        if verbose:
+            print(format_state_config_report(table, self.energies, self.CAS_spec,
+                                             self.RAS_spec, threshold, orb_assign))
+        return table
+
+def format_state_config_report(table, energies, CAS_spec, RAS_spec,
+                               threshold, orb_assign=None):
+    """ text report of a table from RASCIStates.state_config_table """
+    if RAS_spec is None: RAS_spec = [0, 0, 0, 0]
+    lines = ['N_TOTAL_ACTIVE_ORBITALS = %i, N_TOTAL_ACTIVE_ELECTRON = %i'
+             %(CAS_spec[1], CAS_spec[0]),
+             'N_MAX_HOLE = %i, N_RAS1 = %i, N_MAX_ELECTRON = %i, N_RAS3 = %i' % tuple(RAS_spec),
+             ' ',
+             'Analyzing leading determinants with squared oefficient absolute value larger than %f' %threshold,
+             ' ']
+
+    groups = [] if orb_assign is None else list(orb_assign.keys())
+    rows = {}
+    for row in table.to_dict('records'):
+        rows.setdefault(row['state'], []).append(row)
+
+    for i in range(len(energies)):
+        lines.append('State %i, Energy: %20.10f' %(i+1, energies[i]))
+        for row in rows.get(i+1, []):
+            coeff = row['coeff']
+            # unaddressed entries, config is None or NaN by the pandas version
+            if row['addr'] < 0:
+                lines.append('  |%8s>: %8.5f+%8.5fi; |C|^2: %.5E ' %
+                             ('*'*8, coeff.real, coeff.imag, row['weight']))
+                continue
+
+            if orb_assign is None:
+                print_elec_config = str(row['config'])
             else:
-                pass
+                print_elec_config = ''
+                for orb_name in groups:
+                    print_elec_config += ' %s%2i' %(orb_name, row[orb_name])
+
+            lines.append('  |%8i>: %8.5f+%8.5fi; |C|^2: %.5E; ' %
+                         (row['addr'], coeff.real, coeff.imag, row['weight'])
+                         + print_elec_config)
+
+    return '\n'.join(lines)
+
+
+class RASCIFollower(object):
+    """Incremental reader of the log of a running job
+
+       The file position, the unfinished last line and the parser state
+       are kept between polls, so each poll only reads the bytes appended
+       since the previous one. The reader starts over if the file shrinks.
+
+    Attributes:
+        filename: str
+        pos: int, byte offset of the next read
+        last_read: int, number of bytes read by the last poll
+        states: list of RASCIState, all states read so far
+        energies: list of float
+        parser: _StateParser, holds CAS_spec and RAS_spec
+    """
+    def __init__(self, filename, maxNCoeff=50, callback=None):
+        """
+        Args:
+            filename: str, Gaussian log file, may not exist yet
+            maxNCoeff: int, maximal number of coefficients kept per state
+            callback: callable, called with each new RASCIState
+        """
+        self.filename  = filename
+        self.maxNCoeff = maxNCoeff
+        self.callback  = callback
+        self._reset()
 
-        f.close()
         return
 
-    def gen_state_config_report(self, threshold = 0.1, orb_assign = None):
+    def _reset(self):
+        self.pos = 0
+        self.last_read = 0
+        self._partial = b''
+        self.parser = _StateParser(self.maxNCoeff)
+        self.states = []
+        self.energies = []
+
+    @property
+    def CAS_spec(self):
+        return self.parser.CAS_spec
 
-        if orb_assign is not None: assert isinstance(orb_assign, dict)
-        if self.RAS_spec is None: self.RAS_spec = [0, 0, 0, 0]
+    @property
+    def RAS_spec(self):
+        return self.parser.RAS_spec
+
+    def poll(self):
+        """ parse the newly appended lines
+
+        Returns:
+            list of RASCIState completed since the last poll
+        """
+        self.last_read = 0
+        try:
+            with open(self.filename, 'rb') as f:
+                size = os.fstat(f.fileno()).st_size
+                if size < self.pos: self._reset()
+                if size == self.pos: return []
+                f.seek(self.pos)
+                data = f.read(size - self.pos)
+        except FileNotFoundError:
+            return []
+        self.pos += len(data)
+        self.last_read = len(data)
+
+        # only complete lines are parsed, the rest waits for the next poll
+        data = self._partial + data
+        end = data.rfind(b'\n') + 1
+        self._partial = data[end:]
+
+        new = []
+        for line in data[:end].decode(errors='replace').splitlines():
+            state = self.parser.feed_line(line + '\n')
+            if state is None: continue
+            new.append(state)
+            self.states.append(state)
+            self.energies.append(state.energy)
+            if self.callback is not None: self.callback(state)
+
+        return new
 
-        print('N_TOTAL_ACTIVE_ORBITALS = %i, N_TOTAL_ACTIVE_ELECTRON = %i'
-              %(self.CAS_spec[1], self.CAS_spec[0]))
-        print('N_MAX_HOLE = %i, N_RAS1 = %i, N_MAX_ELECTRON = %i, N_RAS3 = %i' % tuple(self.RAS_spec))
-        print(' ')
-        print('Analyzing leading determinants with squared oefficient absolute value larger than %f' %threshold)
-        print(' ')
+    def follow(self, interval=1.0, timeout=None, stop=None):
+        """ poll until timeout seconds without new output or until
+            stop() returns True, new states go to the callback, any
+            appended bytes reset the idle time
 
-        ENGINE = RASAddrEngine(NOrb=self.CAS_spec[1], NElec=self.CAS_spec[0],
-                                MxHole=self.RAS_spec[0], NORAS1=self.RAS_spec[1],
-                                MxElec=self.RAS_spec[2], NORAS3=self.RAS_spec[3])
+        Returns:
+            list of RASCIState, all states read so far
+        """
+        idle = 0.
+        while stop is None or not stop():
+            self.poll()
+            if self.last_read > 0:
+                idle = 0.
+            elif timeout is not None and idle >= timeout:
+                break
+            time.sleep(interval)
+            idle += interval
+        return self.states
+
+    async def astates(self, interval=1.0, timeout=None):
+        """ asynchronous iterator of new states, ends after timeout
+            seconds without new output if timeout is given """
+        idle = 0.
+        while True:
+            new = self.poll()
+            for state in new: yield state
+            if self.last_read > 0:
+                idle = 0.
+            elif timeout is not None and idle >= timeout:
+                return
+            await asyncio.sleep(interval)
+            idle += interval
+
+    def __aiter__(self):
+        return self.astates()
+
+# process-wide engines shared by the logs of a batch,
+# key: (tuple of CAS_spec, tuple of RAS_spec)
+_ENGINES = ArrayCache(lambda key: RASAddrEngine(NOrb=key[0][1], NElec=key[0][0],
+                          MxHole=key[1][0], NORAS1=key[1][1],
+                          MxElec=key[1][2], NORAS3=key[1][3]), maxsize=32)
+
+def _analyze_log(filename, threshold, orb_assign, maxNCoeff, cache):
+    """ table of one log for analyze_logs, errors are returned not raised
+
+    Returns:
+        filename: str
+        table: pandas DataFrame or None if failed
+        error: str or None
+    """
+    try:
+        rasci = RASCIStates(filename, maxNCoeff, cache=cache)
+        if rasci.CAS_spec is None: raise ValueError('no CAS specification found')
+        if rasci.RAS_spec is None: rasci.RAS_spec = [0, 0, 0, 0]
+        engine = _ENGINES[(tuple(rasci.CAS_spec), tuple(rasci.RAS_spec))]
+        configs = rasci.state_config_table(threshold, orb_assign, engine)
+
+        # every state keeps a row, even without leading configurations
+        energies = pd.DataFrame({'state':np.arange(1, len(rasci.energies)+1),
+                                 'energy':rasci.energies})
+        table = energies.merge(configs.drop(columns='energy'), on='state', how='left')
+        table.insert(0, 'file', filename)
+        return filename, table, None
+    except Exception as err:
+        return filename, None, '%s: %s' %(type(err).__name__, err)
 
-        for i in range(len(self.coeffs)):
-            print('State %i, Energy: %20.10f' %(i+1, self.energies[i]))
-            for addr, coeff in self.coeffs[i].items():
-                norm_sqaure = abs(coeff**2)
-                if(norm_sqaure < threshold): continue
+def analyze_logs(patterns, threshold=0.1, orb_assign=None, maxNCoeff=50,
+                 nproc=1, cache=False, verbose=True):
+    """ leading configurations of many RASCI logs in one table
 
-                if isinstance(addr, int):
+    Args:
+        patterns: str or list of str, glob patterns of log files
+        threshold: float, see RASCIStates.state_config_table
+        orb_assign: dict, see RASCIStates.state_config_table
+        maxNCoeff: int, maximal number of coefficients kept per state
+        nproc: int, number of worker processes
+        cache: boolean, use the ParseCache of each log
+        verbose: boolean, print progress
 
-                    elec_config = ENGINE.de_addressing(addr, join_ras=True)
+    Returns:
+        table: pandas DataFrame, columns of state_config_table with a
+               leading 'file' column, a row per state without leading
+               configurations
+        errors: dict, {filename: error message} of failed logs
+    """
+    if isinstance(patterns, str): patterns = [patterns]
+    files = sorted(set(f for pattern in patterns for f in glob.glob(pattern)))
+    args = (threshold, orb_assign, maxNCoeff, cache)
 
-                    if orb_assign is None:
-                        print_elec_config = str(elec_config)
-                    else:
-                        print_elec_config = ''
-                        for orb_name, orb_range in orb_assign.items():
-                            elec_occ = sum([int(elec_config[x-1]) for x in orb_range])
-                            print_elec_config += ' %s%2i' %(orb_name, elec_occ)
+    tables = {}
+    errors = {}
+    def collect(i, result):
+        filename, table, error = result
+        if error is None:
+            tables[filename] = table
+        else:
+            errors[filename] = error
+        if verbose:
+            print('[%i/%i] %s: %s' %(i+1, len(files), filename,
+                  'FAILED, '+error if error is not None else
+                  '%i states' %table['state'].nunique()))
 
-                    print('  |%8i>: %8.5f+%8.5fi; |C|^2: %.5E; ' %
-                          (addr, coeff.real, coeff.imag, norm_sqaure) + print_elec_config)
+    if nproc == 1 or len(files) <= 1:
+        for i, filename in enumerate(files):
+            collect(i, _analyze_log(filename, *args))
+    else:
+        with ProcessPoolExecutor(max_workers=nproc) as pool:
+            futures = [pool.submit(_analyze_log, filename, *args) for filename in files]
+            for i, future in enumerate(as_completed(futures)):
+                collect(i, future.result())
 
-                else:
-                    print('  |%8i>: %8.5f+%8.5fi; |C|^2: %.5E ' %
-                          (addr, coeff.real, coeff.imag, norm_sqaure))
+    if len(tables) == 0: return pd.DataFrame(), errors
 
+    table = pd.concat([tables[f] for f in files if f in tables], ignore_index=True)
+    return table, errors
 
 #---------------------------------------------
 # Running as a Script
 #---------------------------------------------
 
 if __name__ == '__main__':
-    filename = 'rasci_example.log'
-    rasci = RASCIStates('rasci_example.log')
-    list_5f =  list(range(28,41))
-    list_5f.append(7)
-
-    rasci.gen_state_config_report(threshold=0.01,
-        orb_assign={'U-F Bonding':range(1,7),
-                    'U(5f)': list_5f,
-                    'U(7s8s)': range(8,12),
-                    'U(6d)': range(12,22),
-                    'U(7p)': range(22,28),
-                    'U-F Anti-bonding':range(41,47)})
+    parser = argparse.ArgumentParser(
+        description='Leading configurations of RASCI states in Gaussian logs')
+    parser.add_argument('logs', nargs='+', help='glob patterns of log files')
+    parser.add_argument('-t', '--threshold', type=float, default=0.1,
+                        help='minimal squared coefficient absolute value')
+    parser.add_argument('-n', '--nproc', type=int, default=1,
+                        help='number of worker processes')
+    parser.add_argument('-m', '--max-coeff', type=int, default=50,
+                        help='maximal number of coefficients read per state')
+    parser.add_argument('-g', '--orb-assign', default=None,
+                        help='json file of {group name: [orbitals]}')
+    parser.add_argument('-o', '--output', default=None,
+                        help='csv file of the aggregated table')
+    parser.add_argument('--cache', action='store_true',
+                        help='keep parsed states next to the logs')
+    opts = parser.parse_args()
+
+    orb_assign = None
+    if opts.orb_assign is not None:
+        with open(opts.orb_assign, 'r') as f: orb_assign = json.load(f)
+
+    table, errors = analyze_logs(opts.logs, opts.threshold, orb_assign,
+                                 opts.max_coeff, opts.nproc, opts.cache)
+
+    if opts.output is None:
+        print(table.to_string())
+    else:
+        table.to_csv(opts.output, index=False)
+    if len(errors) > 0:
+        print('%i logs failed:' %len(errors))
+        for filename, error in errors.items(): print('  %s: %s' %(filename, error))
@@ -1,6 +1,7 @@
-from scipy.special import comb,binom
+from math import comb
 import numpy as np
 from addressing import *
+from bitstrings import occ_to_bits, n_words
 
 
 
@@ -8,13 +9,22 @@ class RASAddrEngine():
     """Compute the address of given electronic configuration or
     the electron configuration of given address
 
+    With GHF=False (restricted, RHF or UHF orbitals) the orbitals are
+    spatial and a configuration is an alpha string followed by a beta
+    string, 2*NOrb characters. Alpha and beta strings are addressed by
+    their own GHF engines, a category is a pair of an alpha and a beta
+    string category whose holes and electrons together obey MxHole and
+    MxElec, and its configurations are laid out as an alpha x beta
+    block with beta running fastest.
+
     Attributes:
         NOrb: int, number of total orbitals
         NElec: int, number of total electrons
         GHF: boolean, generalized Hatree-Fock or restricted Hatree-Fock
 
         AddrArray: list of list: defining addressing array for each
-                   catogories, weight by holes (RAS1) or electrons (RAS2/3)
+                   catogories, weight by holes (RAS1) or electrons (RAS2/3),
+                   [alpha arrays, beta arrays] if not GHF
 
         CatOffs: list of list, contains informations of configuation
                   catogories
@@ -24,12 +34,35 @@ class RASAddrEngine():
                     2 ... RAS3 Offset
                     3 ... Total Configs in Cat_i
                     4 ... Cat_i Offset, if equals -1 -> not valid
+            if not GHF, only valid categories
+                X:  0 ... alpha string category
+                    1 ... beta string category
+                    2 ... number of beta strings
+                    3 ... Total Configs in Cat_i
+                    4 ... Cat_i Offset
+
+        NElec_a, NElec_b: int, number of alpha and beta electrons, if not GHF
+        Alpha, Beta: RASAddrEngine of the alpha and beta strings, if not GHF
+        PairIndex: numpy 2d int64 array, category of a pair of alpha and
+                   beta string categories, -1 if not valid, if not GHF
     """
 
     def __init__(self, NOrb, NElec,
                  MxHole, NORAS1, MxElec, NORAS3,
                  GHF=True, **kwargs):
         """Constructor of the Engine
+
+        Args:
+            NOrb: int, number of orbitals, spatial if not GHF
+            NElec: int, number of electrons
+            MxHole: int, maximal number of holes in RAS1
+            NORAS1: int, number of RAS1 orbitals
+            MxElec: int, maximal number of electrons in RAS3
+            NORAS3: int, number of RAS3 orbitals
+            GHF: boolean, spin orbitals if True, alpha and beta strings
+                 over spatial orbitals otherwise
+            kwargs: NElec_a, NElec_b, number of alpha and beta electrons
+                    if not GHF, default as (NElec+1)//2 alpha electrons
         """
         assert MxElec <= NElec
         assert NORAS1 >= MxHole
@@ -45,6 +78,20 @@ class RASAddrEngine():
         self.NORAS  = [NORAS1, NOrb-NORAS1-NORAS3, NORAS3]
         self.NCat   = (MxHole+1)*(MxElec+1)
 
+        if not GHF:
+            self.NElec_a = kwargs.get('NElec_a', (NElec+1)//2)
+            self.NElec_b = kwargs.get('NElec_b', NElec - self.NElec_a)
+            if self.NElec_a + self.NElec_b != NElec:
+                raise ValueError('NElec_a + NElec_b = %i differs from NElec = %i'
+                                 %(self.NElec_a + self.NElec_b, NElec))
+            if not 0 <= min(self.NElec_a, self.NElec_b) <= max(self.NElec_a, self.NElec_b) <= NOrb:
+                raise ValueError('%i alpha and %i beta electrons do not fit in %i orbitals'
+                                 %(self.NElec_a, self.NElec_b, NOrb))
+            # RAS1 is addressed by holes, it has to be filled in each spin
+            if NORAS1 > min(self.NElec_a, self.NElec_b):
+                raise ValueError('%i RAS1 orbitals exceed %i alpha or %i beta electrons'
+                                 %(NORAS1, self.NElec_a, self.NElec_b))
+
         # calculate addressing arrays that might be used
         self._initAddrArray()
         self._initCategory()
@@ -55,7 +102,8 @@ class RASAddrEngine():
         """
         """
         if self.GHF:
-            self.CatOffs = np.zeros(shape=(self.NCat,5),dtype=np.int)
+            # exact python int arithmetic, see int_array for the storage
+            CatOffs = [[0]*5 for i in range(self.NCat)]
             self.NConfigs = 0
 
             i_cat = 0
@@ -63,25 +111,47 @@ class RASAddrEngine():
                 for i_h in range(self.MxHole+1):
                     NERAS2 = self.NElec - self.NORAS[0] + i_h - i_e
                     if NERAS2 >= 0 and NERAS2 <= self.NORAS[1]:
-                        self.CatOffs[i_cat][0]= 1
-                        self.CatOffs[i_cat][1]= binom(self.NORAS[0],i_h)
-                        self.CatOffs[i_cat][2]= binom(self.NORAS[1],NERAS2)*self.CatOffs[i_cat][1]
-                        self.CatOffs[i_cat][3]= binom(self.NORAS[2],i_e)*self.CatOffs[i_cat][2]
-
-                    if self.CatOffs[i_cat][3] != 0:
-                        self.CatOffs[i_cat][4] = self.NConfigs
-                        self.NConfigs += self.CatOffs[i_cat][3]
+                        CatOffs[i_cat][0]= 1
+                        CatOffs[i_cat][1]= comb(self.NORAS[0],i_h)
+                        CatOffs[i_cat][2]= comb(self.NORAS[1],NERAS2)*CatOffs[i_cat][1]
+                        CatOffs[i_cat][3]= comb(self.NORAS[2],i_e)*CatOffs[i_cat][2]
+
+                    if CatOffs[i_cat][3] != 0:
+                        CatOffs[i_cat][4] = self.NConfigs
+                        self.NConfigs += CatOffs[i_cat][3]
                     else:
-                        self.CatOffs[i_cat][4] = -1
+                        CatOffs[i_cat][4] = -1
 
                     i_cat +=1
 
+            self.CatOffs = int_array(CatOffs)
+
         else:
-            raise Exception('No implementation!')
+            # pairs of valid alpha and beta string categories
+            def string_cats(engine):
+                return [(i_cat, i_cat % (engine.MxHole+1), i_cat // (engine.MxHole+1))
+                        for i_cat in range(engine.NCat) if engine.CatOffs[i_cat][4] != -1]
+
+            CatOffs = []
+            self.PairIndex = -np.ones(shape=(self.Alpha.NCat, self.Beta.NCat), dtype=np.int64)
+            self.NConfigs = 0
+            for i_cat_a, i_h_a, i_e_a in string_cats(self.Alpha):
+                for i_cat_b, i_h_b, i_e_b in string_cats(self.Beta):
+                    if i_h_a + i_h_b > self.MxHole or i_e_a + i_e_b > self.MxElec:
+                        continue
+                    n_b = self.Beta.CatOffs[i_cat_b][3]
+                    n   = self.Alpha.CatOffs[i_cat_a][3]*n_b
+                    self.PairIndex[i_cat_a, i_cat_b] = len(CatOffs)
+                    CatOffs.append([i_cat_a, i_cat_b, n_b, n, self.NConfigs])
+                    self.NConfigs += n
+
+            self.NCat = len(CatOffs)
+            self.CatOffs = int_array(CatOffs)
+
         return
 
     def _initAddrArray(self):
-        """ initialize the addressing arrays"""
+        """ initialize the addressing arrays from the shared cache"""
         self.AddrArray = []
         self.deAddrArray = []
 
@@ -90,8 +160,8 @@ class RASAddrEngine():
             addrarry_ras = []
             deaddrarry_ras = []
             for i in range(self.MxHole+1):
-                addrarry_ras.append(addressing_array(i,self.NORAS[0]))
-#                deaddrarry_ras.append(de_addressing_array(addrarry_ras[-1]))
+                addrarry_ras.append(Z_cache[(i,self.NORAS[0])])
+                deaddrarry_ras.append(Zd_cache[(i,self.NORAS[0])])
             self.AddrArray.append(addrarry_ras)
             self.deAddrArray.append(deaddrarry_ras)
 
@@ -99,8 +169,8 @@ class RASAddrEngine():
             addrarry_ras = []
             deaddrarry_ras = []
             for i in range(self.NORAS[1]):
-                addrarry_ras.append(addressing_array(i,self.NORAS[1]))
-#                deaddrarry_ras.append(de_addressing_array(addrarry_ras[-1]))
+                addrarry_ras.append(Z_cache[(i,self.NORAS[1])])
+                deaddrarry_ras.append(Zd_cache[(i,self.NORAS[1])])
             self.AddrArray.append(addrarry_ras)
             self.deAddrArray.append(deaddrarry_ras)
 
@@ -108,26 +178,47 @@ class RASAddrEngine():
             addrarry_ras = []
             deaddrarry_ras = []
             for i in range(self.MxElec+1):
-                addrarry_ras.append(addressing_array(i,self.NORAS[2]))
-#                deaddrarry_ras.append(de_addressing_array(addrarry_ras[-1]))
+                addrarry_ras.append(Z_cache[(i,self.NORAS[2])])
+                deaddrarry_ras.append(Zd_cache[(i,self.NORAS[2])])
             self.AddrArray.append(addrarry_ras)
             self.deAddrArray.append(deaddrarry_ras)
 
         else:
-            raise Exception('No implementation!')
+            # separate GHF engines for the strings of each spin, the
+            # tables scale with the number of strings, not configurations
+            def spin_engine(NElec_s):
+                return RASAddrEngine(self.NOrb, NElec_s,
+                                     min(self.MxHole, self.NORAS[0]), self.NORAS[0],
+                                     min(self.MxElec, self.NORAS[2], NElec_s),
+                                     self.NORAS[2])
+            self.Alpha = spin_engine(self.NElec_a)
+            self.Beta  = self.Alpha if self.NElec_b == self.NElec_a \
+                         else spin_engine(self.NElec_b)
+            self.AddrArray   = [self.Alpha.AddrArray, self.Beta.AddrArray]
+            self.deAddrArray = [self.Alpha.deAddrArray, self.Beta.deAddrArray]
 
         return
 
+    def _string_cats(self, engine, occ):
+        """ string categories of a spin engine for its occupation matrix """
+        bounds = np.cumsum([0] + engine.NORAS)
+        i_h = engine.NORAS[0] - occ[:,:bounds[1]].sum(axis=1).astype(np.int64)
+        i_e = occ[:,bounds[2]:].sum(axis=1).astype(np.int64)
+        return i_h + (engine.MxHole+1)*i_e
+
     def addressing(self,elec_config):
         """Compute the address of electron configurations
 
         Args:
-            elec_config: strings of 0 and 1 with length of NOrb
+            elec_config: strings of 0 and 1 with length of NOrb,
+                         2*NOrb as alpha and beta strings if not GHF
 
         Returns:
             config_addr: configuraiton address, weight by electron
 
         """
+        if not self.GHF:
+            return self.addressing_batch([elec_config])[0]
 
         assert set(elec_config) == {'0', '1'}
         assert len(elec_config) == self.NOrb
@@ -152,14 +243,14 @@ class RASAddrEngine():
         assert ras_occ[0] <= self.MxHole
         assert ras_occ[2] <= self.MxElec
 
-        ras_addr = np.zeros(3, dtype=np.int)
+        ras_addr = np.zeros(3, dtype=self.CatOffs.dtype)
 
         for X in range(0,3):
             if ras_occ[X] == 0 or ras_occ[X] == self.NORAS[X]:
                 ras_addr[X] = 1
             else:
-                ras_addr[X] = addressing_single_graph(
-                    ras_config[X], self.AddrArray[X][ras_occ[X]])
+                ras_addr[X] = int(addressing_single_graph(
+                    ras_config[X], self.AddrArray[X][ras_occ[X]]))
 
         i_cat =  ras_occ[0] + (self.MxHole+1)*ras_occ[2]
 
@@ -172,6 +263,85 @@ class RASAddrEngine():
 
         return config_addr
 
+    def addressing_batch(self, elec_configs, chunk_size=2**16, packed=False):
+        """Compute the addresses of a batch of electron configurations
+
+        Args:
+            elec_configs: strings, occupation matrix or packed bitstrings
+                          with NOrb orbitals, see occupation_matrix,
+                          2*NOrb as alpha and beta strings if not GHF
+            chunk_size: int, number of configurations processed at once
+            packed: boolean, elec_configs are packed bitstrings, e.g.
+                    de_addressing_batch with as_bits
+
+        Returns:
+            config_addrs: numpy 1d array, configuration addresses, int64
+                          or object if the space exceeds int64
+        """
+        NOcc = self.NOrb if self.GHF else 2*self.NOrb
+        if isinstance(elec_configs, (str, list, tuple)):
+            elec_configs = occupation_matrix(elec_configs, NOcc)
+        else:
+            elec_configs = np.asarray(elec_configs)
+
+        addressing_chunk = self._addressing_chunk if self.GHF \
+                           else self._restricted_addressing_chunk
+        config_addrs = np.empty(elec_configs.shape[0], dtype=self.CatOffs.dtype)
+        for st in range(0, elec_configs.shape[0], chunk_size):
+            config_addrs[st:st+chunk_size] = addressing_chunk(
+                occupation_matrix(elec_configs[st:st+chunk_size], NOcc, packed))
+
+        return config_addrs
+
+    def _addressing_chunk(self, occ):
+        """addresses of an occupation matrix, see addressing_batch"""
+        bounds = np.cumsum([0] + self.NORAS)
+
+        # RAS1 is addressed by holes
+        ras_occ_mat = [1 - occ[:,bounds[0]:bounds[1]],
+                       occ[:,bounds[1]:bounds[2]],
+                       occ[:,bounds[2]:bounds[3]]]
+        ras_occ = np.array([x.sum(axis=1) for x in ras_occ_mat])
+
+        assert (ras_occ[1] + ras_occ[2] - ras_occ[0]
+                == self.NElec - self.NORAS[0]).all()
+        assert (ras_occ[0] <= self.MxHole).all()
+        assert (ras_occ[2] <= self.MxElec).all()
+
+        ras_addr = np.ones(shape=(3,occ.shape[0]), dtype=self.CatOffs.dtype)
+        for X in range(0,3):
+            for n in np.unique(ras_occ[X]):
+                if n == 0 or n == self.NORAS[X]: continue
+                sel = ras_occ[X] == n
+                ras_addr[X][sel] = addressing_batch(ras_occ_mat[X][sel],
+                                                    self.AddrArray[X][n])
+
+        i_cat = ras_occ[0] + (self.MxHole+1)*ras_occ[2]
+        cat_offs = self.CatOffs[i_cat]
+
+        #complimentary RAS1 address
+        ras_addr[0] = cat_offs[:,1] - ras_addr[0] + 1
+
+        config_addrs = ((ras_addr.T-1)*cat_offs[:,:3]).sum(axis=1) \
+            + 1 + cat_offs[:,4]
+
+        return config_addrs
+
+    def _restricted_addressing_chunk(self, occ):
+        """addresses of alpha and beta strings, see addressing_batch"""
+        occ_a, occ_b = occ[:,:self.NOrb], occ[:,self.NOrb:]
+        i_cat_a = self._string_cats(self.Alpha, occ_a)
+        i_cat_b = self._string_cats(self.Beta, occ_b)
+        pair = self.PairIndex[i_cat_a, i_cat_b]
+        assert (pair >= 0).all()
+
+        # addresses inside the string categories, starting from 0
+        addr_a = self.Alpha._addressing_chunk(occ_a) - 1 - self.Alpha.CatOffs[i_cat_a,4]
+        addr_b = self.Beta._addressing_chunk(occ_b) - 1 - self.Beta.CatOffs[i_cat_b,4]
+
+        cat_offs = self.CatOffs[pair]
+        return cat_offs[:,4] + addr_a*cat_offs[:,2] + addr_b + 1
+
     def de_addressing(self,config_addr, join_ras=False):
         """Compute the address of electron configurations
 
@@ -179,8 +349,16 @@ class RASAddrEngine():
             config_addr: configuraiton address, weight by electron
 
         Returns:
-            elec_config: strings of 0 and 1 with length of NOrb
+            elec_config: strings of 0 and 1 with length of NOrb,
+                         if not GHF the RAS strings of alpha followed by
+                         those of beta, or 2*NOrb if join_ras
         """
+        if not self.GHF:
+            occ = self.de_addressing_batch([config_addr])[0]
+            occ = ''.join(map(str, occ.tolist()))
+            if join_ras: return occ
+            bounds = np.cumsum([0] + self.NORAS*2)
+            return [occ[bounds[X]:bounds[X+1]] for X in range(6)]
 
         assert isinstance(config_addr, int)
         assert config_addr > 0 and config_addr <= self.NConfigs
@@ -195,7 +373,7 @@ class RASAddrEngine():
 
             i_cat_prev = i_cat
 
-        ras_occ = np.zeros(3, dtype=np.int)
+        ras_occ = np.zeros(3, dtype=int)
         ras_occ[2] = int(i_cat/(self.MxHole+1))
         ras_occ[0] = i_cat - ras_occ[2]*(self.MxHole+1)
         ras_occ[1] = self.NElec - self.NORAS[0] + ras_occ[0] - ras_occ[2]
@@ -204,12 +382,12 @@ class RASAddrEngine():
 
         cat_addr = config_addr - self.CatOffs[i_cat][4]
 
-        ras_addr = np.zeros(3, dtype=int)
+        ras_addr = np.zeros(3, dtype=self.CatOffs.dtype)
         cat_addr -= 1
 
         for X in range(2, -1, -1):
             # print(self.CatOffs[i_cat])
-            ras_addr[X] = int(cat_addr / self.CatOffs[i_cat][X])
+            ras_addr[X] = cat_addr // self.CatOffs[i_cat][X]
             cat_addr -= ras_addr[X]*self.CatOffs[i_cat][X]
             ras_addr[X] +=1
 
@@ -227,8 +405,8 @@ class RASAddrEngine():
             else:
                 #print(ras_addr[X], type(ras_addr[X]))
                 ras_config.append(de_addressing_single_graph(
-                    ras_addr[X], self.AddrArray[X][ras_occ[X]]))#, 
-                    #self.deAddrArray[X][ras_occ[X]]))
+                    ras_addr[X], self.AddrArray[X][ras_occ[X]],
+                    self.deAddrArray[X][ras_occ[X]]))
 
         #complimentary RAS1 configs
         if(self.CatOffs[i_cat][1] != 1):
@@ -241,3 +419,93 @@ class RASAddrEngine():
             return ras_config
         else:
             return ''.join(ras_config)
+
+    def de_addressing_batch(self, config_addrs, chunk_size=2**16, as_bits=False):
+        """Compute the electron configurations of a batch of addresses
+
+        Args:
+            config_addrs: 1d integer array, configuration addresses
+            chunk_size: int, number of addresses processed at once
+            as_bits: boolean, return packed bitstrings instead
+
+        Returns:
+            occ: numpy 2d uint8 array with shape (n_addrs, NOrb),
+                 (n_addrs, 2*NOrb) as alpha and beta strings if not GHF,
+                 see config_strings for conversion to strings, or
+                 uint64 array with shape (n_addrs, n_words) if as_bits
+        """
+        config_addrs = np.asarray(config_addrs, dtype=self.CatOffs.dtype).ravel()
+        assert (config_addrs > 0).all()
+        assert (config_addrs <= self.NConfigs).all()
+
+        NOcc = self.NOrb if self.GHF else 2*self.NOrb
+        if as_bits:
+            out = np.zeros(shape=(config_addrs.shape[0], n_words(NOcc)),
+                           dtype=np.uint64)
+        else:
+            out = np.zeros(shape=(config_addrs.shape[0], NOcc),
+                           dtype=np.uint8)
+
+        de_addressing_chunk = self._de_addressing_chunk if self.GHF \
+                              else self._restricted_de_addressing_chunk
+        for st in range(0, config_addrs.shape[0], chunk_size):
+            occ = de_addressing_chunk(config_addrs[st:st+chunk_size])
+            out[st:st+chunk_size] = occ_to_bits(occ) if as_bits else occ
+
+        return out
+
+    def _de_addressing_chunk(self, config_addrs):
+        """occupation matrix of addresses, see de_addressing_batch"""
+        # locate categories by binary search over valid offsets
+        valid_cats = np.flatnonzero(self.CatOffs[:,4] != -1)
+        valid_offs = self.CatOffs[valid_cats,4]
+        i_cat = valid_cats[np.searchsorted(valid_offs, config_addrs) - 1]
+        cat_offs = self.CatOffs[i_cat]
+
+        ras_occ = np.zeros(shape=(3,config_addrs.shape[0]), dtype=np.int64)
+        ras_occ[2] = i_cat // (self.MxHole+1)
+        ras_occ[0] = i_cat - ras_occ[2]*(self.MxHole+1)
+        ras_occ[1] = self.NElec - self.NORAS[0] + ras_occ[0] - ras_occ[2]
+
+        ras_addr = np.zeros(shape=(3,config_addrs.shape[0]), dtype=self.CatOffs.dtype)
+        cat_addr = config_addrs - cat_offs[:,4] - 1
+        for X in range(2, -1, -1):
+            ras_addr[X] = cat_addr // cat_offs[:,X]
+            cat_addr -= ras_addr[X]*cat_offs[:,X]
+            ras_addr[X] += 1
+
+        #complimentary RAS1 address
+        ras_addr[0] = cat_offs[:,1] - ras_addr[0] + 1
+
+        occ = np.zeros(shape=(config_addrs.shape[0],self.NOrb), dtype=np.uint8)
+        bounds = np.cumsum([0] + self.NORAS)
+        ras_occ_type = [0, 1, 1]
+        for X in range(0,3):
+            occ_X = occ[:,bounds[X]:bounds[X+1]]
+            for n in np.unique(ras_occ[X]):
+                sel = ras_occ[X] == n
+                if n == 0:
+                    occ_X[sel] = 1 - ras_occ_type[X]
+                elif n == self.NORAS[X]:
+                    occ_X[sel] = ras_occ_type[X]
+                else:
+                    occ_n = de_addressing_batch(ras_addr[X][sel],
+                        self.AddrArray[X][n], self.deAddrArray[X][n])
+                    #complimentary RAS1 configs
+                    occ_X[sel] = occ_n if ras_occ_type[X] else 1 - occ_n
+
+        return occ
+
+    def _restricted_de_addressing_chunk(self, config_addrs):
+        """alpha and beta strings of addresses, see de_addressing_batch"""
+        pair = np.searchsorted(self.CatOffs[:,4], config_addrs) - 1
+        cat_offs = self.CatOffs[pair]
+        addr_a, addr_b = np.divmod(config_addrs - cat_offs[:,4] - 1, cat_offs[:,2])
+
+        occ = np.zeros(shape=(config_addrs.shape[0], 2*self.NOrb), dtype=np.uint8)
+        occ[:,:self.NOrb] = self.Alpha._de_addressing_chunk(
+            self.Alpha.CatOffs[cat_offs[:,0],4] + addr_a + 1)
+        occ[:,self.NOrb:] = self.Beta._de_addressing_chunk(
+            self.Beta.CatOffs[cat_offs[:,1],4] + addr_b + 1)
+
+        return occ
@@ -2,35 +2,67 @@
   A module for CI String Addressing
 """
 
-from scipy.special import comb
 import numpy as np
 import re
+from collections import OrderedDict
+from bitstrings import bits_to_occ, occ_to_bits, n_words
+
+INT64_MAX = np.iinfo(np.int64).max
+
+def binomial_table(n, k):
+    """Pascal triangle of exact binomial coefficients
+
+    Args:
+        n: int, largest upper index
+        k: int, largest lower index
+
+    Returns:
+        B: list of list of python int, B[i][j] = C(i,j)
+           for 0 <= i <= n and 0 <= j <= k
+    """
+    B = [[0]*(k+1) for i in range(n+1)]
+    for i in range(n+1):
+        B[i][0] = 1
+        for j in range(1, min(i,k)+1):
+            B[i][j] = B[i-1][j-1] + B[i-1][j]
+    return B
+
+def int_array(values):
+    """Convert nested lists of python int to an int64 numpy array,
+       falling back to an object array of python int when any value
+       does not fit in int64"""
+    arr = np.array(values, dtype=object)
+    if arr.size == 0 or \
+            (max(arr.flat) <= INT64_MAX and min(arr.flat) >= -INT64_MAX):
+        return arr.astype(np.int64)
+    return arr
 
 def addressing_array(ne,no):
     """Generate and return the addrssing array for given number of
     orbitals no and number of electron ne
 
+    Z[k-1][l-1] = C(no-k, ne-k+1) - C(no-l, ne-k+1) for k <= l <= no-ne+k,
+    which is the closed form of the sum over the lexical vertex weights.
+
     Args:
         ne: int, number of orbitals
         no: int, number of electrons
 
     Returns:
-        Z: numpy 2d array with shape (ne,no), addressing array.
+        Z: numpy 2d array with shape (ne,no), addressing array, int64
+           or object array of python int if the space exceeds int64.
     """
     assert no >= ne and ne >= 0
 
     if ne == 0: return None
 
-    Z = np.zeros(shape=(ne,no), dtype=np.int)
-    for k in range(1,ne):
+    B = binomial_table(no, ne)
+    Z = [[0]*no for k in range(ne)]
+    for k in range(1,ne+1):
         for l in range(k,no-ne+k+1):
-            for m in range(no-l+1, no-k+1):
-                #Z[k-1][l-1] += binom(m, ne-k) - binom(m-1, ne-k-1)
-                Z[k-1][l-1] += comb(m-1, ne-k)
-    for l in range(ne,no+1):
-        Z[ne-1][l-1] = l - ne
+            Z[k-1][l-1] = B[no-k][ne-k+1] - B[no-l][ne-k+1]
 
-    return Z
+    return int_array(Z)
 
 def addressing_single_graph(config, Z):
     """
@@ -50,20 +82,105 @@ def addressing_single_graph(config, Z):
 
     return addr
 
+def occupation_matrix(configs, no=None, packed=False):
+    """Convert a batch of CI strings to a 2d occupation matrix
+
+    Args:
+        configs: one of
+                 list of strings of 0 and 1,
+                 2d array (n_configs, no) of 0 and 1,
+                 if packed, 2d integer array (n_configs, n_words) of
+                 packed bitstrings, see bitstrings module, or 1d
+                 integer array of single word packed bitstrings
+        no: int, number of orbitals, required if packed
+        packed: boolean, configs are packed bitstrings
+
+    Returns:
+        occ: numpy 2d uint8 array with shape (n_configs, no)
+    """
+    if packed:
+        assert no is not None
+        configs = np.asarray(configs)
+        assert np.issubdtype(configs.dtype, np.integer)
+        return bits_to_occ(configs, no)
+
+    if isinstance(configs, str): configs = [configs]
+
+    if isinstance(configs, (list, tuple)) and len(configs) > 0 \
+            and isinstance(configs[0], str):
+        if no is None: no = len(configs[0])
+        buf = ''.join(configs).encode('ascii')
+        assert len(buf) == no*len(configs)
+        occ = np.frombuffer(buf, dtype=np.uint8).reshape(len(configs), no) - ord('0')
+        assert occ.max(initial=0) <= 1
+        return occ
+
+    configs = np.asarray(configs)
+    assert configs.ndim == 2, 'packed bitstrings need packed=True'
+    if no is not None: assert configs.shape[1] == no
+    occ = configs.astype(np.uint8, copy=False)
+    assert occ.max(initial=0) <= 1
+    return occ
+
+def addressing_batch(configs, Z, no=None, chunk_size=2**16, packed=False):
+    """
+       addressing a batch of strings within single CAS-like graph,
+       vectorized counterpart of addressing_single_graph
+
+    Args:
+        configs: strings, occupation matrix or packed bitstrings,
+                 see occupation_matrix
+        Z: numpy 2d array, addressing array, None for zero electrons
+        no: int, number of orbitals, only needed when Z is None
+        chunk_size: int, number of strings processed at once
+        packed: boolean, configs are packed bitstrings
+
+    Returns:
+        addrs: numpy 1d array, addresses starting from 1,
+               with the integer type of Z
+    """
+    if Z is None:
+        assert no is not None
+        occ = occupation_matrix(configs, no, packed)
+        assert occ.sum() == 0
+        return np.ones(occ.shape[0], dtype=np.int64)
+
+    ne, no = Z.shape
+    if isinstance(configs, (str, list, tuple)):
+        configs = occupation_matrix(configs, no)
+    else:
+        # packed strings are unpacked chunk by chunk
+        configs = np.asarray(configs)
+
+    # leading zero row so that unoccupied orbitals pick up no weight
+    Zp = np.zeros(shape=(ne+1,no), dtype=Z.dtype)
+    Zp[1:] = Z
+    orbs = np.arange(no)
+
+    addrs = np.empty(configs.shape[0], dtype=Z.dtype)
+    for st in range(0, configs.shape[0], chunk_size):
+        occ_i = occupation_matrix(configs[st:st+chunk_size], no, packed)
+        ie = np.cumsum(occ_i, axis=1, dtype=np.int64)
+        assert (ie[:,-1] == ne).all()
+        addrs[st:st+chunk_size] = Zp[ie*occ_i, orbs].sum(axis=1) + 1
+
+    return addrs
+
 def de_addressing_array(Z):
     """Generate and return the deaddrssing array 
        for an addressing array 
     """
+    if Z is None: return None
     assert len(Z.shape) == 2
     
     if(Z.shape[0] == 1): return Z.copy()
     
-    Zd = np.zeros(Z.shape, dtype=np.int)
+    Zd = np.zeros(Z.shape, dtype=object)
     Zd[-1] = Z[-1]
     for i in range(-2,-Z.shape[0]-1,-1):
         Zd[i] = np.roll(Zd[i+1],-1)+Z[i]
 
-    return Zd     
+    return int_array(Zd.tolist())
 
 def de_addressing_single_graph(addr, Z, Zd=None):
     """
@@ -73,7 +190,7 @@ def de_addressing_single_graph(addr, Z, Zd=None):
     assert isinstance(addr,int) or isinstance(addr,np.int64)
     assert addr > 0 
     if Zd is None:
-        Zd = de_addressing_array(Z)
+        Zd = Zd_cache[Z.shape]
     else:
         assert Z.shape == Zd.shape
 
@@ -93,25 +210,118 @@ def de_addressing_single_graph(addr, Z, Zd=None):
     
     return "".join(config)
 
+def de_addressing_batch(addrs, Z, Zd=None, chunk_size=2**16, as_bits=False):
+    """
+        deaddressing a batch of addresses within single CAS-like graph,
+        vectorized counterpart of de_addressing_single_graph
 
+    Args:
+        addrs: 1d integer array, addresses starting from 1
+        Z: numpy 2d array, addressing array
+        Zd: numpy 2d array, deaddressing array of Z
+        chunk_size: int, number of addresses processed at once
+        as_bits: boolean, return packed bitstrings instead
 
+    Returns:
+        occ: numpy 2d uint8 array with shape (n_addrs, no), or
+             uint64 array with shape (n_addrs, n_words) if as_bits
+    """
+    addrs = np.asarray(addrs, dtype=Z.dtype).ravel()
+    assert (addrs > 0).all()
+    if Zd is None:
+        Zd = Zd_cache[Z.shape]
+    else:
+        assert Z.shape == Zd.shape
 
-
-
-
-
-
-
-
-
-
-
-
-
-
-
-
-
-
-
-
+    ne, no = Z.shape
+    orbs = np.arange(no)
+    if as_bits:
+        out = np.zeros(shape=(addrs.shape[0],n_words(no)), dtype=np.uint64)
+    else:
+        out = np.zeros(shape=(addrs.shape[0],no), dtype=np.uint8)
+
+    for st in range(0, addrs.shape[0], chunk_size):
+        addr_p = addrs[st:st+chunk_size] - 1
+        io_prev = np.full(addr_p.shape[0], -1, dtype=np.int64)
+        rows = np.arange(addr_p.shape[0])
+        occ = np.zeros(shape=(addr_p.shape[0],no), dtype=np.uint8)
+
+        for ie in range(ne):
+            # the highest allowed orbital passing the threshold
+            # is the one picked by the sequential search
+            io_max = no - ne + ie
+            cond = (addr_p[:,None] >= Zd[ie][None,:]) \
+                 & (orbs[None,:] > io_prev[:,None]) & (orbs[None,:] <= io_max)
+            assert cond.any(axis=1).all()
+            io = no - 1 - np.argmax(cond[:,::-1], axis=1)
+
+            occ[rows,io] = 1
+            addr_p -= Z[ie][io]
+            io_prev = io
+
+        out[st:st+chunk_size] = occ_to_bits(occ) if as_bits else occ
+
+    return out
+
+def config_strings(occ):
+    """Convert a 2d occupation matrix to a list of strings of 0 and 1"""
+    occ = np.ascontiguousarray(occ, dtype=np.uint8)
+    no = occ.shape[1]
+    buf = (occ + ord('0')).tobytes().decode('ascii')
+    return [buf[i:i+no] for i in range(0, len(buf), no)]
+
+class ArrayCache(object):
+    """Bounded cache of arrays built on demand, with LRU eviction
+
+    Attributes:
+        builder: callable, builds the value of a missing key
+        maxsize: int, maximal number of cached entries, None for unbounded
+        hits: int, number of lookups served from the cache
+        misses: int, number of lookups that called the builder
+    """
+    def __init__(self, builder, maxsize=512):
+        self.builder = builder
+        self.maxsize = maxsize
+        self.hits    = 0
+        self.misses  = 0
+        self._data   = OrderedDict()
+
+    def __getitem__(self, key):
+        if key in self._data:
+            self.hits += 1
+            self._data.move_to_end(key)
+            return self._data[key]
+
+        self.misses += 1
+        value = self.builder(key)
+        # shared between engines, make sure nobody modifies it
+        if isinstance(value, np.ndarray): value.setflags(write=False)
+
+        self._data[key] = value
+        if self.maxsize is not None and len(self._data) > self.maxsize:
+            self._data.popitem(last=False)
+
+        return value
+
+    def __contains__(self, key):
+        return key in self._data
+
+    def __len__(self):
+        return len(self._data)
+
+    def values(self):
+        return list(self._data.values())
+
+    def clear(self):
+        self._data.clear()
+        self.hits   = 0
+        self.misses = 0
+
+    def info(self):
+        return {'hits':self.hits, 'misses':self.misses,
+                'size':len(self._data), 'maxsize':self.maxsize}
+
+# process-wide addressing and deaddressing arrays,
+# key: (number of electron, number of orbitals)
+Z_cache  = ArrayCache(lambda key: addressing_array(*key))
+Zd_cache = ArrayCache(lambda key: de_addressing_array(Z_cache[key]))
@@ -3,13 +3,45 @@
   based on generalized active spce (GAS) concept
 """
 import numpy as np
-from utils import compute_NConf_GHF_GAS_Cat
+from utils import compute_NConf_GHF_GAS_Cat, enumerate_GAS_categories, hf_category
+from category_graph import CategoryLookup, CategoryGraph1e, CategoryGraph2e, \
+                           category_order
+from addressing import Z_cache, Zd_cache, addressing_batch, de_addressing_batch, \
+                       occupation_matrix
+
+class _Cats(dict):
+    """Cats of an UCIEngine, graph_2e is built on first access, as it is
+       only needed by the estimates and costs of whole H blocks
+
+    Attributes:
+        NOs: list of int, number of orbitals in each space
+        cat_lookup: CategoryLookup of the categories
+    """
+    def __init__(self, NOs, cat_lookup=None):
+        super().__init__()
+        self.NOs = NOs
+        self.cat_lookup = cat_lookup
+
+    def __missing__(self, key):
+        if key != 'graph_2e': raise KeyError(key)
+        self[key] = CategoryGraph2e(self['NEs'], self.NOs, self['NCnfs'],
+                                    self.cat_lookup)
+        return self[key]
 
 class UCIEngine(object):
     """base class of Universal Configuration Interaction Engine
        Note this base class is GHF-like implementation. 
+
+       With GHF=False the orbitals are spatial (RHF or UHF) and the
+       configurations are pairs of alpha and beta strings. Each category
+       is a pair of an alpha and a beta string category, laid out in CI
+       vectors as an (NCnf_a, NCnf_b) block with beta running fastest,
+       see block. The strings of each spin are held by a GHF-like engine
+       (Alpha, Beta), so their addressing arrays, graphs and replacement
+       lists scale with the number of strings instead of configurations.
     
     Attributes:
+        GHF : boolean; spin orbitals, or alpha and beta strings if False
         NOs : list of int; number of orbitals in each space
         NO  : int; total number of orbials in each space
         NE  : int; total number of electrons in each space
@@ -23,14 +55,36 @@ class UCIEngine(object):
                                              in each category
                    NCnfs: list of int; number of configurations in each category
                    PSt : list of int; starting pointer of each category 
-                   graph_1e: adjacency list; graph representation of 1e interactions  
-
-        Z_cache: dict with keys as (int,int) and values as np.matrix; 
-                 Addressing array cache
+                   PSt_canonical: list of int; starting pointer of each category
+                                  in the canonical layout, see cat_order
+                   graph_1e: CategoryGraph1e; graph representation of 1e interactions
+                             in CSR form, graph_1e[i][j] gives the moves from i to j
+                   graph_2e: CategoryGraph2e; category pairs coupled by up to two
+                             electron moves, with the moved spaces and an estimated
+                             block cost of each pair, built on first access
+        cat_lookup: CategoryLookup; category index of occupation vectors
+        cat_order: numpy 1d int array; category i is category cat_order[i] of
+                   the canonical order, the given categories without redundant
+                   and invalid ones
+        cat_rank: numpy 1d int array; inverse of cat_order
+
+        if not GHF:
+        NE_a, NE_b: int; number of alpha and beta electrons
+        Alpha, Beta: UCIEngine; GHF-like engines of the alpha and beta strings,
+                     the same engine if both have the same string categories
+        Cats: keys as above except the graphs and
+                   NEs: total (alpha plus beta) occupation of each category
+                   cat_a, cat_b: list of int; alpha and beta string category
+                                 of each category
+        pair_index: numpy 2d int array; category of a pair of alpha and
+                    beta string categories, -1 if absent
+
+        Z_cache: ArrayCache with keys as (int,int) and values as np.array; 
+                 Addressing array cache, shared by all engines
                  key: (number of electron, number of orbitals)
                  values: addressing array
-        Zd_cache: dict with keys as (int,int) and values as np.matrix; 
-                  Addressing array cache
+        Zd_cache: ArrayCache with keys as (int,int) and values as np.array; 
+                  Addressing array cache, shared by all engines
                   key: (number of electron, number of orbitals)
                   values: deaddressing array
 
@@ -56,7 +110,7 @@ class UCIEngine(object):
                   Additional Args: 
                      Cats_occ: list of list of int, electrons occupancy in each space
 
-            GAS Specificaiton: [TODO]
+            GAS Specificaiton:
                   Additional Args: default is equivalent to FCI in defined space
                              Cat_ref:  list of int, electron occupancy in reference categries, 
                                        default as HF
@@ -68,6 +122,8 @@ class UCIEngine(object):
                                        'Q' -- all possible quadruple excitation
                                        
                                        or list of tuples, explicit excitations between space
+                                       (x_from, x_to) or (x_from, x_to, max_n), 
+                                       see utils.enumerate_GAS_categories
 
                       Occ_restriction: list of tuples, min and max occupation in each space
                                        default as all possible occupation
@@ -75,8 +131,24 @@ class UCIEngine(object):
             Configurations: explicit configurations, automatic vectroiziation [TODO]
                   Additional Args: 
                      Configs: list of strings as  explicit configurations    
+
+            Additional Args of all initializations:
+                     Cat_order: str, layout of the categories in CI vectors,
+                                see category_graph.category_order
+                                'input' (default) -- as given
+                                'excitation' -- by excitation level from Cat_ref
+                                'rcm' -- reverse Cuthill-McKee of graph_1e
+                     GHF: boolean, default True, if False NOs are spatial orbitals,
+                          occupations (Cats_occ, Cat_ref, Occ_restriction) count
+                          alpha plus beta electrons and Cat_order is 'input'
+                     NE_a: int, number of alpha electrons if not GHF,
+                           default as (NE+1)//2
                    
         """
+        self.Z_cache  = Z_cache
+        self.Zd_cache = Zd_cache
+        self.GHF = kwargs.get('GHF', True)
+
         if init_by is None: return
 
         if init_by in ['Categories','categroies','Cat','cat']:
@@ -90,84 +162,373 @@ class UCIEngine(object):
             self.NO   = sum(NOs)
             self.NE   = NE
             self.NGAS = len(NOs)
+            nos_occ   = NOs if self.GHF else [2*no for no in NOs]
 
-            assert self.NO > self.NE
+            assert sum(nos_occ) >= self.NE
             
             for i in range(len(NEs)):    
                 assert len(NEs[i]) == len(NOs)
                 assert sum(NEs[i]) == NE
         
+        elif init_by in ['GAS Specification', 'GAS Specificaiton', 'GAS', 'gas']:
+
+            assert NOs is not None
+            assert NE is not None
+
+            self.NOs  = NOs
+            self.NO   = sum(NOs)
+            self.NE   = NE
+            self.NGAS = len(NOs)
+            nos_occ   = NOs if self.GHF else [2*no for no in NOs]
+
+            assert sum(nos_occ) >= self.NE
+
+            NEs = enumerate_GAS_categories(nos_occ, NE,
+                      kwargs.get('Cat_ref'), kwargs.get('GAS_excitations', 'F'),
+                      kwargs.get('Occ_restriction'))
+            assert len(NEs) > 0
+
         else:
             raise TypeError('Wrong initialization method')
         
         
         # init categories
 
-        self._init_categories(NEs)
+        if not self.GHF:
+            assert kwargs.get('Cat_order', 'input') == 'input'
+            self._init_restricted_categories(NEs, kwargs.get('NE_a'))
+            return
+
+        cat_ref = kwargs.get('Cat_ref')
+        if cat_ref is None: cat_ref = hf_category(self.NOs, self.NE)
+        self._init_categories(NEs, kwargs.get('Cat_order', 'input'), cat_ref)
 
         return 
         
-    def _init_categories(self,NEs):
+    def __getstate__(self):
+        # the addressing caches are process-wide, do not copy them
+        state = self.__dict__.copy()
+        state.pop('Z_cache', None)
+        state.pop('Zd_cache', None)
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self.Z_cache  = Z_cache
+        self.Zd_cache = Zd_cache
+
+    def _init_categories(self, NEs, order='input', cat_ref=None):
         """ calculate information of catergories, 
-            Note that assuming there is no redundency in NEs"""
-        self.Cats = {}
-        #TODO: add some sorting for categories
+            redundant and invalid categories in NEs are skipped,
+            the rest is laid out by order, see category_graph.category_order"""
+        self.Cats = _Cats(self.NOs)
         self.Cats['NEs']      = []
         self.Cats['NCnfs']    = []
         self.Cats['PSt']      = []
         
-        PSt = 0
+        seen = set()
         for i in range(len(NEs)):
-            if NEs[i] in self.Cats['NEs']:
+            if tuple(NEs[i]) in seen:
                 print('Warning! The %s_th cat is redundant' %i)
                 continue
 
-            for j in range(self.NGAS):
-                if NEs[i][j] > self.NOs[j]:
-                    print('Warning! The %s_th cat is not valid' %i)
-                break
+            if any(NEs[i][j] > self.NOs[j] or NEs[i][j] < 0
+                   for j in range(self.NGAS)):
+                print('Warning! The %s_th cat is not valid' %i)
+                continue
 
-            self.Cats['NEs'].append(NEs[i])
+            seen.add(tuple(NEs[i]))
+            self.Cats['NEs'].append(list(NEs[i]))
             self.Cats['NCnfs'].append(compute_NConf_GHF_GAS_Cat(self.NOs,NEs[i]))
-            self.Cats['PSt'].append(PSt)
-            PSt += self.Cats['NCnfs'][-1]
-        
+
         self.NCnf = sum(self.Cats['NCnfs'])
         self.NCat = len(self.Cats['NCnfs'])
+        self.Cats['PSt_canonical'] = np.cumsum([0] + self.Cats['NCnfs'][:-1]).tolist()
 
         # generate 1e interaction graph
-        graph_1e = {}
-        valid_NEs = np.array(self.Cats['NEs'])
-        for i in range(self.NCat):
-            graph_1e[i] = {i:[]}
-            for x in range(self.NGAS):
-                if(valid_NEs[i][x] != 0): 
-                    graph_1e[i][i].append((x,x))
-        
-        for i in range(self.NCat):     
-            for j in range(i+1,self.NCat):
-                Ex_level = valid_NEs[j] - valid_NEs[i]
-                if sum(abs(Ex_level)) == 2:
-                    x_gain = np.argwhere(Ex_level== 1)[0][0] 
-                    x_lose = np.argwhere(Ex_level== -1)[0][0]
-
-                    graph_1e[i][j] = (x_lose, x_gain)
-                    graph_1e[j][i] = (x_gain, x_lose)
-
-        self.Cats['graph_1e'] = graph_1e
-
-        return 
-
-
-
-
+        self.cat_lookup = CategoryLookup(self.Cats['NEs'], self.NOs)
+        self.Cats['graph_1e'] = CategoryGraph1e(self.Cats['NEs'], self.NOs,
+                                                self.cat_lookup)
+
+        # reorder categories, the graph is rebuilt for the new indices
+        self.cat_order = category_order(self.Cats['NEs'], order, cat_ref,
+                                        self.Cats['graph_1e'])
+        self.cat_rank  = np.argsort(self.cat_order)
+        if (self.cat_order != np.arange(self.NCat)).any():
+            for key in ['NEs', 'NCnfs']:
+                self.Cats[key] = [self.Cats[key][i] for i in self.cat_order]
+            self.cat_lookup = CategoryLookup(self.Cats['NEs'], self.NOs)
+            self.Cats['graph_1e'] = CategoryGraph1e(self.Cats['NEs'], self.NOs,
+                                                    self.cat_lookup)
+        self.Cats['PSt'] = np.cumsum([0] + self.Cats['NCnfs'][:-1]).tolist()
+
+        # the 2e interaction graph is built on first access of Cats['graph_2e']
+        self.Cats.cat_lookup = self.cat_lookup
+
+        return
+
+    def _init_restricted_categories(self, NEs, NE_a=None):
+        """ alpha and beta string categories of each occupation in NEs and
+            their pairs, redundant and invalid occupations are skipped"""
+        if NE_a is None: NE_a = (self.NE+1)//2
+        self.NE_a = NE_a
+        self.NE_b = self.NE - NE_a
+        if not 0 <= self.NE_b <= NE_a <= self.NO:
+            raise ValueError('%i alpha and %i beta electrons in %i orbitals, '
+                             'need 0 <= NE_b <= NE_a <= NO' %(NE_a, self.NE_b, self.NO))
+
+        pairs = []
+        seen = set()
+        for i in range(len(NEs)):
+            if tuple(NEs[i]) in seen:
+                print('Warning! The %s_th cat is redundant' %i)
+                continue
 
+            if any(NEs[i][j] > 2*self.NOs[j] or NEs[i][j] < 0
+                   for j in range(self.NGAS)):
+                print('Warning! The %s_th cat is not valid' %i)
+                continue
 
+            seen.add(tuple(NEs[i]))
+            # all distributions of the electrons of each space over the spins
+            occ_a = [(max(0, NEs[i][x] - self.NOs[x]), min(NEs[i][x], self.NOs[x]))
+                     for x in range(self.NGAS)]
+            for NEs_a in enumerate_GAS_categories(self.NOs, NE_a, occ_restriction=occ_a):
+                pairs.append((NEs_a, [NEs[i][x] - NEs_a[x] for x in range(self.NGAS)]))
+
+        def string_engine(cats, NE_s):
+            cats = list(dict.fromkeys(tuple(c) for c in cats))
+            return UCIEngine(self.NOs, NE_s, 'Categories', Cats_occ=[list(c) for c in cats])
+        self.Alpha = string_engine([p[0] for p in pairs], self.NE_a)
+        beta_cats  = list(dict.fromkeys(tuple(p[1]) for p in pairs))
+        if beta_cats == [tuple(c) for c in self.Alpha.Cats['NEs']]:
+            self.Beta = self.Alpha
+        else:
+            self.Beta = string_engine(beta_cats, self.NE_b)
+
+        self.Cats = {'NEs':[], 'cat_a':[], 'cat_b':[], 'NCnfs':[]}
+        cat_a = self.Alpha.cat_lookup([p[0] for p in pairs])
+        cat_b = self.Beta.cat_lookup([p[1] for p in pairs])
+        self.pair_index = -np.ones(shape=(self.Alpha.NCat, self.Beta.NCat), dtype=np.int64)
+        for (NEs_a, NEs_b), I_a, I_b in zip(pairs, cat_a.tolist(), cat_b.tolist()):
+            self.pair_index[I_a, I_b] = len(self.Cats['NCnfs'])
+            self.Cats['NEs'].append([NEs_a[x] + NEs_b[x] for x in range(self.NGAS)])
+            self.Cats['cat_a'].append(I_a)
+            self.Cats['cat_b'].append(I_b)
+            self.Cats['NCnfs'].append(self.Alpha.Cats['NCnfs'][I_a]*
+                                      self.Beta.Cats['NCnfs'][I_b])
 
+        self.NCnf = sum(self.Cats['NCnfs'])
+        self.NCat = len(self.Cats['NCnfs'])
+        self.Cats['PSt'] = np.cumsum([0] + self.Cats['NCnfs'][:-1]).tolist()
+        self.Cats['PSt_canonical'] = self.Cats['PSt']
+        self.cat_order = np.arange(self.NCat)
+        self.cat_rank  = np.arange(self.NCat)
+
+        return
+
+    def block(self, C, I):
+        """ view of category I of CI vectors C (..., NCnf), shaped as
+            (..., NCnf_a, NCnf_b) if not GHF """
+        st, n = self.Cats['PSt'][I], self.Cats['NCnfs'][I]
+        C_I = C[...,st:st+n]
+        if self.GHF: return C_I
+        return C_I.reshape(C.shape[:-1] + (n // self.Beta.Cats['NCnfs'][self.Cats['cat_b'][I]], -1))
+
+    def config_index(self, configs, packed=False):
+        """ positions of configurations in CI vectors, starting from 0
+
+        Args:
+            configs: strings, occupation matrix or packed bitstrings, see
+                     occupation_matrix, of 2*NO orbitals as alpha and beta
+                     strings if not GHF
+            packed: boolean, configs are packed bitstrings
+
+        Returns:
+            numpy 1d int64 array
+        """
+        PSt = np.asarray(self.Cats['PSt'], dtype=np.int64)
+        if self.GHF:
+            cats, addrs = self._string_index(occupation_matrix(configs, self.NO, packed))
+            return PSt[cats] + addrs
+
+        occ = occupation_matrix(configs, 2*self.NO, packed)
+        cat_a, addr_a = self.Alpha._string_index(occ[:,:self.NO])
+        cat_b, addr_b = self.Beta._string_index(occ[:,self.NO:])
+        I = self.pair_index[cat_a, cat_b]
+        assert (I >= 0).all(), 'configurations out of the CI space'
+        NCnfs_b = np.asarray(self.Beta.Cats['NCnfs'], dtype=np.int64)
+        return PSt[I] + addr_a*NCnfs_b[cat_b] + addr_b
+
+    def config_strings(self, idx):
+        """ occupation matrix of positions in CI vectors, inverse of
+            config_index """
+        idx = np.asarray(idx, dtype=np.int64).ravel()
+        PSt = np.asarray(self.Cats['PSt'], dtype=np.int64)
+        I = np.searchsorted(PSt, idx, side='right') - 1
+        local = idx - PSt[I]
+
+        if self.GHF:
+            occ = np.zeros(shape=(idx.shape[0], self.NO), dtype=np.uint8)
+            for J in np.unique(I).tolist():
+                sel = I == J
+                occ[sel] = self.cat_de_addressing(local[sel] + 1, self.Cats['NEs'][J])
+            return occ
+
+        cat_a = np.asarray(self.Cats['cat_a'], dtype=np.int64)[I]
+        cat_b = np.asarray(self.Cats['cat_b'], dtype=np.int64)[I]
+        addr_a, addr_b = np.divmod(local, np.asarray(self.Beta.Cats['NCnfs'], dtype=np.int64)[cat_b])
+        return np.hstack([
+            self.Alpha.config_strings(np.asarray(self.Alpha.Cats['PSt'], dtype=np.int64)[cat_a] + addr_a),
+            self.Beta.config_strings(np.asarray(self.Beta.Cats['PSt'], dtype=np.int64)[cat_b] + addr_b)])
+
+    def _string_index(self, occ):
+        """ categories and addresses inside them, starting from 0,
+            of an occupation matrix """
+        bounds = np.cumsum([0] + list(self.NOs))
+        counts = np.stack([occ[:,bounds[x]:bounds[x+1]].sum(axis=1)
+                           for x in range(self.NGAS)], axis=1)
+        cats = self.cat_lookup(counts)
+        assert (cats >= 0).all(), 'configurations out of the CI space'
+
+        addrs = np.empty(occ.shape[0], dtype=np.int64)
+        for I in np.unique(cats).tolist():
+            sel = cats == I
+            addrs[sel] = self.cat_addressing(occ[sel], self.Cats['NEs'][I]) - 1
+        return cats, addrs
+
+    def to_canonical(self, C):
+        """ CI vectors in the canonical layout
+
+        Args:
+            C: numpy array (..., NCnf), laid out by Cats['PSt']
+
+        Returns:
+            numpy array (..., NCnf), laid out by Cats['PSt_canonical']
+        """
+        out = np.empty_like(C)
+        for I in range(self.NCat):
+            st, n = self.Cats['PSt'][I], self.Cats['NCnfs'][I]
+            st_c  = self.Cats['PSt_canonical'][self.cat_order[I]]
+            out[...,st_c:st_c+n] = C[...,st:st+n]
+        return out
+
+    def from_canonical(self, C):
+        """ CI vectors laid out by Cats['PSt'], inverse of to_canonical """
+        out = np.empty_like(C)
+        for I in range(self.NCat):
+            st, n = self.Cats['PSt'][I], self.Cats['NCnfs'][I]
+            st_c  = self.Cats['PSt_canonical'][self.cat_order[I]]
+            out[...,st:st+n] = C[...,st_c:st_c+n]
+        return out
+
+    def canonical_index(self, idx, inverse=False):
+        """ positions of configurations in the canonical layout
+
+        Args:
+            idx: array like of int, positions in CI vectors starting from 0
+            inverse: boolean, map canonical positions to this layout instead
+
+        Returns:
+            numpy 1d int64 array
+        """
+        idx = np.asarray(idx, dtype=np.int64).ravel()
+        PSt   = np.asarray(self.Cats['PSt'], dtype=np.int64)
+        PSt_c = np.asarray(self.Cats['PSt_canonical'], dtype=np.int64)
+        if inverse:
+            c = np.searchsorted(PSt_c, idx, side='right') - 1
+            return PSt[self.cat_rank[c]] + idx - PSt_c[c]
+        I = np.searchsorted(PSt, idx, side='right') - 1
+        return PSt_c[self.cat_order[I]] + idx - PSt[I]
+
+    def cat_strides(self, NEs):
+        """ address strides of each space inside a category,
+            the first space runs fastest
+
+        Args:
+            NEs: list of int, number of electrons in each space
+
+        Returns:
+            strides: list of int
+        """
+        strides = [1]
+        for x in range(self.NGAS-1):
+            strides.append(strides[-1]*compute_NConf_GHF_GAS_Cat(
+                [self.NOs[x]], [NEs[x]]))
+        return strides
 
+    def cat_strings(self, NEs):
+        """ all strings of a category in the order of their addresses
 
+        Args:
+            NEs: list of int, number of electrons in each space,
+                 not required to be one of the categories in Cats
 
+        Returns:
+            occ: numpy 2d uint8 array with shape (NCnf of NEs, NO)
+        """
+        bounds  = np.cumsum([0] + list(self.NOs))
+        NCnf    = compute_NConf_GHF_GAS_Cat(self.NOs, NEs)
+        strides = self.cat_strides(NEs)
+        local   = np.arange(NCnf)
+
+        occ = np.zeros(shape=(NCnf, self.NO), dtype=np.uint8)
+        for x in range(self.NGAS):
+            if NEs[x] == 0: continue
+            n_x = compute_NConf_GHF_GAS_Cat([self.NOs[x]], [NEs[x]])
+            occ_x = de_addressing_batch(np.arange(1, n_x+1),
+                                        self.Z_cache[(NEs[x], self.NOs[x])],
+                                        self.Zd_cache[(NEs[x], self.NOs[x])])
+            occ[:,bounds[x]:bounds[x+1]] = occ_x[(local // strides[x]) % n_x]
+
+        return occ
+
+    def cat_de_addressing(self, addrs, NEs):
+        """ strings of addresses inside a category, inverse of cat_addressing
+
+        Args:
+            addrs: array like of int, addresses starting from 1
+            NEs: list of int, number of electrons in each space
+
+        Returns:
+            occ: numpy 2d uint8 array with shape (len(addrs), NO)
+        """
+        bounds  = np.cumsum([0] + list(self.NOs))
+        strides = self.cat_strides(NEs)
+        local   = np.asarray(addrs, dtype=np.int64).ravel() - 1
+
+        occ = np.zeros(shape=(local.shape[0], self.NO), dtype=np.uint8)
+        for x in range(self.NGAS):
+            if NEs[x] == 0: continue
+            n_x = compute_NConf_GHF_GAS_Cat([self.NOs[x]], [NEs[x]])
+            occ[:,bounds[x]:bounds[x+1]] = de_addressing_batch(
+                (local // strides[x]) % n_x + 1,
+                self.Z_cache[(NEs[x], self.NOs[x])],
+                self.Zd_cache[(NEs[x], self.NOs[x])])
+
+        return occ
+
+    def cat_addressing(self, configs, NEs, packed=False):
+        """ addresses of strings inside a category, starting from 1
+
+        Args:
+            configs: strings, occupation matrix or packed bitstrings,
+                     see occupation_matrix
+            NEs: list of int, number of electrons in each space
+            packed: boolean, configs are packed bitstrings
+
+        Returns:
+            addrs: numpy 1d int64 array
+        """
+        bounds  = np.cumsum([0] + list(self.NOs))
+        strides = self.cat_strides(NEs)
+        occ = occupation_matrix(configs, self.NO, packed)
 
+        addrs = np.ones(occ.shape[0], dtype=np.int64)
+        for x in range(self.NGAS):
+            if NEs[x] == 0: continue
+            addrs += (addressing_batch(occ[:,bounds[x]:bounds[x+1]],
+                      self.Z_cache[(NEs[x], self.NOs[x])]) - 1)*strides[x]
 
-        
+        return addrs
 
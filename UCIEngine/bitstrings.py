@@ -0,0 +1,117 @@
+"""
+  A module for packed integer representation of CI strings
+
+  A determinant of no orbitals is stored as a row of (no+63)//64
+  uint64 words, orbital io occupies bit io%64 of word io//64.
+  A batch of determinants is a 2d uint64 array (n_configs, n_words).
+"""
+
+import numpy as np
+
+WORD_BITS = 64
+
+if hasattr(np, 'bitwise_count'):
+    def _popcount_words(words):
+        return np.bitwise_count(words)
+else:
+    _POPCOUNT_TABLE = np.array([bin(i).count('1') for i in range(256)],
+                               dtype=np.uint8)
+
+    def _popcount_words(words):
+        words = np.ascontiguousarray(words, dtype='<u8')
+        counts = _POPCOUNT_TABLE[words.view(np.uint8)]
+        return counts.reshape(words.shape + (8,)).sum(axis=-1, dtype=np.uint8)
+
+def n_words(no):
+    """number of uint64 words needed to store no orbitals"""
+    return (no + WORD_BITS - 1) // WORD_BITS
+
+def as_words(bits):
+    """view a batch of packed strings as 2d array (n_configs, n_words),
+       1d arrays are taken as single word strings"""
+    bits = np.asarray(bits)
+    if bits.ndim == 1: bits = bits.reshape(-1,1)
+    assert bits.ndim == 2
+    return bits.astype(np.uint64, copy=False)
+
+def occ_to_bits(occ):
+    """Pack a 2d occupation matrix (n_configs, no) of 0 and 1
+       into uint64 words (n_configs, n_words)"""
+    occ = np.asarray(occ, dtype=np.uint8)
+    assert occ.ndim == 2
+    nc, no = occ.shape
+    nw = n_words(no)
+
+    padded = np.zeros(shape=(nc, nw*WORD_BITS), dtype=np.uint8)
+    padded[:,:no] = occ
+    packed = np.packbits(padded, axis=1, bitorder='little')
+    return packed.view('<u8').astype(np.uint64, copy=False)
+
+def bits_to_occ(bits, no):
+    """Unpack uint64 words (n_configs, n_words) into a 2d occupation
+       matrix (n_configs, no)"""
+    bits = np.ascontiguousarray(as_words(bits), dtype='<u8')
+    assert bits.shape[1] == n_words(no)
+    occ = np.unpackbits(bits.view(np.uint8), axis=1, bitorder='little')
+    return occ[:,:no]
+
+def strings_to_bits(configs):
+    """Pack a list of strings of 0 and 1 into uint64 words"""
+    if isinstance(configs, str): configs = [configs]
+    no = len(configs[0])
+    buf = ''.join(configs).encode('ascii')
+    assert len(buf) == no*len(configs)
+    occ = np.frombuffer(buf, dtype=np.uint8).reshape(len(configs), no) - ord('0')
+    assert occ.max(initial=0) <= 1
+    return occ_to_bits(occ)
+
+def bits_to_strings(bits, no):
+    """Unpack uint64 words into a list of strings of 0 and 1"""
+    occ = bits_to_occ(bits, no)
+    buf = (occ + ord('0')).tobytes().decode('ascii')
+    return [buf[i:i+no] for i in range(0, len(buf), no)]
+
+def orbital_mask(orbs, no):
+    """Bit mask (n_words,) with the given orbitals (0-based) set"""
+    occ = np.zeros(shape=(1,no), dtype=np.uint8)
+    occ[0,list(orbs)] = 1
+    return occ_to_bits(occ)[0]
+
+def space_masks(NOs):
+    """Bit masks (NGAS, n_words) of consecutive orbital spaces
+
+    Args:
+        NOs: list of int, number of orbitals in each space
+    """
+    no = sum(NOs)
+    bounds = np.cumsum([0] + list(NOs))
+    return np.array([orbital_mask(range(bounds[x], bounds[x+1]), no)
+                     for x in range(len(NOs))]).reshape(len(NOs), n_words(no))
+
+def popcount(bits):
+    """Number of occupied orbitals of each packed string"""
+    return _popcount_words(as_words(bits)).sum(axis=1, dtype=np.int64)
+
+def count_occ(bits, masks):
+    """Number of electrons of each packed string inside each mask
+
+    Args:
+        bits: uint64 words (n_configs, n_words)
+        masks: uint64 masks (n_masks, n_words), e.g. from space_masks
+
+    Returns:
+        numpy 2d int64 array (n_configs, n_masks)
+    """
+    bits = as_words(bits)
+    masks = as_words(masks)
+    occ = np.empty(shape=(bits.shape[0], masks.shape[0]), dtype=np.int64)
+    for x in range(masks.shape[0]):
+        occ[:,x] = _popcount_words(bits & masks[x]).sum(axis=1, dtype=np.int64)
+    return occ
+
+def excitation_level(bits_a, bits_b):
+    """Excitation level between packed strings with the same number of
+       electrons, 0 for identical strings, 1 for single excitations, ...
+       Broadcasts over the leading dimension."""
+    diff = as_words(bits_a) ^ as_words(bits_b)
+    return _popcount_words(diff).sum(axis=1, dtype=np.int64) // 2
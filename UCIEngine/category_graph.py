@@ -0,0 +1,369 @@
+"""
+  A module of inter-category interaction graphs of an UCIEngine
+  in compressed sparse row (CSR) form
+
+  Neighbors of a category are generated directly by moving electrons
+  between spaces and looked up through a hash of the occupation vectors,
+  the cost is linear in the number of categories.
+"""
+
+import numpy as np
+from collections.abc import Mapping
+
+class CategoryLookup(object):
+    """Index of occupation vectors, a perfect hash by mixed radix codes
+       when they fit into int64, a dict of tuples otherwise
+
+    Attributes:
+        NEs: numpy 2d int64 array (NCat, NGAS), occupation of each category
+        NOs: numpy 1d int64 array, number of orbitals in each space
+    """
+    def __init__(self, NEs, NOs):
+        self.NOs = np.asarray(NOs, dtype=np.int64)
+        self.NEs = np.asarray(NEs, dtype=np.int64).reshape(-1, self.NOs.shape[0])
+        self._occ_T = np.ascontiguousarray(self.NEs.T)
+
+        # code = sum_x NEs[x]*radix[x] with radix[x] = prod_{y<x} (NOs[y]+1)
+        radix = [1]
+        for no in self.NOs.tolist()[:-1]: radix.append(radix[-1]*(no+1))
+        if radix[-1]*(int(self.NOs[-1])+1) < 2**62:
+            self.radix = np.array(radix, dtype=np.int64)
+            self.codes = self.NEs @ self.radix
+            self.order = np.argsort(self.codes, kind='stable')
+            self._sorted = self.codes[self.order]
+            self._index = None
+        else:
+            self.radix = None
+            self.codes = None
+            self.order = np.arange(self.NEs.shape[0])
+            self._index = {tuple(occ): i for i, occ in enumerate(self.NEs.tolist())}
+
+    def _find_codes(self, codes, valid):
+        pos = np.minimum(np.searchsorted(self._sorted, codes), self._sorted.shape[0]-1)
+        found = valid & (self._sorted[pos] == codes)
+        return np.where(found, self.order[pos], -1)
+
+    def __call__(self, occ):
+        """ category indices of occupation vectors (n, NGAS),
+            -1 for vectors that are not a category """
+        occ = np.asarray(occ, dtype=np.int64).reshape(-1, self.NOs.shape[0])
+        valid = ((occ >= 0) & (occ <= self.NOs)).all(axis=1)
+
+        if self._index is not None:
+            return np.array([self._index.get(tuple(o), -1) if v else -1
+                             for o, v in zip(occ.tolist(), valid.tolist())],
+                            dtype=np.int64)
+
+        return self._find_codes(occ @ self.radix, valid)
+
+    def move(self, cats, lose, gain):
+        """ categories reached from cats by moving one electron out of
+            each space in lose and into each space in gain
+
+        Args:
+            cats: numpy 1d int array, category indices, queries are
+                  fastest in the order of self.order
+            lose: list of int, spaces losing an electron, may repeat
+            gain: list of int, spaces gaining an electron, may repeat
+
+        Returns:
+            numpy 1d int64 array, -1 where the result is not a category
+        """
+        delta = np.zeros(self.NOs.shape[0], dtype=np.int64)
+        np.add.at(delta, list(lose), -1)
+        np.add.at(delta, list(gain), 1)
+        cols = np.flatnonzero(delta)
+
+        if self._index is not None: return self(self.NEs[cats] + delta)
+
+        valid = np.ones(cats.shape[0], dtype=bool)
+        for x in cols.tolist():
+            moved = self._occ_T[x][cats] + delta[x]
+            valid &= (moved >= 0) & (moved <= self.NOs[x])
+        return self._find_codes(self.codes[cats] + delta @ self.radix, valid)
+
+def _csr(n, src, dst):
+    """ row pointer and order of edges sorted by source, then by target,
+        the diagonal edge (if any) first in its row """
+    key = src.astype(np.int64)*(2*n) + np.where(dst == src, -1, dst)
+    order = np.argsort(key)
+    indptr = np.zeros(n+1, dtype=np.int64)
+    np.cumsum(np.bincount(src, minlength=n), out=indptr[1:])
+    return indptr, order
+
+class _CategoryGraph(Mapping):
+    """CSR graph over categories, graph[I] is a read only mapping from
+       the neighbor categories J (I itself first, then ascending) to the
+       moves of the edge, see moves of the subclasses"""
+    _arrays = ('indptr', 'indices')
+
+    def row(self, I):
+        """ neighbor categories of I as a slice of indices """
+        return self.indices[self.indptr[I]:self.indptr[I+1]]
+
+    def _find(self, I, J):
+        """ position of edge (I, J) in indices, KeyError if absent """
+        st, en = self.indptr[I], self.indptr[I+1]
+        if st < en and self.indices[st] == J: return st
+        # the diagonal leads, the rest is sorted
+        k = st + 1 + np.searchsorted(self.indices[st+1:en], J)
+        if k >= en or self.indices[k] != J: raise KeyError(J)
+        return k
+
+    def nbytes(self):
+        return sum(getattr(self, name).nbytes for name in self._arrays)
+
+    def __getitem__(self, I):
+        if not 0 <= I < self.NCat: raise KeyError(I)
+        return _GraphRow(self, I)
+
+    def __iter__(self):
+        return iter(range(self.NCat))
+
+    def __len__(self):
+        return self.NCat
+
+class CategoryGraph1e(_CategoryGraph):
+    """One electron inter-category graph in CSR form
+
+       graph[I] is a read only mapping from the neighbor categories J
+       (I itself first, then in ascending order) to the moves as in the
+       former dict of dicts:
+           graph[I][J] = (x_lose, x_gain) for I != J
+           graph[I][I] = [(x, x) for each space x with electrons]
+
+    Attributes:
+        NCat: int, number of categories
+        indptr: numpy 1d int64 array (NCat+1,), row pointers
+        indices: numpy 1d int32 array, neighbor categories
+        x_lose: numpy 1d int16 array, space losing the electron, -1 on
+                the diagonal
+        x_gain: numpy 1d int16 array, space gaining the electron, -1 on
+                the diagonal
+        NEs: numpy 2d int64 array (NCat, NGAS)
+    """
+    _arrays = ('indptr', 'indices', 'x_lose', 'x_gain')
+
+    def __init__(self, NEs, NOs, lookup=None):
+        """
+        Args:
+            NEs: list of list of int, occupation of each category
+            NOs: list of int, number of orbitals in each space
+            lookup: CategoryLookup of NEs, built if None
+        """
+        if lookup is None: lookup = CategoryLookup(NEs, NOs)
+        self.NEs  = lookup.NEs
+        self.NCat, NGAS = self.NEs.shape
+        cats = np.arange(self.NCat)
+
+        src, dst, xl, xg = [cats], [cats], [np.full(self.NCat, -1)], [np.full(self.NCat, -1)]
+        cats = lookup.order
+        for x_lose in range(NGAS):
+            for x_gain in range(NGAS):
+                if x_lose == x_gain: continue
+                J = lookup.move(cats, [x_lose], [x_gain])
+                sel = J >= 0
+                src.append(cats[sel])
+                dst.append(J[sel])
+                xl.append(np.full(sel.sum(), x_lose))
+                xg.append(np.full(sel.sum(), x_gain))
+
+        src, dst = np.concatenate(src), np.concatenate(dst)
+        self.indptr, order = _csr(self.NCat, src, dst)
+        self.indices = dst[order].astype(np.int32)
+        self.x_lose  = np.concatenate(xl)[order].astype(np.int16)
+        self.x_gain  = np.concatenate(xg)[order].astype(np.int16)
+
+        return
+
+    def edges(self):
+        """ all edges as arrays (src, dst, x_lose, x_gain) """
+        src = np.repeat(np.arange(self.NCat), np.diff(self.indptr))
+        return src, self.indices, self.x_lose, self.x_gain
+
+    def moves(self, I, J):
+        """ list of (x_lose, x_gain) from category I to J """
+        if I == J:
+            return [(x, x) for x in np.flatnonzero(self.NEs[I]).tolist()]
+        k = self._find(I, J)
+        return (int(self.x_lose[k]), int(self.x_gain[k]))
+
+class CategoryGraph2e(_CategoryGraph):
+    """Two electron inter-category graph in CSR form, all category pairs
+       coupled by up to two electron moves
+
+       Each edge (I, J) stores the spaces of the moves as
+       (x_lose1, x_lose2, x_gain1, x_gain2) with x_lose1 <= x_lose2 and
+       x_gain1 <= x_gain2, unused entries are -1:
+           level 2: all four spaces
+           level 1: (x_lose, -1, x_gain, -1), the other electron is
+                    replaced inside any space
+           level 0: (-1, -1, -1, -1), I == J
+       graph[I][J] gives this tuple.
+
+       The cost of an edge estimates the nonzero elements of the H block
+       (I, J): NCnfs[I] times the number of strings of J reached from one
+       string of I, counted from the electrons and holes of the spaces
+       involved.
+
+    Attributes:
+        NCat: int, number of categories
+        indptr: numpy 1d int64 array (NCat+1,), row pointers
+        indices: numpy 1d int32 array, neighbor categories
+        level: numpy 1d int8 array, number of electrons moved between spaces
+        x_lose1, x_lose2, x_gain1, x_gain2: numpy 1d int16 arrays
+        cost: numpy 1d float64 array, estimated block cost
+    """
+    _arrays = ('indptr', 'indices', 'level', 'x_lose1', 'x_lose2',
+               'x_gain1', 'x_gain2', 'cost')
+
+    def __init__(self, NEs, NOs, NCnfs, lookup=None):
+        """
+        Args:
+            NEs: list of list of int, occupation of each category
+            NOs: list of int, number of orbitals in each space
+            NCnfs: list of int, number of configurations in each category
+            lookup: CategoryLookup of NEs, built if None
+        """
+        if lookup is None: lookup = CategoryLookup(NEs, NOs)
+        self.NEs = lookup.NEs
+        self.NCat, NGAS = self.NEs.shape
+        cats = np.arange(self.NCat)
+
+        # blocks of edges sharing the moved spaces
+        blocks = [(cats, cats, 0, (-1, -1, -1, -1))]
+
+        pairs = [(x, y) for x in range(NGAS) for y in range(x, NGAS)]
+        for l1, l2 in pairs:
+            # categories with electrons to lose in l1 and l2
+            rows = lookup.order
+            rows = rows[self.NEs[rows,l1] >= 1 + (l1 == l2)]
+            rows = rows[self.NEs[rows,l2] >= 1]
+            if rows.shape[0] == 0: continue
+
+            for g1, g2 in pairs:
+                if g1 in (l1, l2) or g2 in (l1, l2): continue
+                J = lookup.move(rows, [l1, l2], [g1, g2])
+                sel = J >= 0
+                if sel.any(): blocks.append((rows[sel], J[sel], 2, (l1, l2, g1, g2)))
+
+        for x_lose in range(NGAS):
+            for x_gain in range(NGAS):
+                if x_lose == x_gain: continue
+                J = lookup.move(lookup.order, [x_lose], [x_gain])
+                sel = J >= 0
+                blocks.append((lookup.order[sel], J[sel], 1, (x_lose, -1, x_gain, -1)))
+
+        counts = [b[0].shape[0] for b in blocks]
+        src = np.concatenate([b[0] for b in blocks])
+        dst = np.concatenate([b[1] for b in blocks])
+        level  = np.repeat(np.array([b[2] for b in blocks], dtype=np.int8), counts)
+        spaces = np.repeat(np.array([b[3] for b in blocks], dtype=np.int16), counts, axis=0)
+
+        self.indptr, order = _csr(self.NCat, src, dst)
+        self.indices = dst[order].astype(np.int32)
+        self.level   = level[order]
+        for i, name in enumerate(['x_lose1', 'x_lose2', 'x_gain1', 'x_gain2']):
+            setattr(self, name, spaces[order,i])
+        self.cost = self._estimate_cost(np.repeat(np.arange(self.NCat), np.diff(self.indptr)),
+                                        NOs, NCnfs)
+
+        return
+
+    def _estimate_cost(self, src, NOs, NCnfs):
+        elec  = self.NEs.astype(np.float64)
+        holes = np.asarray(NOs, dtype=np.float64) - elec
+        NCnfs = np.asarray([float(n) for n in NCnfs])
+
+        # replacements of one string inside its own spaces
+        n_intra = (elec*holes).sum(axis=1)[src]
+        e = lambda x: elec[src, np.maximum(x, 0)]
+        h = lambda x: holes[src, np.maximum(x, 0)]
+
+        l1, l2, g1, g2 = self.x_lose1, self.x_lose2, self.x_gain1, self.x_gain2
+        n_lose = np.where(l1 != l2, e(l1)*e(l2), e(l1)*(e(l1) - 1)/2)
+        n_gain = np.where(g1 != g2, h(g1)*h(g2), h(g1)*(h(g1) - 1)/2)
+
+        per_string = np.where(self.level == 2, n_lose*n_gain,
+                     np.where(self.level == 1, e(l1)*h(g1)*(1 + n_intra),
+                              1 + n_intra + 0.5*n_intra**2))
+        return NCnfs[src]*per_string
+
+    def edges(self):
+        """ all edges as arrays (src, dst, level, x_lose1, x_lose2,
+            x_gain1, x_gain2, cost) """
+        src = np.repeat(np.arange(self.NCat), np.diff(self.indptr))
+        return (src, self.indices, self.level, self.x_lose1, self.x_lose2,
+                self.x_gain1, self.x_gain2, self.cost)
+
+    def moves(self, I, J):
+        """ (x_lose1, x_lose2, x_gain1, x_gain2) from category I to J """
+        k = self._find(I, J)
+        return (int(self.x_lose1[k]), int(self.x_lose2[k]),
+                int(self.x_gain1[k]), int(self.x_gain2[k]))
+
+    def edge_cost(self, I, J):
+        """ estimated cost of block (I, J) """
+        return float(self.cost[self._find(I, J)])
+
+class _GraphRow(Mapping):
+    """neighbors of one category, see _CategoryGraph"""
+    def __init__(self, graph, I):
+        self.graph = graph
+        self.I = I
+
+    def __getitem__(self, J):
+        return self.graph.moves(self.I, J)
+
+    def __contains__(self, J):
+        try:
+            self.graph.moves(self.I, J)
+        except KeyError:
+            return False
+        return True
+
+    def __iter__(self):
+        return iter(self.graph.row(self.I).tolist())
+
+    def __len__(self):
+        return self.graph.row(self.I).shape[0]
+
+# orderings of category_order
+CAT_ORDERS = ('input', 'excitation', 'rcm')
+
+def category_order(NEs, method='input', cat_ref=None, graph=None):
+    """ permutation of categories for a block local layout of CI vectors
+
+    Args:
+        NEs: list of list of int, occupation of each category
+        method: str, one of CAT_ORDERS
+                'input'      -- keep the given order
+                'excitation' -- ascending number of electrons excited out
+                                of cat_ref, stable inside each level
+                'rcm'        -- reverse Cuthill-McKee of graph, couples
+                                categories close to each other to reduce
+                                the bandwidth of H, needs scipy
+        cat_ref: list of int, reference occupation of 'excitation'
+        graph: CategoryGraph1e of NEs, required by 'rcm'
+
+    Returns:
+        order: numpy 1d int64 array, the i-th category of the new order
+               is NEs[order[i]]
+    """
+    assert method in CAT_ORDERS, 'unknown category order %s' %method
+    NEs = np.asarray(NEs, dtype=np.int64)
+
+    if method == 'input':
+        return np.arange(NEs.shape[0])
+
+    if method == 'excitation':
+        assert cat_ref is not None
+        level = np.maximum(np.asarray(cat_ref) - NEs, 0).sum(axis=1)
+        return np.argsort(level, kind='stable')
+
+    from scipy.sparse import csr_matrix
+    from scipy.sparse.csgraph import reverse_cuthill_mckee
+    assert graph is not None
+    A = csr_matrix((np.ones(graph.indices.shape[0], dtype=np.int8),
+                    graph.indices, graph.indptr), shape=(graph.NCat, graph.NCat))
+    return reverse_cuthill_mckee(A, symmetric_mode=True).astype(np.int64)
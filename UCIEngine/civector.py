@@ -0,0 +1,251 @@
+"""
+  A module of CI vector containers laid out by the
+  categories of an UCIEngine
+"""
+
+import os
+import numpy as np
+from multiprocessing import shared_memory
+
+class SharedCIVector(object):
+    """One or several CI vectors in shared memory
+
+       Worker processes attach to the same memory by name, so vectors
+       are never pickled. The owner creates and unlinks the memory,
+       attached copies only close it.
+
+    Attributes:
+        name: str, name of the shared memory block
+        array: numpy 2d array (nvec, NCnf) backed by the shared memory
+        PSt: list of int, starting pointer of each category
+        NCnfs: list of int, number of configurations in each category
+        owner: boolean, whether this object created the memory
+    """
+    def __init__(self, PSt, NCnfs, nvec=1, dtype=np.float64, name=None):
+        """
+        Args:
+            PSt: list of int, Cats['PSt'] of an UCIEngine
+            NCnfs: list of int, Cats['NCnfs'] of an UCIEngine
+            nvec: int, number of vectors
+            dtype: numpy dtype of the vectors
+            name: str, attach to existing memory of this name,
+                  create new zero filled memory if None
+        """
+        self.PSt   = list(PSt)
+        self.NCnfs = list(NCnfs)
+        self.nvec  = nvec
+        self.dtype = np.dtype(dtype)
+        NCnf  = sum(self.NCnfs)
+        shape = (nvec, NCnf)
+        nbytes = max(int(np.prod(shape))*self.dtype.itemsize, 1)
+
+        self.owner = name is None
+        if self.owner:
+            self.shm = shared_memory.SharedMemory(create=True, size=nbytes)
+        else:
+            # the owner is responsible for unlinking, child processes
+            # share the resource tracker of the owner
+            try:
+                self.shm = shared_memory.SharedMemory(name=name, track=False)
+            except TypeError:
+                self.shm = shared_memory.SharedMemory(name=name)
+
+        self.name  = self.shm.name
+        self.array = np.ndarray(shape, dtype=self.dtype, buffer=self.shm.buf)
+        if self.owner: self.array[:] = 0
+
+        return
+
+    @classmethod
+    def from_engine(cls, CIEng, nvec=1, dtype=np.float64):
+        """new shared vectors laid out by the categories of CIEng"""
+        return cls(CIEng.Cats['PSt'], CIEng.Cats['NCnfs'], nvec, dtype)
+
+    def spec(self):
+        """picklable description to attach from another process"""
+        return {'PSt':self.PSt, 'NCnfs':self.NCnfs, 'nvec':self.nvec,
+                'dtype':self.dtype.str, 'name':self.name}
+
+    @classmethod
+    def attach(cls, spec):
+        """attach to shared vectors described by spec"""
+        return cls(spec['PSt'], spec['NCnfs'], spec['nvec'],
+                   spec['dtype'], spec['name'])
+
+    def vector(self, i=0):
+        """view of the i-th vector"""
+        return self.array[i]
+
+    def block(self, I, i=0):
+        """view of category I of the i-th vector"""
+        return self.array[i, self.PSt[I]:self.PSt[I]+self.NCnfs[I]]
+
+    def close(self):
+        """release the mapping of this process"""
+        if self.shm is None: return
+        self.array = None
+        self.shm.close()
+        if self.owner: self.shm.unlink()
+        self.shm = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def __getstate__(self):
+        raise TypeError('SharedCIVector is shared by name, pass spec() instead')
+
+class MemmapCIVectorStore(object):
+    """Disk backed CI vectors for subspaces larger than memory
+
+       Vectors are rows of numpy.memmap files in a directory, so each
+       category block is contiguous on disk and streaming over
+       Cats['PSt'] gives sequential I/O. The subspace vectors V and
+       their sigma vectors AV are kept in two slots of files, plus a
+       checkpoint of the iteration state for restart. Rewrites of the
+       whole subspace go to the inactive slot (see staging and switch),
+       so the slot named by the last checkpoint is never modified below
+       its saved number of vectors.
+
+       path/meta.npz          layout of the vectors
+       path/vectors.dat       memmap (nvec, NCnf), subspace vectors, slot 0
+       path/sigmas.dat        memmap (nvec, NCnf), sigma vectors, slot 0
+       path/vectors.1.dat     as above, slot 1
+       path/sigmas.1.dat      as above, slot 1
+       path/checkpoint.npz    last saved iteration state and its slot
+       path/ritz.dat          memmap (nroots, NCnf), see ritz
+
+    Attributes:
+        path: str, directory of the store
+        slot: int, 0 or 1, slot of V and AV
+        V: numpy.memmap (nvec, NCnf)
+        AV: numpy.memmap (nvec, NCnf)
+        PSt: list of int, starting pointer of each category
+        NCnfs: list of int, number of configurations in each category
+    """
+    def __init__(self, path, PSt, NCnfs, nvec, dtype=np.float64,
+                 restart=False, chunk_bytes=2**26):
+        """
+        Args:
+            path: str, directory of the store, created if missing
+            PSt: list of int, Cats['PSt'] of an UCIEngine
+            NCnfs: list of int, Cats['NCnfs'] of an UCIEngine
+            nvec: int, number of vectors of V and AV
+            dtype: numpy dtype of the vectors
+            restart: boolean, reopen existing files of the slot of the
+                     checkpoint instead of creating new zero filled ones
+            chunk_bytes: int, approximate size of a streamed chunk of
+                         one vector, see chunks
+        """
+        self.path  = path
+        self.PSt   = list(PSt)
+        self.NCnfs = list(NCnfs)
+        self.nvec  = nvec
+        self.dtype = np.dtype(dtype)
+        self.chunk_bytes = chunk_bytes
+        self.NCnf  = sum(self.NCnfs)
+        self.slot  = 0
+
+        os.makedirs(path, exist_ok=True)
+        meta_file = os.path.join(path, 'meta.npz')
+
+        if restart:
+            meta = np.load(meta_file)
+            assert list(meta['PSt']) == self.PSt
+            assert list(meta['NCnfs']) == self.NCnfs
+            assert int(meta['nvec']) == nvec
+            assert str(meta['dtype']) == self.dtype.str
+            ckpt = self.load_checkpoint()
+            if ckpt is not None and 'slot' in ckpt: self.slot = int(ckpt['slot'])
+            mode = 'r+'
+        else:
+            np.savez(meta_file, PSt=np.array(self.PSt, dtype=np.int64),
+                     NCnfs=np.array(self.NCnfs, dtype=np.int64),
+                     nvec=nvec, dtype=self.dtype.str)
+            mode = 'w+'
+
+        self.V, self.AV = self._open(self.slot, mode)
+
+        return
+
+    def _open(self, slot, mode):
+        suffix = '.dat' if slot == 0 else '.%i.dat' %slot
+        return [np.memmap(os.path.join(self.path, name + suffix), dtype=self.dtype,
+                          mode=mode, shape=(self.nvec, self.NCnf))
+                for name in ('vectors', 'sigmas')]
+
+    def staging(self):
+        """ V and AV of the inactive slot, to write a rotated subspace
+            without touching the checkpointed vectors """
+        return self._open(1 - self.slot, 'w+')
+
+    def switch(self):
+        """ make the inactive slot the active one, after writing it
+            through staging, the next save_checkpoint refers to it """
+        self.flush()
+        self.slot = 1 - self.slot
+        self.V, self.AV = self._open(self.slot, 'r+')
+
+    def ritz(self, nroots, dtype=None):
+        """ new memmap (nroots, NCnf) in path/ritz.dat for the Ritz
+            vectors returned by davidson """
+        return np.memmap(os.path.join(self.path, 'ritz.dat'),
+                         dtype=self.dtype if dtype is None else dtype,
+                         mode='w+', shape=(nroots, self.NCnf))
+
+    @classmethod
+    def from_engine(cls, CIEng, path, nvec, dtype=np.float64, **kwargs):
+        """store laid out by the categories of CIEng"""
+        return cls(path, CIEng.Cats['PSt'], CIEng.Cats['NCnfs'], nvec,
+                   dtype, **kwargs)
+
+    def chunks(self):
+        """ column slices made of whole consecutive categories,
+            each about chunk_bytes per vector """
+        chunks = []
+        st = 0
+        for I in range(len(self.NCnfs)):
+            en = self.PSt[I] + self.NCnfs[I]
+            if (en - st)*self.dtype.itemsize >= self.chunk_bytes:
+                chunks.append(slice(st, en))
+                st = en
+        if st < self.NCnf or len(chunks) == 0:
+            chunks.append(slice(st, self.NCnf))
+        return chunks
+
+    def block(self, I, i=0, sigma=False):
+        """view of category I of the i-th vector of V or AV"""
+        vecs = self.AV if sigma else self.V
+        return vecs[i, self.PSt[I]:self.PSt[I]+self.NCnfs[I]]
+
+    def iter_blocks(self, i=0, sigma=False):
+        """yield (I, block) of the i-th vector category by category"""
+        for I in range(len(self.NCnfs)):
+            yield I, self.block(I, i, sigma)
+
+    def dot(self, i, x, sigma=False):
+        """<V_i|x> or <AV_i|x> streamed chunk by chunk"""
+        vecs = self.AV if sigma else self.V
+        return sum(np.vdot(vecs[i, s], x[s]) for s in self.chunks())
+
+    def flush(self):
+        self.V.flush()
+        self.AV.flush()
+
+    def save_checkpoint(self, **state):
+        """flush the vectors and atomically save the iteration state
+           together with the active slot"""
+        self.flush()
+        ckpt = os.path.join(self.path, 'checkpoint.npz')
+        tmp  = os.path.join(self.path, 'checkpoint.tmp.npz')
+        np.savez(tmp, slot=self.slot, **state)
+        os.replace(tmp, ckpt)
+
+    def load_checkpoint(self):
+        """last saved iteration state, None if there is none"""
+        ckpt = os.path.join(self.path, 'checkpoint.npz')
+        if not os.path.exists(ckpt): return None
+        with np.load(ckpt) as data:
+            return {key:data[key] for key in data.files}
@@ -0,0 +1,241 @@
+"""
+  A module of the Davidson-Liu eigensolver for CI vectors
+  laid out by the categories of an UCIEngine
+"""
+
+import time
+import numpy as np
+
+def davidson(sigma_func, Hdiag, nroots=1, guess=None, max_vecs=None,
+             max_iter=100, e_tol=1e-8, r_tol=1e-5, verbose=True,
+             store=None, restart=False):
+    """Lowest eigenpairs of a Hermitian CI Hamiltonian with the
+       Davidson-Liu method and diagonal preconditioner
+
+    Args:
+        sigma_func: callable, sigma_func(C) returns H*C, e.g.
+                    SigmaEngine.sigma
+        Hdiag: numpy 1d array, diagonal of H, e.g. SigmaEngine.diagonal()
+        nroots: int, number of lowest roots
+        guess: numpy 2d array (n_guess, NCnf), initial vectors,
+               default as unit vectors on the lowest diagonal elements
+        max_vecs: int, maximal number of subspace vectors kept in memory,
+                  the subspace is collapsed onto the current and previous
+                  Ritz vectors when it is full, default as max(8*nroots, 20)
+        max_iter: int, maximal number of iterations
+        e_tol: float, convergence threshold of energy change of a root
+        r_tol: float, convergence threshold of residual norm of a root
+        verbose: boolean, print progress of each iteration
+        store: MemmapCIVectorStore, keep the subspace on disk instead of
+               in memory, max_vecs is then store.nvec, sigma_func has to
+               accept an out argument as SigmaEngine.sigma does and all
+               vector operations stream over store.chunks(), the Ritz
+               vectors and residuals are never held in full; the state and
+               the subspace matrix are checkpointed after each iteration
+        restart: boolean, resume from the checkpoint of store
+
+    Returns:
+        energies: numpy 1d array (nroots,)
+        vectors: numpy 2d array (nroots, NCnf), numpy.memmap of
+                 store.ritz if store is given
+        info: dict
+              converged: list of boolean per root
+              iterations: int, including those before a restart
+              history: list of dict per iteration with keys
+                       energies, residuals, nvecs, time
+    """
+    Hdiag = np.asarray(Hdiag)
+    NCnf = Hdiag.shape[0]
+    if store is not None: max_vecs = store.nvec
+    if max_vecs is None: max_vecs = max(8*nroots, 20)
+    assert nroots <= NCnf
+    assert max_vecs >= 3*nroots
+
+    if guess is None:
+        guess = np.zeros(shape=(nroots, NCnf))
+        guess[np.arange(nroots), np.argsort(Hdiag, kind='stable')[:nroots]] = 1.
+    guess = np.atleast_2d(guess)
+    dtype = np.result_type(guess, Hdiag)
+
+    # subspace vectors and their sigma vectors, bounded in memory
+    # or streamed from disk chunk by chunk, nothing else of length
+    # NCnf is held beyond a chunk
+    if store is None:
+        V  = np.zeros(shape=(max_vecs, NCnf), dtype=dtype)
+        AV = np.zeros(shape=(max_vecs, NCnf), dtype=dtype)
+        chunks = [slice(0, NCnf)]
+    else:
+        assert store.NCnf == NCnf
+        V, AV = store.V, store.AV
+        dtype = store.dtype
+        chunks = store.chunks()
+    nvec = 0
+
+    # Hsub[i,j] = <V_i|AV_j>, extended by the rows and columns of new vectors
+    Hsub = np.zeros(shape=(max_vecs, max_vecs), dtype=dtype)
+
+    def dots(A, B):
+        # A.conj() @ B.T chunk by chunk
+        return sum(A[:,s].conj() @ B[:,s].T for s in chunks)
+
+    def add_vectors(n_new, nvec):
+        # candidates are in the rows nvec to nvec+n_new-1
+        n0 = nvec
+        for k in range(n0, n0+n_new):
+            if k != nvec:
+                for s in chunks: V[nvec,s] = V[k,s]
+            for _ in range(2):
+                # twice is enough
+                ov = sum(V[:nvec,s].conj() @ V[nvec,s] for s in chunks)
+                for s in chunks: V[nvec,s] -= V[:nvec,s].T @ ov
+            norm = np.sqrt(sum(np.vdot(V[nvec,s], V[nvec,s]).real for s in chunks))
+            if norm < 1e-10: continue
+            for s in chunks: V[nvec,s] /= norm
+            if store is None:
+                AV[nvec] = sigma_func(V[nvec])
+            else:
+                AV[nvec] = 0
+                sigma_func(V[nvec], out=AV[nvec])
+            nvec += 1
+        if nvec > n0:
+            Hsub[n0:nvec,:nvec] = dots(V[n0:nvec], AV[:nvec])
+            Hsub[:n0,n0:nvec]   = dots(V[:n0], AV[n0:nvec])
+        return nvec
+
+    def ritz(nvec):
+        H = Hsub[:nvec,:nvec]
+        theta, c = np.linalg.eigh(0.5*(H + H.conj().T))
+        return theta[:nroots], c[:,:nroots]
+
+    energies  = np.zeros(nroots)
+    converged = [False]*nroots
+    c         = None
+    c_prev    = None
+    history   = []
+    it_start  = 0
+
+    ckpt = store.load_checkpoint() if (store is not None and restart) else None
+    if ckpt is not None:
+        nvec     = int(ckpt['nvec'])
+        energies = ckpt['energies']
+        it_start = int(ckpt['iteration'])
+        if ckpt['c_prev'].size > 0: c_prev = ckpt['c_prev']
+        if 'converged' in ckpt: converged = ckpt['converged'].tolist()
+        if 'Hsub' in ckpt:
+            Hsub[:nvec,:nvec] = ckpt['Hsub']
+        else:
+            Hsub[:nvec,:nvec] = dots(V[:nvec], AV[:nvec])
+    else:
+        for j, g in enumerate(guess[:max_vecs]): V[j] = g
+        nvec = add_vectors(min(guess.shape[0], max_vecs), nvec)
+
+    if verbose:
+        print('Davidson: %i roots, %i configurations, at most %i vectors'
+              %(nroots, NCnf, max_vecs))
+        if ckpt is not None:
+            print('Davidson: restart from iteration %i with %i vectors'
+                  %(it_start, nvec))
+
+    def save_checkpoint(iteration):
+        if store is None: return
+        store.save_checkpoint(nvec=nvec, energies=energies, iteration=iteration,
+            c_prev=np.zeros(shape=(0,0)) if c_prev is None else c_prev,
+            Hsub=Hsub[:nvec,:nvec], converged=np.array(converged))
+
+    n_iter = it_start
+    for it in range(it_start, max_iter):
+        if all(converged): break
+        t0 = time.time()
+
+        theta, c = ritz(nvec)
+
+        # residual norms of the Ritz vectors chunk by chunk
+        rnorm = np.zeros(nroots)
+        for s in chunks:
+            R = c.T @ AV[:nvec,s] - theta[:,None]*(c.T @ V[:nvec,s])
+            rnorm += (R.real**2 + R.imag**2).sum(axis=1)
+        rnorm = np.sqrt(rnorm)
+        de = np.abs(theta - energies)
+        energies = theta.copy()
+        converged = [bool(rnorm[i] < r_tol and de[i] < e_tol)
+                     for i in range(nroots)]
+        n_iter = it + 1
+
+        if all(converged):
+            history.append({'energies':energies.copy(), 'residuals':rnorm,
+                            'nvecs':nvec, 'time':time.time()-t0})
+            if verbose: _print_iteration(it, history[-1])
+            save_checkpoint(n_iter)
+            break
+
+        todo = [i for i in range(nroots) if not converged[i]]
+        if nvec + len(todo) > max_vecs:
+            # collapse onto the current and previous Ritz vectors,
+            # orthonormal coefficients give orthonormal vectors
+            keep = c
+            if c_prev is not None:
+                keep = np.zeros(shape=(nvec, 2*nroots), dtype=c.dtype)
+                keep[:,:nroots] = c
+                keep[:c_prev.shape[0],nroots:] = c_prev
+                keep, r = np.linalg.qr(keep)
+                keep = keep[:,np.abs(np.diag(r)) > 1e-8]
+            if store is None:
+                for s in chunks:
+                    V[:keep.shape[1],s]  = keep.T @ V[:nvec,s]
+                    AV[:keep.shape[1],s] = keep.T @ AV[:nvec,s]
+            else:
+                # the checkpoint still refers to V and AV, rotate into
+                # the other slot and switch to it
+                V_new, AV_new = store.staging()
+                for s in chunks:
+                    V_new[:keep.shape[1],s]  = keep.T @ V[:nvec,s]
+                    AV_new[:keep.shape[1],s] = keep.T @ AV[:nvec,s]
+                del V_new, AV_new
+                store.switch()
+                V, AV = store.V, store.AV
+            Hsub[:keep.shape[1],:keep.shape[1]] = keep.conj().T @ Hsub[:nvec,:nvec] @ keep
+            # the Ritz vectors in the collapsed basis
+            c = keep.conj().T @ c
+            nvec = keep.shape[1]
+            c_prev = None
+        else:
+            c_prev = c
+
+        # preconditioned corrections of unconverged roots, written
+        # chunk by chunk into the free rows
+        for s in chunks:
+            R = (c[:,todo].T @ AV[:nvec,s]
+                 - theta[todo,None]*(c[:,todo].T @ V[:nvec,s]))
+            denom = theta[todo,None] - Hdiag[None,s]
+            denom[np.abs(denom) < 1e-8] = 1e-8
+            V[nvec:nvec+len(todo),s] = R/denom
+
+        nvec_old = nvec
+        nvec = add_vectors(len(todo), nvec)
+
+        history.append({'energies':energies.copy(), 'residuals':rnorm,
+                        'nvecs':nvec, 'time':time.time()-t0})
+        if verbose: _print_iteration(it, history[-1])
+        save_checkpoint(n_iter)
+
+        if nvec == nvec_old:
+            if verbose: print('Davidson: subspace cannot be extended, stop')
+            break
+
+    # Ritz vectors of the last iteration, c spans a leading part of the
+    # subspace, or of the restored subspace if no iteration ran
+    if c is None: c = ritz(nvec)[1]
+    x_dtype = np.result_type(c, V.dtype)
+    X = np.empty(shape=(nroots, NCnf), dtype=x_dtype) if store is None \
+        else store.ritz(nroots, x_dtype)
+    for s in chunks: X[:,s] = c.T @ V[:c.shape[0],s]
+
+    info = {'converged':converged, 'iterations':n_iter,
+            'history':history}
+
+    return energies, X, info
+
+def _print_iteration(it, record):
+    print('  iter %3i  nvecs %3i  max|r| %.3E  time %8.3fs  E: %s'
+          %(it+1, record['nvecs'], record['residuals'].max(), record['time'],
+            ' '.join('%.10f' %e for e in record['energies'])))
@@ -1,9 +1,13 @@
 """
   a library of utility functions for analyzing Gaussian log file 
 """
-import numpy as np
-import pandas as pd
+import io
+import os
 import re
+import json
+import hashlib
+import mmap
+import numpy as np
 
 def match_full_line(pattern,line):
     return line == pattern 
@@ -14,9 +18,234 @@ def match_partial_line(pattern, line):
 def search_line_regex(pattern, line):
     return re.serach(pattern,line)
 
+class LogIndex(object):
+    """Byte offsets of header lines in a log file
+
+       The log is scanned once through mmap for the default partial line
+       headers and for the title line of every printed matrix, i.e. the
+       last non-empty line before a column number line '  1  2  3 ...'.
+       Keys asked for later are found by one more scan and added. The
+       index is saved as a json sidecar '<log>.idx' and reused as long as
+       the size and mtime of the log do not change.
+
+    Attributes:
+        filename: str
+        partial: dict, {header: list of byte offsets of lines starting
+                 with header}
+        full: dict, {line without newline: list of byte offsets}
+    """
+    version = 1
+    headers = [' State:', ' RAS(', ' CAS(']
+    _panel  = rb'[ \t]+1(?:[ \t]+\d+)*[ \t]*\r?$'
+
+    def __init__(self, filename, headers=None, use_sidecar=True):
+        """
+        Args:
+            filename: str, log file
+            headers: list of str, partial line headers indexed in the
+                     first pass, default as LogIndex.headers
+            use_sidecar: boolean, load and save '<filename>.idx'
+        """
+        self.filename = filename
+        self.sidecar  = filename + '.idx' if use_sidecar else None
+        stat = os.stat(filename)
+        self.size, self.mtime = stat.st_size, stat.st_mtime_ns
+        self.partial = {}
+        self.full = {}
+
+        if not self._load():
+            self._build(self.headers if headers is None else headers)
+            self._save()
+        elif headers is not None:
+            for header in headers: self.offsets(header)
+
+        return
+
+    def _read_sidecar(self):
+        if self.sidecar is None or not os.path.exists(self.sidecar):
+            return None
+        try:
+            with open(self.sidecar, 'r') as f: idx = json.load(f)
+        except ValueError:
+            return None
+        if (idx.get('version') != self.version or idx.get('size') != self.size
+            or idx.get('mtime') != self.mtime):
+            return None
+        return idx
+
+    def _load(self):
+        idx = self._read_sidecar()
+        if idx is None: return False
+        self.partial, self.full = idx['partial'], idx['full']
+        return True
+
+    def _save(self):
+        if self.sidecar is None: return
+        # keep keys added by other instances in the meantime
+        idx = self._read_sidecar()
+        if idx is not None:
+            for key, offs in idx['partial'].items(): self.partial.setdefault(key, offs)
+            for key, offs in idx['full'].items(): self.full.setdefault(key, offs)
+        idx = {'version':self.version, 'size':self.size, 'mtime':self.mtime,
+               'partial':self.partial, 'full':self.full}
+        try:
+            with open(self.sidecar, 'w') as f: json.dump(idx, f)
+        except OSError:
+            # read only location, the index lives in memory only
+            self.sidecar = None
+
+    def _scan(self, pattern):
+        """ match objects of a compiled bytes pattern over the mapped log """
+        if self.size == 0: return
+        with open(self.filename, 'rb') as f:
+            with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+                for m in pattern.finditer(mm):
+                    yield mm, m
+
+    def _build(self, headers):
+        groups = [b'(?P<h%i>' %i + re.escape(h.encode()) + b')'
+                  for i, h in enumerate(headers)]
+        pattern = re.compile(b'^(?:' + b'|'.join(groups + [b'(?P<panel>'
+                             + self._panel + b')']) + b')', re.M)
+
+        for h in headers: self.partial[h] = []
+        titles = {}
+        for mm, m in self._scan(pattern):
+            if m.lastgroup != 'panel':
+                self.partial[headers[int(m.lastgroup[1:])]].append(m.start())
+                continue
+            # title as the last non-empty line before the column numbers
+            end = m.start() - 1
+            while end > 0:
+                st = mm.rfind(b'\n', 0, end) + 1
+                line = mm[st:end].rstrip(b'\r')
+                if line.strip():
+                    if re.fullmatch(self._panel, line + b'\n') is None:
+                        titles.setdefault(line.decode(errors='replace'), set()).add(st)
+                    break
+                end = st - 1
+
+        self.full = {title: sorted(offs) for title, offs in titles.items()}
+
+    def offsets(self, key, full_line=False):
+        """ byte offsets of lines starting with key, or equal to key if
+            full_line, a trailing newline of key is ignored """
+        key = key.rstrip('\n')
+        table = self.full if full_line else self.partial
+        if key not in table:
+            tail = rb'\r?$' if full_line else b''
+            pattern = re.compile(b'^' + re.escape(key.encode()) + tail, re.M)
+            table[key] = [m.start() for mm, m in self._scan(pattern)]
+            self._save()
+        return table[key]
+
+    def first(self, key, full_line=False):
+        """ first byte offset of key, None if not present """
+        offs = self.offsets(key, full_line)
+        return offs[0] if len(offs) > 0 else None
+
+    def open_at(self, offset):
+        """ text file object positioned at a byte offset """
+        f = open(self.filename, 'rb')
+        f.seek(offset)
+        return io.TextIOWrapper(f)
+
+class ParseCache(object):
+    """Opt-in binary cache of parsed results next to a log file
+
+       Results are saved in '<log>.uci_cache/' as one .npy file per array
+       and a meta.json. Entries are dropped when the size or mtime of the
+       log changes, or when the version of the parser that wrote them
+       differs. Arrays are loaded with mmap_mode='r', pages are read only
+       when they are touched.
+
+    Attributes:
+        filename: str, log file
+        path: str, cache directory
+    """
+    def __init__(self, filename):
+        self.filename = filename
+        self.path = filename + '.uci_cache'
+        stat = os.stat(filename)
+        self.size, self.mtime = stat.st_size, stat.st_mtime_ns
+        self.meta = {'size':self.size, 'mtime':self.mtime, 'entries':{}}
+
+        meta_file = os.path.join(self.path, 'meta.json')
+        if os.path.exists(meta_file):
+            try:
+                with open(meta_file, 'r') as f: meta = json.load(f)
+            except ValueError:
+                meta = {}
+            if meta.get('size') == self.size and meta.get('mtime') == self.mtime:
+                self.meta = meta
+            else:
+                # the log changed, drop files of stale entries
+                for key, entry in meta.get('entries', {}).items():
+                    for name in entry['arrays']:
+                        try:
+                            os.remove(os.path.join(self.path, '%s.%s.npy' %(key, name)))
+                        except OSError:
+                            pass
+
+        return
+
+    @staticmethod
+    def key(*parts):
+        """ file name safe key of arbitrary strings """
+        return hashlib.sha1(repr(parts).encode()).hexdigest()[:20]
+
+    def load(self, key, version):
+        """
+        Returns:
+            arrays: dict of read only memory mapped arrays
+            info: dict, json data saved with the arrays
+            or None if the entry is missing or stale
+        """
+        entry = self.meta['entries'].get(key)
+        if entry is None or entry['version'] != version: return None
+        try:
+            arrays = {name: np.load(os.path.join(self.path, '%s.%s.npy' %(key, name)),
+                                    mmap_mode='r')
+                      for name in entry['arrays']}
+        except (OSError, ValueError):
+            return None
+        return arrays, entry['info']
+
+    def save(self, key, version, arrays, info=None):
+        """ save a dict of numpy arrays with json serializable info """
+        try:
+            os.makedirs(self.path, exist_ok=True)
+            for name, arr in arrays.items():
+                np.save(os.path.join(self.path, '%s.%s.npy' %(key, name)),
+                        np.ascontiguousarray(arr))
+            self.meta['entries'][key] = {'version':version, 'arrays':list(arrays.keys()),
+                                         'info':{} if info is None else info}
+            tmp = os.path.join(self.path, 'meta.json.tmp')
+            with open(tmp, 'w') as f: json.dump(self.meta, f)
+            os.replace(tmp, os.path.join(self.path, 'meta.json'))
+        except OSError:
+            # read only location, nothing is cached
+            pass
+
+def _open_indexed(filename, start_id, full_line, index):
+    """ open filename at the first line matching start_id through index,
+        None if start_id is not in the file """
+    if index is True: index = LogIndex(filename)
+    if full_line and not start_id.endswith('\n'):
+        # only an unterminated last line could match, read it all
+        return open(filename, 'r')
+    offset = index.first(start_id, full_line)
+    if offset is None: return None
+    return index.open_at(offset)
+
 def read_log_block(filename,start_id,end_id=None,match_method='full line',
-                   N_block=None,n_lines_per_block=None):
-    """simplied 'grep' in python"""
+                   N_block=None,n_lines_per_block=None,index=None):
+    """simplied 'grep' in python
+
+       With index as a LogIndex of filename (or True to build/load one),
+       reading starts at the first line matching start_id instead of the
+       beginning of the file. Only for full and partial line matching.
+    """
 
     if match_method in ['F', 'f', 'full line']:
         match_func = match_full_line
@@ -32,7 +261,11 @@ def read_log_block(filename,start_id,end_id=None,match_method='full line',
     if end_id is None and n_lines_per_block is None:
         n_lines_per_block = 1
     
-    f = open(filename,'r')
+    if index is not None and match_func in [match_full_line, match_partial_line]:
+        f = _open_indexed(filename, start_id, match_func is match_full_line, index)
+        if f is None: return []
+    else:
+        f = open(filename,'r')
     foundBlock = False
     blocks = []
     line_count = 0 if N_block is not None else None
@@ -60,6 +293,9 @@ def read_log_block(filename,start_id,end_id=None,match_method='full line',
     f.close()
     return blocks
 
+# numbers as 1.234-105 with the exponent letter dropped
+_MISSING_EXPONENT = re.compile(r'(?<=[0-9.])(?=[+-][0-9])')
+
 def gaustr_to_num(x,convert_func=float):
     if not isinstance(x, str): return x
     
@@ -70,12 +306,50 @@ def gaustr_to_num(x,convert_func=float):
     
     return convert_func(x)
 
-def read_matrix(filename, identifier, matrix_format='full'):
+def _fill_panel(nRow, nCol, rowIds, rowCounts, tokens):
+    """ the values of one printed panel of nCol columns as a (nRow, nCol)
+        array, missing entries stay nan """
+    # Fortran exponents fixed in bulk, then a single conversion
+    text = ' '.join(tokens).replace('D', 'E').replace('d', 'E')
+    text = _MISSING_EXPONENT.sub('E', text)
+    values = np.array(text.split(), dtype=np.float64)
+
+    rowCounts = np.array(rowCounts, dtype=np.int64)
+    rows = np.repeat(np.array(rowIds, dtype=np.int64), rowCounts)
+    lineStart = np.cumsum(rowCounts) - rowCounts
+    cols = np.arange(values.shape[0]) - np.repeat(lineStart, rowCounts)
+
+    panel = np.full((nRow, nCol), np.nan)
+    panel[rows, cols] = values
+    return panel
+
+# version of read_matrix results in ParseCache
+READ_MATRIX_VERSION = 1
+
+def read_matrix(filename, identifier, matrix_format='full', index=None,
+                cache=False):
     """
         Module to read a printed matrix from gaussian output log 
         file with a identifier line. Note that identifier must 
         be a complete line before a printed Matrix.
+
+        index: LogIndex of filename, or True to build/load one, reading
+               starts at the identifier line instead of the beginning
+        cache: boolean, keep the matrix in a ParseCache of filename and
+               return a read only memory mapped array when it is cached
     """
+    if cache and isinstance(filename, str):
+        pcache = ParseCache(filename)
+        key = ParseCache.key('read_matrix', identifier, matrix_format)
+        cached = pcache.load(key, READ_MATRIX_VERSION)
+        if cached is not None:
+            print(identifier+' has been obtained')
+            return cached[0]['matrix']
+
+        mat = read_matrix(filename, identifier, matrix_format, index)
+        if mat is not None:
+            pcache.save(key, READ_MATRIX_VERSION, {'matrix':mat})
+        return mat
 
     assert isinstance(filename, str) or isinstance(filename, list)
     assert isinstance(identifier, str)
@@ -83,7 +357,10 @@ def read_matrix(filename, identifier, matrix_format='full'):
                              'upper triangle','UT','ut', 
                              'lower triangle','LT', 'lt'] 
     
-    if isinstance(filename, str):
+    if isinstance(filename, str) and index is not None:
+        f = _open_indexed(filename, identifier+'\n', True, index)
+        if f is None: f = io.StringIO('')
+    elif isinstance(filename, str):
         f = open(filename,'r')
     else:
         f = filename
@@ -91,70 +368,56 @@ def read_matrix(filename, identifier, matrix_format='full'):
     foundIdentifier = False
     foundMatrix = False
     emptyRowId  = ' '*8
-    mat_raw = None
     identifier += '\n'
 
+    # the lines of a panel are kept as row, number of values and raw
+    # tokens until the panel is complete and converted at once, the
+    # panels are joined once the number of columns is known
+    panels = []
+    col0 = 0
+    rowIds, rowCounts, tokens = [], [], []
+
     for line in f:
 
         if not foundIdentifier:
             if (line == identifier): foundIdentifier = True
             continue
-        
+
         if(not foundMatrix and foundIdentifier):
             exam_line = line.split()
             if len(exam_line)== 0: continue
             start_indicator = [str(i+1) for i in range(len(exam_line))]
             if exam_line != start_indicator: continue
-            
+
             foundMatrix = True
             first = True
             firstFinished = False
             nRow = 0
+            nCol = 0
 
         if(foundMatrix):
             if(len(line) < 8):
-                if(mat_raw is None):
-                    mat_raw = pd.DataFrame(cur_cols_raw,index=curRows,columns=curCols)
-                else:
-                    mat_raw = mat_raw.join(pd.DataFrame(cur_cols_raw,
-                                                        index=curRows,columns=curCols))  
                 break
 
             elif(line[:8] == emptyRowId):
                # Col number line
                if(first and firstFinished): first = False
+               if(first): firstFinished = True
+
+               curCols = line.split()
+               if(len(curCols) == 0): break
+               if len(rowIds) > 0:
+                   panels.append((col0, _fill_panel(nRow, nCol-col0, rowIds, rowCounts, tokens)))
+                   rowIds, rowCounts, tokens = [], [], []
+               col0 = nCol
+               nCol += len(curCols)
 
-               if(first):
-                   firstFinished = True
-               else:
-                   #print(curCols)
-                   if(mat_raw is None):
-                       mat_raw = pd.DataFrame(cur_cols_raw,index=curRows,columns=curCols)
-                   else:    
-                       mat_raw = mat_raw.join(pd.DataFrame(cur_cols_raw,
-                                                           index=curRows,columns=curCols))  
-
-               cur_cols_raw = []
-               curRows = []
-               curCols = list(map(int,line.split()))
-               if(len(curCols) == 0): 
-                   last =True
-                   break
-
-            else: 
+            else:
                # Row number line and value
-                iterRow = -1
-                
-                try: # TODO: add function to deal with spin 
+                values = line.split()
+                try: # TODO: add function to deal with spin
                     iterRow = int(line[:7])
                 except ValueError:
-                    #print(curCols)
-                    if(mat_raw is None):
-                        mat_raw = pd.DataFrame(cur_cols_raw,index=curRows,columns=curCols)
-                    else:
-                        mat_raw = mat_raw.join(pd.DataFrame(cur_cols_raw,
-                                                            index=curRows,columns=curCols))  
-                    curRows = []
                     break
 
                 # Exam invalied conditions and add values
@@ -164,31 +427,30 @@ def read_matrix(filename, identifier, matrix_format='full'):
                 else:
                     if(iterRow > nRow): raise ValueError('Matrix row out of bound')
 
-                curRows.append(iterRow) 
-                cur_cols_raw.append(line.split()[1:])
-
-    if len(curRows) != 0:
-        if(mat_raw is None):
-            mat_raw = pd.DataFrame(cur_cols_raw,index=curRows,columns=curCols)
-        else:    
-            mat_raw = mat_raw.join(pd.DataFrame(cur_cols_raw,
-                                                index=curRows,columns=curCols))  
+                rowIds.append(iterRow - 1)
+                rowCounts.append(len(values) - 1)
+                tokens.extend(values[1:])
 
     if isinstance(filename, str): f.close()
 
-    if(mat_raw is not None):
+    if len(rowIds) > 0:
+        panels.append((col0, _fill_panel(nRow, nCol-col0, rowIds, rowCounts, tokens)))
+
+    if len(panels) > 0:
         print(identifier[:-1]+' has been obtained')
     else:
         print(identifier[:-1]+' are not found in the log file')
         return None
-    
-    if matrix_format in ['full','F', 'f']:
-        mat_raw = mat_raw.values
-    elif matrix_format in ['upper triangle','UT','ut']:
-        mat_raw = np.triu(mat_raw.values)
+
+    mat = np.full((nRow, nCol), np.nan)
+    for col0, panel in panels:
+        mat[:,col0:col0+panel.shape[1]] = panel
+
+    if matrix_format in ['upper triangle','UT','ut']:
+        mat[np.tril_indices(mat.shape[0], -1, mat.shape[1])] = 0.
     elif matrix_format in ['lower triangle','LT', 'lt']:
-        mat_raw = np.tril(mat_raw.values) 
-    
-    return np.vectorize(gaustr_to_num)(mat_raw)
+        mat[np.triu_indices(mat.shape[0], 1, mat.shape[1])] = 0.
+
+    return mat
 
 
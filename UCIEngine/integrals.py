@@ -0,0 +1,296 @@
+"""
+  A module of one and two electron integrals blocked by the
+  generalized active spaces (GAS) of an UCIEngine
+"""
+
+import os
+import re
+import json
+import numpy as np
+
+# magic bytes of the binary integral file, see GASIntegrals.save
+MAGIC = b'UCIINTS1'
+# alignment of the arrays inside the binary file
+ALIGN = 64
+
+def random_integrals(NO, seed=0):
+    """ random real h_pq and (pq|rs) with the symmetry of the integrals,
+        for tests and benchmarks """
+    rng = np.random.default_rng(seed)
+    h1e = rng.normal(size=(NO, NO))
+    h1e = 0.5*(h1e + h1e.T)
+    h2e = rng.normal(size=(NO, NO, NO, NO))
+    h2e = h2e + h2e.transpose(1, 0, 2, 3)
+    h2e = h2e + h2e.transpose(0, 1, 3, 2)
+    h2e = h2e + h2e.transpose(2, 3, 0, 1)
+    return h1e, 0.125*h2e
+
+class GASIntegrals(object):
+    """Real integrals h_pq and (pq|rs) with 8-fold permutational symmetry,
+       packed block by block over the orbital spaces
+
+       An orbital pair pq with p >= q belongs to the space pair (x,y),
+       x >= y, numbered x(x+1)/2+y. Inside it pairs run as p*n_y+q, or
+       p(p+1)/2+q if x == y, with local orbital indices. The (pq|rs)
+       matrix over canonical pairs is symmetric, its blocks (P|Q) of
+       space pairs P >= Q are stored one after another in eri, in full
+       (row major) if P > Q and as the packed lower triangle if P == Q.
+       Together these hold each unique integral exactly once.
+
+       Every block (x,y|z,w) with x > y, z > w and (x,y) > (z,w) is thus
+       one contiguous slice of eri, see block. The file written by save
+       is memory mapped by load, so only the blocks a kernel touches are
+       read from disk.
+
+    Attributes:
+        NOs: list of int, number of orbitals in each space
+        NO: int, total number of orbitals
+        ecore: float, core energy
+        h1e: numpy 2d array (NO, NO)
+        eri: numpy 1d array or memmap, packed two electron integrals
+        offsets: numpy 1d int64 array, start of each block in eri, the
+                 block of space pairs P >= Q is offsets[P(P+1)/2+Q]
+        orb_energies: numpy 1d array (NO,), orbital energies of an FCIDUMP
+                      ('e i 0 0 0' records), None if not given
+        filename: str, file eri is mapped from, None if in memory
+    """
+    def __init__(self, NOs, h1e=None, eri=None, ecore=0., dtype=np.float64):
+        """
+        Args:
+            NOs: list of int, number of orbitals in each space
+            h1e: numpy 2d array (NO, NO), zeros if None
+            eri: numpy 1d array, packed integrals as laid out by offsets,
+                 zeros if None
+            ecore: float, core energy
+            dtype: numpy real dtype of new arrays
+        """
+        self.NOs   = list(NOs)
+        self.NO    = sum(self.NOs)
+        self.NGAS  = len(self.NOs)
+        self.ecore = float(ecore)
+        self.orb_energies = None
+        self.filename = None
+
+        self.space  = np.repeat(np.arange(self.NGAS), self.NOs)
+        self.bounds = np.cumsum([0] + self.NOs)
+
+        # orbital pairs in each space pair x >= y
+        n = np.array(self.NOs, dtype=np.int64)
+        x, y = np.tril_indices(self.NGAS)
+        self.npair = np.where(x == y, n[x]*(n[x]+1)//2, n[x]*n[y])
+
+        # blocks of space pairs P >= Q
+        P, Q = np.tril_indices(self.npair.shape[0])
+        sizes = np.where(P == Q, self.npair[P]*(self.npair[P]+1)//2,
+                         self.npair[P]*self.npair[Q])
+        self.offsets = np.zeros(sizes.shape[0]+1, dtype=np.int64)
+        np.cumsum(sizes, out=self.offsets[1:])
+
+        if h1e is None: h1e = np.zeros(shape=(self.NO, self.NO), dtype=dtype)
+        if eri is None: eri = np.zeros(self.offsets[-1], dtype=dtype)
+        assert h1e.shape == (self.NO, self.NO)
+        assert eri.shape == (self.offsets[-1],)
+        assert not np.iscomplexobj(eri), '8-fold symmetry needs real integrals'
+        self.h1e = h1e
+        self.eri = eri
+
+        return
+
+    @classmethod
+    def from_dense(cls, NOs, h1e, h2e, ecore=0.):
+        """ pack dense integrals h2e (NO, NO, NO, NO) in chemists' notation """
+        ints = cls(NOs, np.array(h1e), ecore=ecore, dtype=np.result_type(h2e))
+        pairs = [ints.pair_orbitals(P) for P in range(ints.npair.shape[0])]
+        k = 0
+        for P in range(len(pairs)):
+            p, q = pairs[P]
+            for Q in range(P+1):
+                r, s = pairs[Q]
+                blk = h2e[p[:,None], q[:,None], r[None,:], s[None,:]]
+                if P == Q: blk = blk[np.tril_indices(blk.shape[0])]
+                ints.eri[ints.offsets[k]:ints.offsets[k+1]] = blk.ravel()
+                k += 1
+        return ints
+
+    @classmethod
+    def from_fcidump(cls, filename, NOs=None):
+        """ integrals of a text FCIDUMP file, one space of NORB orbitals
+            if NOs is None """
+        with open(filename) as f:
+            text = f.read()
+        head, body = re.split(r'&END|/\s*\n', text, maxsplit=1, flags=re.IGNORECASE)
+        NO = int(re.search(r'NORB\s*=\s*(\d+)', head, flags=re.IGNORECASE).group(1))
+        if NOs is None: NOs = [NO]
+        assert sum(NOs) == NO
+
+        data = np.array(body.replace('D', 'E').replace('d', 'E').split(),
+                        dtype=np.float64).reshape(-1, 5)
+        vals = data[:,0]
+        p, q, r, s = (data[:,1:].astype(np.int64) - 1).T
+
+        ints = cls(NOs)
+        is_2e  = r >= 0
+        is_1e  = (~is_2e) & (q >= 0)
+        # orbital energies, 'e i 0 0 0'
+        is_orb = (~is_2e) & (p >= 0) & (q < 0)
+        ints.eri[ints.index(p[is_2e], q[is_2e], r[is_2e], s[is_2e])] = vals[is_2e]
+        ints.h1e[p[is_1e], q[is_1e]] = vals[is_1e]
+        ints.h1e[q[is_1e], p[is_1e]] = vals[is_1e]
+        if is_orb.any():
+            ints.orb_energies = np.zeros(NO)
+            ints.orb_energies[p[is_orb]] = vals[is_orb]
+        ints.ecore = float(vals[(~is_2e) & (p < 0)].sum())
+
+        return ints
+
+    def save(self, filename):
+        """ write a binary file: MAGIC, int64 length of a json header,
+            the header, then h1e and eri aligned to ALIGN bytes """
+        header = {'NOs':self.NOs, 'ecore':self.ecore, 'dtype':self.eri.dtype.str,
+                  'n_eri':int(self.offsets[-1]),
+                  'orb_energies':None if self.orb_energies is None
+                                 else [float(e) for e in self.orb_energies]}
+        # offsets depend on the header length, fix its size first
+        header['h1e_offset'] = header['eri_offset'] = 0
+        size = len(json.dumps(header)) + 64
+        header['h1e_offset'] = -(-(len(MAGIC) + 8 + size) // ALIGN)*ALIGN
+        header['eri_offset'] = -(-(header['h1e_offset'] + self.h1e.nbytes) // ALIGN)*ALIGN
+        raw = json.dumps(header).encode('ascii').ljust(size)
+
+        tmp = filename + '.tmp'
+        with open(tmp, 'wb') as f:
+            f.write(MAGIC)
+            f.write(np.int64(len(raw)).tobytes())
+            f.write(raw)
+            f.seek(header['h1e_offset'])
+            f.write(np.ascontiguousarray(self.h1e, dtype=self.eri.dtype).tobytes())
+            f.seek(header['eri_offset'])
+            # in chunks, eri may be mapped from another file
+            for st in range(0, self.eri.shape[0], 2**24):
+                f.write(np.ascontiguousarray(self.eri[st:st+2**24]).tobytes())
+        os.replace(tmp, filename)
+
+    @classmethod
+    def load(cls, filename, mmap=True):
+        """ integrals of a file written by save, eri is a read only memmap
+            unless mmap is False """
+        with open(filename, 'rb') as f:
+            assert f.read(len(MAGIC)) == MAGIC, '%s is not an integral file' %filename
+            size = int(np.frombuffer(f.read(8), dtype=np.int64)[0])
+            header = json.loads(f.read(size).decode('ascii'))
+
+        dtype = np.dtype(header['dtype'])
+        NO = sum(header['NOs'])
+        h1e = np.array(np.memmap(filename, dtype=dtype, mode='r',
+                                 offset=header['h1e_offset'], shape=(NO, NO)))
+        eri = np.memmap(filename, dtype=dtype, mode='r',
+                        offset=header['eri_offset'], shape=(header['n_eri'],))
+        if not mmap: eri = np.array(eri)
+        ints = cls(header['NOs'], h1e, eri, header['ecore'])
+        if header.get('orb_energies') is not None:
+            ints.orb_energies = np.array(header['orb_energies'])
+        ints.filename = filename if mmap else None
+
+        return ints
+
+    def __getstate__(self):
+        # mapped integrals are reopened instead of copied
+        state = self.__dict__.copy()
+        if self.filename is not None: state['eri'] = None
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        if self.eri is None:
+            self.eri = self.load(self.filename).eri
+
+    def _pair(self, p, q):
+        """ space pair and index inside it of canonical pairs p >= q """
+        x, y = self.space[p], self.space[q]
+        p_l, q_l = p - self.bounds[x], q - self.bounds[y]
+        n_y = np.asarray(self.NOs)[y]
+        return x*(x+1)//2 + y, np.where(x == y, p_l*(p_l+1)//2 + q_l, p_l*n_y + q_l)
+
+    def index(self, p, q, r, s):
+        """ positions of (pq|rs) in eri, arrays of orbitals broadcast """
+        p, q, r, s = np.broadcast_arrays(*[np.asarray(i, dtype=np.int64) for i in (p, q, r, s)])
+        P, i = self._pair(np.maximum(p, q), np.minimum(p, q))
+        Q, j = self._pair(np.maximum(r, s), np.minimum(r, s))
+        swap = (P < Q) | ((P == Q) & (i < j))
+        P, Q = np.where(swap, Q, P), np.where(swap, P, Q)
+        i, j = np.where(swap, j, i), np.where(swap, i, j)
+        local = np.where(P == Q, i*(i+1)//2 + j, i*self.npair[Q] + j)
+        return self.offsets[P*(P+1)//2 + Q] + local
+
+    def get(self, p, q, r, s):
+        """ (pq|rs), arrays of orbitals broadcast """
+        return self.eri[self.index(p, q, r, s)]
+
+    def pair_orbitals(self, P):
+        """ orbitals (p, q) of the pairs of space pair P in storage order """
+        x = int((np.sqrt(8*P + 1) - 1)//2)
+        y = P - x*(x+1)//2
+        if x == y:
+            p, q = np.tril_indices(self.NOs[x])
+        else:
+            p = np.repeat(np.arange(self.NOs[x]), self.NOs[y])
+            q = np.tile(np.arange(self.NOs[y]), self.NOs[x])
+        return p + self.bounds[x], q + self.bounds[y]
+
+    def pair_matrix(self, pq, rs):
+        """ (pq|rs) for flat orbital pair indices pq = p*NO+q and rs,
+            as a (len(pq), len(rs)) matrix, e.g. the columns of a sigma
+            kernel """
+        pq = np.asarray(pq, dtype=np.int64)[:,None]
+        rs = np.asarray(rs, dtype=np.int64)[None,:]
+        return self.get(pq // self.NO, pq % self.NO, rs // self.NO, rs % self.NO)
+
+    def block(self, x, y, z, w):
+        """ (pq|rs) with p, q, r, s in spaces x, y, z, w as a dense
+            (n_x, n_y, n_z, n_w) array, a read only view of eri when the
+            block is stored in full, x > y, z > w and (x,y) > (z,w) """
+        P, Q = x*(x+1)//2 + y, z*(z+1)//2 + w
+        if x > y and z > w and P > Q:
+            st = self.offsets[P*(P+1)//2 + Q]
+            view = self.eri[st:st+self.npair[P]*self.npair[Q]]
+            return view.reshape(self.NOs[x], self.NOs[y], self.NOs[z], self.NOs[w])
+
+        orbs = [np.arange(self.bounds[v], self.bounds[v+1]) for v in (x, y, z, w)]
+        return self.get(*np.ix_(*orbs))
+
+    def h1e_block(self, x, y):
+        """ h_pq with p in space x and q in space y """
+        return self.h1e[self.bounds[x]:self.bounds[x+1], self.bounds[y]:self.bounds[y+1]]
+
+    def move_blocks(self, x_lose1, x_lose2, x_gain1, x_gain2):
+        """ space quartets (x,y|z,w) of the integrals coupling a
+            category pair of graph_2e with these moves, -1 for unused
+            entries as in CategoryGraph2e, each quartet once in canonical
+            order x >= y, z >= w, (x,y) >= (z,w) """
+        spaces = range(self.NGAS)
+        if x_lose2 >= 0:
+            quartets = [(x_gain1, x_lose1, x_gain2, x_lose2),
+                        (x_gain1, x_lose2, x_gain2, x_lose1)]
+        elif x_lose1 >= 0:
+            quartets = [(x_gain1, x_lose1, z, z) for z in spaces] + \
+                       [(x_gain1, z, z, x_lose1) for z in spaces]
+        else:
+            quartets = [(z, z, w, w) for z in spaces for w in spaces] + \
+                       [(z, w, w, z) for z in spaces for w in spaces]
+
+        canonical = set()
+        for x, y, z, w in quartets:
+            x, y = max(x, y), min(x, y)
+            z, w = max(z, w), min(z, w)
+            if (x, y) < (z, w): x, y, z, w = z, w, x, y
+            canonical.add((x, y, z, w))
+        return sorted(canonical)
+
+    def to_dense(self):
+        """ all (pq|rs) as a (NO, NO, NO, NO) array """
+        orbs = np.arange(self.NO)
+        return self.get(orbs[:,None,None,None], orbs[None,:,None,None],
+                        orbs[None,None,:,None], orbs[None,None,None,:])
+
+    def nbytes(self):
+        return self.h1e.nbytes + self.eri.nbytes
@@ -0,0 +1,133 @@
+"""
+  Benchmark of the category orderings of an UCIEngine, the block
+  locality of H and the runtime of sigma in each layout
+
+  python ordering_benchmark.py --nos 4 4 4 4 --ne 8 --excitations D
+"""
+
+import time
+import argparse
+import numpy as np
+from base import UCIEngine
+from sigma import SigmaEngine
+from sparsity import BlockSparsity
+from integrals import random_integrals
+from category_graph import CAT_ORDERS
+
+def block_profile(CIEng, tile=None):
+    """ locality of the nonzeros of H in the layout of CIEng
+
+        H is cut into square tiles of tile configurations and the
+        predicted nonzeros of each category block are spread evenly over
+        its rectangle.
+
+    Args:
+        CIEng: UCIEngine
+        tile: int, tile size, default keeps about 1024 tiles per side
+
+    Returns:
+        dict
+            bandwidth: int, largest distance of a nonzero from the diagonal
+            mean_distance: float, nonzero weighted mean distance of the
+                           block centers from the diagonal
+            n_tiles: int, number of tiles with nonzeros
+            tile_density: float, nonzeros per element of those tiles
+    """
+    if tile is None: tile = max(64, -(-CIEng.NCnf // 1024))
+    sp = BlockSparsity(CIEng)
+    PSt   = np.asarray(CIEng.Cats['PSt'], dtype=np.int64)
+    NCnfs = np.asarray(CIEng.Cats['NCnfs'], dtype=np.int64)
+
+    r0, r1 = PSt[sp.J], PSt[sp.J] + NCnfs[sp.J]
+    c0, c1 = PSt[sp.I], PSt[sp.I] + NCnfs[sp.I]
+    bandwidth = int(np.maximum(r1 - 1 - c0, c1 - 1 - r0).max())
+    distance  = np.abs((r0 + r1) - (c0 + c1))/2
+    mean_distance = float((sp.nnz_2e*distance).sum()/sp.nnz_2e.sum())
+
+    # tiles touched by each block, as rows x columns of tile indices
+    tr0, tr1 = r0 // tile, (r1 - 1) // tile + 1
+    tc0, tc1 = c0 // tile, (c1 - 1) // tile + 1
+    n_r, n_c = tr1 - tr0, tc1 - tc0
+    n = n_r*n_c
+    edge = np.repeat(np.arange(n.shape[0]), n)
+    k = np.arange(n.sum()) - np.repeat(np.cumsum(n) - n, n)
+    rows = tr0[edge] + k // n_c[edge]
+    cols = tc0[edge] + k % n_c[edge]
+    n_tiles = np.unique(rows*(CIEng.NCnf // tile + 1) + cols).shape[0]
+
+    return {'bandwidth':bandwidth, 'mean_distance':mean_distance,
+            'n_tiles':int(n_tiles),
+            'tile_density':float(sp.nnz_2e.sum()/(n_tiles*tile**2))}
+
+def benchmark_orderings(NOs, NE, orders=CAT_ORDERS, n_sigma=3, tile=None,
+                        verbose=True, **kwargs):
+    """ block locality and sigma runtime for each category order
+
+    Args:
+        NOs: list of int, number of orbitals in each space
+        NE: int, number of electrons
+        orders: list of str, see category_graph.category_order
+        n_sigma: int, number of timed sigma calls, the best is reported
+        tile: int, tile size of block_profile
+        verbose: boolean, print a row per order
+        kwargs: GAS specification of UCIEngine, e.g. GAS_excitations
+
+    Returns:
+        list of dict per order, block_profile plus
+            order: str
+            t_init: float, seconds to build the engine
+            t_sigma: float, seconds of one sigma call
+            error: float, largest deviation of sigma from the first order
+                   after mapping to the canonical layout
+    """
+    h1e = h2e = None
+    C = ref = None
+    results = []
+    for order in orders:
+        t0 = time.time()
+        CIEng = UCIEngine(NOs, NE, 'GAS', Cat_order=order, **kwargs)
+        t_init = time.time() - t0
+
+        if h1e is None:
+            h1e, h2e = random_integrals(CIEng.NO)
+            C = np.random.default_rng(1).normal(size=CIEng.NCnf)
+        sigma_eng = SigmaEngine(CIEng, h1e, h2e)
+        C_order = CIEng.from_canonical(C)
+        t_sigma = np.inf
+        for _ in range(n_sigma):
+            t0 = time.time()
+            sigma = sigma_eng.sigma(C_order)
+            t_sigma = min(t_sigma, time.time() - t0)
+        sigma = CIEng.to_canonical(sigma)
+        if ref is None: ref = sigma
+
+        result = {'order':order, 't_init':t_init, 't_sigma':t_sigma,
+                  'error':float(np.abs(sigma - ref).max())}
+        result.update(block_profile(CIEng, tile))
+        results.append(result)
+
+    if verbose:
+        print('%-12s %10s %14s %10s %12s %10s %10s %9s'
+              %('order', 'bandwidth', 'mean distance', 'tiles', 'tile density',
+                'init/s', 'sigma/s', 'error'))
+        for r in results:
+            print('%-12s %10i %14.1f %10i %12.4E %10.3f %10.3f %9.2E'
+                  %(r['order'], r['bandwidth'], r['mean_distance'], r['n_tiles'],
+                    r['tile_density'], r['t_init'], r['t_sigma'], r['error']))
+
+    return results
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--nos', type=int, nargs='+', required=True,
+                        help='number of orbitals in each space')
+    parser.add_argument('--ne', type=int, required=True, help='number of electrons')
+    parser.add_argument('--excitations', default='F', help='GAS_excitations')
+    parser.add_argument('--orders', nargs='+', default=list(CAT_ORDERS),
+                        choices=CAT_ORDERS)
+    parser.add_argument('--n-sigma', type=int, default=3)
+    parser.add_argument('--tile', type=int, default=None)
+    args = parser.parse_args()
+
+    benchmark_orderings(args.nos, args.ne, args.orders, args.n_sigma, args.tile,
+                        GAS_excitations=args.excitations)
@@ -0,0 +1,168 @@
+"""
+  A module of single replacement lists between categories of
+  an UCIEngine, the string driven tables of Olsen's CI algorithm
+"""
+
+import numpy as np
+from addressing import ArrayCache, addressing_batch
+from utils import compute_NConf_GHF_GAS_Cat
+
+def single_replacements(CIEng, NEs, moves, chunk_size=2**14):
+    """ single replacements a^+_q a_p of all strings in a category
+
+    Args:
+        CIEng: UCIEngine, provides orbital spaces and addressing
+        NEs: list of int, number of electrons in each space of
+             the source category
+        moves: list of tuple (x_lose, x_gain), p runs over occupied
+               orbitals of x_lose and q over empty orbitals of x_gain,
+               all moves have to lead to the same target category,
+               moves with x_lose == x_gain include p == q
+        chunk_size: int, number of source strings processed at once
+
+    Returns:
+        reps: dict of C-contiguous numpy 2d arrays with shape
+              (NCnf of source, number of replacements per string)
+              tgt:  int32, position of a^+_q a_p |source> inside the
+                    target category, starting from 0
+              p:    int32, annihilated orbital
+              q:    int32, created orbital
+              sign: int8, fermionic phase of a^+_q a_p |source>
+    """
+    NOs    = CIEng.NOs
+    bounds = np.cumsum([0] + list(NOs))
+
+    NEs_tgt = list(NEs)
+    NEs_tgt[moves[0][0]] -= 1
+    NEs_tgt[moves[0][1]] += 1
+    for x_lose, x_gain in moves:
+        if x_lose == x_gain: continue
+        assert [NEs[x] - (x == x_lose) + (x == x_gain)
+                for x in range(CIEng.NGAS)] == NEs_tgt
+
+    n_src = [compute_NConf_GHF_GAS_Cat([NOs[x]], [NEs[x]])
+             for x in range(CIEng.NGAS)]
+    strides_src = CIEng.cat_strides(NEs)
+    strides_tgt = CIEng.cat_strides(NEs_tgt)
+    strings = CIEng.cat_strings(NEs)
+    NSrc = strings.shape[0]
+
+    reps = {'tgt':[], 'p':[], 'q':[], 'sign':[]}
+    for st in range(0, NSrc, chunk_size):
+        occ = strings[st:st+chunk_size]
+        N = occ.shape[0]
+        local = np.arange(st, st+N)
+        prefix = np.zeros(shape=(N, CIEng.NO+1), dtype=np.int32)
+        np.cumsum(occ, axis=1, out=prefix[:,1:])
+
+        chunk = {'tgt':[], 'p':[], 'q':[], 'sign':[]}
+        for x_lose, x_gain in moves:
+            occ_l = occ[:,bounds[x_lose]:bounds[x_lose+1]]
+            occ_g = occ[:,bounds[x_gain]:bounds[x_gain+1]]
+            P = np.nonzero(occ_l)[1].reshape(N, NEs[x_lose]) + bounds[x_lose]
+            Q = np.nonzero(1 - occ_g)[1].reshape(N, -1) + bounds[x_gain]
+
+            p = np.repeat(P, Q.shape[1], axis=1)
+            q = np.tile(Q, (1, P.shape[1]))
+            if x_lose == x_gain:
+                # diagonal replacements a^+_p a_p
+                p = np.hstack([p, P])
+                q = np.hstack([q, P])
+            M = p.shape[1]
+            rows = np.repeat(np.arange(N), M)
+
+            # addresses of target strings, only x_lose and x_gain change
+            tgt = np.zeros(shape=(N, M), dtype=np.int64)
+            for x in range(CIEng.NGAS):
+                if x != x_lose and x != x_gain:
+                    tgt += (((local // strides_src[x]) % n_src[x])*strides_tgt[x])[:,None]
+                    continue
+                if NEs_tgt[x] == 0: continue
+
+                occ_x = np.repeat(occ[:,bounds[x]:bounds[x+1]], M, axis=0)
+                if x == x_lose:
+                    occ_x[np.arange(N*M), p.ravel() - bounds[x]] = 0
+                if x == x_gain:
+                    occ_x[np.arange(N*M), q.ravel() - bounds[x]] = 1
+                addr_x = addressing_batch(occ_x, CIEng.Z_cache[(NEs_tgt[x], NOs[x])])
+                tgt += ((addr_x - 1)*strides_tgt[x]).reshape(N, M)
+
+            # occupied orbitals strictly between p and q
+            lo = np.minimum(p, q)
+            hi = np.maximum(p, q)
+            n_between = prefix[rows, hi.ravel()] - prefix[rows, lo.ravel()+1]
+            n_between = np.where(p.ravel() == q.ravel(), 0, n_between)
+
+            chunk['tgt'].append(tgt)
+            chunk['p'].append(p)
+            chunk['q'].append(q)
+            chunk['sign'].append((1 - 2*(n_between & 1)).reshape(N, M))
+
+        for key in reps.keys():
+            reps[key].append(np.hstack(chunk[key]))
+
+    dtypes = {'tgt':np.int32, 'p':np.int32, 'q':np.int32, 'sign':np.int8}
+    for key in reps.keys():
+        reps[key] = np.ascontiguousarray(np.vstack(reps[key]), dtype=dtypes[key])
+
+    return reps
+
+class ReplacementLists(object):
+    """Single replacement lists for each edge (I,J) of graph_1e
+
+    Attributes:
+        CIEng: UCIEngine
+        lazy: boolean, build tables on first access
+        tables: ArrayCache with keys as (I,J) and values as dict of
+                arrays, see single_replacements
+    """
+    def __init__(self, CIEng, lazy=False, maxsize=None):
+        """
+        Args:
+            CIEng: UCIEngine with initialized categories
+            lazy: boolean, build the table of a category pair only when
+                  it is first accessed
+            maxsize: int, maximal number of category pairs kept in
+                     memory when lazy, least recently used are dropped
+        """
+        self.CIEng  = CIEng
+        self.lazy   = lazy
+        self.tables = ArrayCache(self._build, maxsize if lazy else None)
+
+        if not lazy:
+            for edge in self.edges(): self.tables[edge]
+
+        return
+
+    def edges(self):
+        """all category pairs (I,J) with single replacements I -> J"""
+        src, dst = self.CIEng.Cats['graph_1e'].edges()[:2]
+        return zip(src.tolist(), dst.tolist())
+
+    def moves(self, I, J):
+        """list of (x_lose, x_gain) from category I to J"""
+        moves = self.CIEng.Cats['graph_1e'].moves(I, J)
+        return list(moves) if I == J else [moves]
+
+    def _build(self, key):
+        I, J = key
+        moves = self.moves(I, J)
+        NEs = self.CIEng.Cats['NEs'][I]
+        if len(moves) == 0:
+            # no electrons at all
+            reps = {'tgt': np.zeros(shape=(1,0), dtype=np.int32),
+                    'p':   np.zeros(shape=(1,0), dtype=np.int32),
+                    'q':   np.zeros(shape=(1,0), dtype=np.int32),
+                    'sign':np.zeros(shape=(1,0), dtype=np.int8)}
+        else:
+            reps = single_replacements(self.CIEng, NEs, moves)
+        for arr in reps.values(): arr.setflags(write=False)
+        return reps
+
+    def __getitem__(self, key):
+        return self.tables[key]
+
+    def nbytes(self):
+        """memory of the tables currently held"""
+        return sum(arr.nbytes for reps in self.tables.values()
+                   for arr in reps.values())
@@ -0,0 +1,439 @@
+"""
+  A module to compute sigma vectors (H*C) on the categories
+  of an UCIEngine with spin orbital (GHF-like) Hamiltonians
+"""
+
+import heapq
+import multiprocessing as mp
+import numpy as np
+from concurrent.futures import ProcessPoolExecutor
+from addressing import ArrayCache
+from civector import SharedCIVector
+from replacement_lists import ReplacementLists, single_replacements
+from integrals import GASIntegrals
+from utils import compute_NConf_GHF_GAS_Cat
+
+def scatter_add(out, idx, vals):
+    """out[idx] += vals with repeated indices, real or complex"""
+    n = out.shape[0]
+    if np.iscomplexobj(vals):
+        out += np.bincount(idx, weights=vals.real, minlength=n)
+        out += 1j*np.bincount(idx, weights=vals.imag, minlength=n)
+    else:
+        out += np.bincount(idx, weights=vals, minlength=n)
+    return out
+
+def partition_tasks(tasks, costs, nparts):
+    """ split tasks into nparts bins of balanced cost,
+        longest processing time first
+
+    Returns:
+        bins: list of list of tasks, heaviest bin first
+    """
+    heap = [(0, i) for i in range(nparts)]
+    bins = [[] for i in range(nparts)]
+    for j in np.argsort(costs, kind='stable')[::-1]:
+        load, i = heapq.heappop(heap)
+        bins[i].append(tasks[j])
+        heapq.heappush(heap, (load + costs[j], i))
+    return [b for b in bins if len(b) > 0]
+
+# sigma engine of a worker process, see SigmaEngine.start_pool
+_WORKER_ENGINE = None
+# shared vectors attached by a worker process, keyed by name
+_WORKER_VECTORS = {}
+
+def _init_worker(engine):
+    global _WORKER_ENGINE
+    _WORKER_ENGINE = engine
+
+def _attach_vectors(specs):
+    for name in list(_WORKER_VECTORS.keys()):
+        if name not in [spec['name'] for spec in specs]:
+            _WORKER_VECTORS.pop(name).close()
+    for spec in specs:
+        if spec['name'] not in _WORKER_VECTORS:
+            _WORKER_VECTORS[spec['name']] = SharedCIVector.attach(spec)
+    return [_WORKER_VECTORS[spec['name']] for spec in specs]
+
+def _sigma_worker(tasks, C_spec, out_spec):
+    """ accumulate tasks into the shared output, the tasks of a worker
+        only write the categories it owns, C and out stay in shared memory """
+    C, out = _attach_vectors([C_spec, out_spec])
+    for task in tasks:
+        _WORKER_ENGINE.run_task(task, C.vector(0), out.vector(0))
+    return len(tasks)
+
+class SigmaEngine(object):
+    """Sigma vector builder of an UCIEngine
+
+       H = sum_pq h_pq a^+_p a_q + 1/2 sum_pqrs (pq|rs) a^+_p a^+_r a_s a_q
+         = sum_pq k_pq E_pq + 1/2 sum_pqrs (pq|rs) E_pq E_rs,
+       with E_pq = a^+_p a_q and k_pq = h_pq - 1/2 sum_r (pr|rq).
+
+       The two electron part inserts a resolution of identity over all
+       intermediate categories K that are reachable from the CI space by
+       one electron move, so it is exact for truncated GAS spaces:
+           D[K,rs]  = <K|E_rs|C>,            gathered over graph_1e
+           G[K,pq]  = 1/2 sum_rs (pq|rs) D[K,rs],  dense matrix product
+           sigma_M += <M|E_pq|K> G[K,pq],    scattered over graph_1e
+
+    Attributes:
+        CIEng: UCIEngine
+        NO: int, number of orbitals
+        h1e: numpy 2d array, one electron integrals
+        k1e: numpy 2d array, effective one electron integrals
+        g2e: numpy 2d array, (pq|rs)/2 as a (NO*NO, NO*NO) matrix,
+             None if the integrals are given as GASIntegrals
+        ints: GASIntegrals, packed integrals, None if given dense
+        dtype: numpy dtype of the integrals
+        reps: ReplacementLists of the CI space
+        inter: list of tuple, occupations of intermediate categories
+        inter_links: list of dict, in space neighbors of each intermediate
+                     category, values are lists of moves (x_lose, x_gain)
+        max_rows: int, number of intermediate strings processed at once
+        nproc: int, number of worker processes, 1 runs serially
+    """
+    def __init__(self, CIEng, h1e, h2e, lazy=False, maxsize=None,
+                 max_rows=2**12, nproc=1):
+        """
+        Args:
+            CIEng: UCIEngine with initialized categories
+            h1e: numpy 2d array (NO, NO), one electron integrals,
+                 may be None to take h1e of a GASIntegrals h2e
+            h2e: numpy 4d array (NO, NO, NO, NO), two electron integrals
+                 (pq|rs) in chemists' notation over spin orbitals,
+                 or GASIntegrals over CIEng.NOs, then each intermediate
+                 category gathers only the integrals of its orbital pairs
+            lazy: boolean, build replacement lists on first access
+            maxsize: int, number of category pairs kept when lazy
+            max_rows: int, number of intermediate strings per dense block
+            nproc: int, number of worker processes for sigma, the pool
+                   is started on first use and reused, see close
+        """
+        assert CIEng.GHF, 'sigma of alpha and beta strings is not implemented'
+        self.CIEng = CIEng
+        self.NO = CIEng.NO
+        self.max_rows = max_rows
+        self.nproc = nproc
+        self._pool = None
+        self._shared_C   = None
+        self._shared_out = None
+        self._owned_tasks = None
+
+        if isinstance(h2e, GASIntegrals):
+            assert h2e.NOs == list(CIEng.NOs)
+            if h1e is None: h1e = h2e.h1e
+            h1e = np.asarray(h1e)
+            assert h1e.shape == (self.NO, self.NO)
+
+            r = np.arange(self.NO)
+            self.ints = h2e
+            self.k1e = h1e - 0.5*h2e.get(r[:,None,None], r[None,None,:],
+                                         r[None,None,:], r[None,:,None]).sum(axis=2)
+            self.g2e = None
+            self.dtype = np.result_type(h1e, h2e.eri)
+        else:
+            h1e = np.asarray(h1e)
+            h2e = np.asarray(h2e)
+            assert h1e.shape == (self.NO, self.NO)
+            assert h2e.shape == (self.NO,)*4
+
+            self.ints = None
+            self.k1e = h1e - 0.5*np.einsum('prrq->pq', h2e)
+            self.g2e = 0.5*h2e.reshape(self.NO**2, self.NO**2)
+            self.dtype = self.g2e.dtype
+        self.h1e = h1e
+
+        self.reps = ReplacementLists(CIEng, lazy=lazy, maxsize=maxsize)
+        self.inter_tables = ArrayCache(self._build_inter,
+                                       maxsize if lazy else None)
+        self._init_intermediates()
+
+        return
+
+    def _init_intermediates(self):
+        """ categories reachable from the CI space by one electron move """
+        NOs  = self.CIEng.NOs
+        NGAS = self.CIEng.NGAS
+        self.cat_index = {tuple(NEs):i for i, NEs in
+                          enumerate(self.CIEng.Cats['NEs'])}
+
+        inter = {}
+        for NEs in self.CIEng.Cats['NEs']:
+            for x_lose in range(NGAS):
+                if NEs[x_lose] == 0: continue
+                for x_gain in range(NGAS):
+                    K = list(NEs)
+                    K[x_lose] -= 1
+                    K[x_gain] += 1
+                    if K[x_gain] > NOs[x_gain]: continue
+                    inter[tuple(K)] = None
+
+        self.inter = list(inter.keys())
+        self.inter_links = []
+        for K in self.inter:
+            links = {}
+            for x_lose in range(NGAS):
+                if K[x_lose] == 0: continue
+                for x_gain in range(NGAS):
+                    L = list(K)
+                    L[x_lose] -= 1
+                    L[x_gain] += 1
+                    if tuple(L) not in self.cat_index: continue
+                    links.setdefault(self.cat_index[tuple(L)], []).append(
+                        (x_lose, x_gain))
+            self.inter_links.append(links)
+
+        return
+
+    def _build_inter(self, key):
+        iK, L = key
+        reps = single_replacements(self.CIEng, list(self.inter[iK]),
+                                   self.inter_links[iK][L])
+        for arr in reps.values(): arr.setflags(write=False)
+        return reps
+
+    def inter_reps(self, iK, L):
+        """replacement lists from intermediate category iK to category L"""
+        K = self.inter[iK]
+        if K in self.cat_index:
+            return self.reps[(self.cat_index[K], L)]
+        return self.inter_tables[(iK, L)]
+
+    def diagonal(self):
+        """ diagonal of the Hamiltonian,
+            H_DD = sum_p n_p h_pp + 1/2 sum_pq n_p n_q ((pp|qq) - (pq|qp))
+
+        Returns:
+            Hdiag: numpy 1d array with length NCnf
+        """
+        NO = self.NO
+        h_pp = np.einsum('pp->p', self.h1e)
+        if self.ints is None:
+            g = 2*self.g2e.reshape((NO,)*4)
+            JK = np.einsum('ppqq->pq', g) - np.einsum('pqqp->pq', g)
+        else:
+            p, q = np.arange(NO)[:,None], np.arange(NO)[None,:]
+            JK = self.ints.get(p, p, q, q) - self.ints.get(p, q, q, p)
+
+        Hdiag = np.zeros(self.CIEng.NCnf, dtype=self.dtype)
+        for I in range(self.CIEng.NCat):
+            occ = self.CIEng.cat_strings(self.CIEng.Cats['NEs'][I])
+            Hdiag_I = self._block(Hdiag, I)
+            for st in range(0, occ.shape[0], self.max_rows):
+                n = occ[st:st+self.max_rows].astype(Hdiag.dtype)
+                Hdiag_I[st:st+self.max_rows] = n @ h_pp + 0.5*((n @ JK)*n).sum(axis=1)
+
+        return Hdiag
+
+    def tasks(self):
+        """independent units of work, ('1e', M) accumulates the one
+           electron part of category M and ('2e', iK) the two electron
+           part passing through intermediate category iK"""
+        return [('1e', M) for M in range(self.CIEng.NCat)] + \
+               [('2e', iK) for iK in range(len(self.inter))]
+
+    def owned_tasks(self, nparts):
+        """ tasks of nparts owners of disjoint sets of categories, balanced
+            by the task_cost of the categories. An owner gets the one
+            electron tasks of its categories and ('2e', iK, targets) for
+            the intermediate categories iK linked to its categories, which
+            only writes the targets, so owners never write the same memory
+
+        Returns:
+            bins: list of list of tasks, heaviest owner first
+        """
+        NCnfs = self.CIEng.Cats['NCnfs']
+        costs = [self.task_cost(('1e', M)) for M in range(self.CIEng.NCat)]
+        for iK, links in enumerate(self.inter_links):
+            NK = compute_NConf_GHF_GAS_Cat(self.CIEng.NOs, self.inter[iK])
+            for L in links.keys(): costs[L] += NK*NCnfs[L]
+        owners = partition_tasks(list(range(self.CIEng.NCat)), costs, nparts)
+
+        bins = []
+        for cats in owners:
+            owned = set(cats)
+            tasks = [('1e', M) for M in sorted(cats)]
+            for iK, links in enumerate(self.inter_links):
+                targets = tuple(L for L in links.keys() if L in owned)
+                if len(targets) > 0: tasks.append(('2e', iK, targets))
+            bins.append(tasks)
+        return bins
+
+    def task_cost(self, task):
+        """estimated cost of a task from the block size products
+           NCnfs[I]*NCnfs[J] of the category pairs it touches"""
+        NCnfs = self.CIEng.Cats['NCnfs']
+        if task[0] == '1e':
+            M = task[1]
+            return sum(NCnfs[M]*NCnfs[L]
+                       for L in self.CIEng.Cats['graph_1e'][M].keys())
+        NK = compute_NConf_GHF_GAS_Cat(self.CIEng.NOs, self.inter[task[1]])
+        return sum(NK*NCnfs[L] for L in self.inter_links[task[1]].keys())
+
+    def sigma(self, C, out=None):
+        """Compute sigma = H*C
+
+        Args:
+            C: numpy 1d array with length NCnf, laid out by Cats['PSt'],
+               or SharedCIVector whose first vector is used in place
+            out: numpy 1d array, accumulated into if given
+
+        Returns:
+            sigma: numpy 1d array with length NCnf
+        """
+        C_shared = C if isinstance(C, SharedCIVector) else None
+        C = C_shared.vector(0) if C_shared is not None else np.asarray(C)
+        assert C.shape == (self.CIEng.NCnf,)
+        if out is None:
+            out = np.zeros(C.shape, dtype=np.result_type(C, self.dtype))
+
+        if self.nproc > 1: return self._sigma_parallel(C, out, C_shared)
+
+        for task in self.tasks():
+            self.run_task(task, C, out)
+
+        return out
+
+    def start_pool(self):
+        """start the worker processes, each holds a copy of this engine,
+           inherited without pickling where fork is available"""
+        if self._pool is not None: return self._pool
+        if 'fork' in mp.get_all_start_methods():
+            ctx = mp.get_context('fork')
+        else:
+            ctx = mp.get_context()
+        self._pool = ProcessPoolExecutor(max_workers=self.nproc, mp_context=ctx,
+                                         initializer=_init_worker,
+                                         initargs=(self,))
+        return self._pool
+
+    def close(self):
+        """shut down the worker processes and free shared buffers"""
+        if self._pool is not None:
+            self._pool.shutdown()
+            self._pool = None
+        for vec in (self._shared_C, self._shared_out):
+            if vec is not None: vec.close()
+        self._shared_C   = None
+        self._shared_out = None
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        state['_pool'] = None
+        state['_shared_C']   = None
+        state['_shared_out'] = None
+        return state
+
+    def _shared_buffers(self, dtype_C, dtype_out, copy_C=True):
+        """ shared input vector, only if C has to be copied, and a shared
+            output vector, reused between calls while the types stay the same """
+        PSt   = self.CIEng.Cats['PSt']
+        NCnfs = self.CIEng.Cats['NCnfs']
+        if copy_C and (self._shared_C is None or self._shared_C.dtype != dtype_C):
+            if self._shared_C is not None: self._shared_C.close()
+            self._shared_C = SharedCIVector(PSt, NCnfs, 1, dtype_C)
+        if self._shared_out is None or self._shared_out.dtype != dtype_out:
+            if self._shared_out is not None: self._shared_out.close()
+            self._shared_out = SharedCIVector(PSt, NCnfs, 1, dtype_out)
+        return self._shared_C, self._shared_out
+
+    def _sigma_parallel(self, C, out, C_shared=None):
+        """ tasks scheduled on the process pool by category ownership, see
+            owned_tasks. Workers attach to C in shared memory, a shared
+            C vector is used in place, and write their categories of a
+            single shared output, which is added to out at the end """
+        if self._owned_tasks is None:
+            self._owned_tasks = self.owned_tasks(self.nproc)
+
+        shared_C, shared_out = self._shared_buffers(C.dtype, out.dtype,
+                                                    copy_C=C_shared is None)
+        if C_shared is None:
+            shared_C.vector(0)[:] = C
+        else:
+            shared_C = C_shared
+        shared_out.vector(0)[:] = 0
+
+        pool = self.start_pool()
+        futures = [pool.submit(_sigma_worker, b, shared_C.spec(), shared_out.spec())
+                   for b in self._owned_tasks]
+        for future in futures: future.result()
+        out += shared_out.vector(0)
+
+        return out
+
+    def run_task(self, task, C, out):
+        """accumulate the contribution of a task into out, a two electron
+           task with targets only writes the categories in targets"""
+        if task[0] == '1e':
+            self._sigma_1e(task[1], C, out)
+        else:
+            self._sigma_2e(task[1], C, out, *task[2:])
+        return out
+
+    def _block(self, vec, I):
+        PSt   = self.CIEng.Cats['PSt'][I]
+        NCnfs = self.CIEng.Cats['NCnfs'][I]
+        return vec[PSt:PSt+NCnfs]
+
+    def _sigma_1e(self, M, C, out):
+        """ sigma_M += sum_pq k_pq <M|E_pq|L> C_L, gathered from the
+            replacement lists of M since <M|E_pq|L> = <L|E_qp|M> """
+        out_M = self._block(out, M)
+        for L in self.CIEng.Cats['graph_1e'][M].keys():
+            reps = self.reps[(M, L)]
+            if reps['tgt'].shape[1] == 0: continue
+            vals = self._block(C, L)[reps['tgt']]*reps['sign'] \
+                 * self.k1e[reps['p'], reps['q']]
+            out_M += vals.sum(axis=1)
+        return out
+
+    def _sigma_2e(self, iK, C, out, targets=None):
+        """ two electron contribution through intermediate category iK,
+            into the categories in targets, default all linked to iK """
+        NO = self.NO
+        links = self.inter_links[iK]
+        if len(links) == 0: return out
+
+        Ls = list(links.keys())
+        reps = [self.inter_reps(iK, L) for L in Ls]
+        if targets is None: targets = Ls
+        Ls_out = [L for L in Ls if L in targets]
+        reps_out = [r for L, r in zip(Ls, reps) if L in targets]
+
+        # compressed orbital pair columns of D (pq) and G (qp), G only
+        # has the columns scattered into the targets
+        cols = np.unique(np.concatenate(
+            [(r['p']*NO + r['q']).ravel() for r in reps]))
+        cols_T = np.unique(np.concatenate(
+            [(r['q']*NO + r['p']).ravel() for r in reps_out]))
+        if self.ints is None:
+            g_sub = self.g2e[np.ix_(cols_T, cols)]
+        else:
+            g_sub = 0.5*self.ints.pair_matrix(cols_T, cols)
+
+        NK = compute_NConf_GHF_GAS_Cat(self.CIEng.NOs, self.inter[iK])
+        dtype = np.result_type(C, self.dtype)
+
+        for st in range(0, NK, self.max_rows):
+            en = min(st + self.max_rows, NK)
+
+            # D[k, pq] = <k|E_pq|l> C_l = sign for a^+_q a_p |k> = |l>
+            D = np.zeros(shape=(en-st, cols.shape[0]), dtype=dtype)
+            for L, r in zip(Ls, reps):
+                pos = np.searchsorted(cols, r['p'][st:en]*NO + r['q'][st:en])
+                rows = np.arange(en-st)[:,None]
+                D[rows, pos] += self._block(C, L)[r['tgt'][st:en]]*r['sign'][st:en]
+
+            G = D @ g_sub.T
+
+            # sigma_m += <m|E_qp|k> G[k, qp]
+            for L, r in zip(Ls_out, reps_out):
+                pos = np.searchsorted(cols_T, r['q'][st:en]*NO + r['p'][st:en])
+                rows = np.arange(en-st)[:,None]
+                vals = G[rows, pos]*r['sign'][st:en]
+                scatter_add(self._block(out, L), r['tgt'][st:en].ravel(),
+                            vals.ravel())
+
+        return out
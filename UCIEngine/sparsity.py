@@ -0,0 +1,244 @@
+"""
+  A module of analytic sparsity and cost estimates of the CI
+  Hamiltonian blocks between categories of an UCIEngine
+"""
+
+import numpy as np
+from math import comb
+from utils import compute_NConf_GHF_GAS_Cat
+
+# bytes of one replacement list entry, int32 target, p, q and int8 sign
+REPLACEMENT_ENTRY_BYTES = 13
+
+def compute_intra_cat_excitation_sparcity(NO, NE, interacting_e=1):
+    """ fraction of zeros of the H block of one space with NE electrons
+        in NO orbitals, coupled by an interacting_e electron operator """
+    return 1 - sum([comb(NO-NE, iE)*comb(NE, iE)
+                    for iE in range(interacting_e+1)])/comb(NO, NE)
+
+def compute_matrix_sparcity(NOs, NEs, Excitations, exact=False):
+    """ fraction of zeros of the H block from a category L to the
+        category K reached by Excitations
+
+    Args:
+        NOs: list of int, number of orbitals in each space
+        NEs: list of int, number of electrons in each space of K
+        Excitations: list of tuple (x_lose, x_gain), one per interacting
+                     electron, x_lose == x_gain for a replacement inside
+                     a space, every space has to be involved unless exact
+        exact: boolean, count the strings of K coupled to a string of L
+               with coupled_strings instead of the estimate by the
+               replacements of each space
+
+    Returns:
+        float, 1 - nonzeros per row / number of configurations of K
+    """
+    assert isinstance(Excitations, list)
+
+    NK = compute_NConf_GHF_GAS_Cat(NOs, NEs)
+    n_space = len(NOs)
+
+    ne_lose = np.zeros(n_space, dtype=int)
+    ne_gain = np.zeros(n_space, dtype=int)
+    for ex in Excitations:
+        ne_lose[ex[0]] -= 1
+        ne_gain[ex[1]] += 1
+
+    if exact:
+        NEs_L = np.array(NEs) - ne_lose - ne_gain
+        assert NEs_L.min() >= 0 and (NEs_L <= np.array(NOs)).all()
+        nnz = coupled_strings([NEs_L], [NEs], NOs, len(Excitations))[0]
+        return 1 - nnz/NK
+
+    n_space_invovled = set()
+    for ex in Excitations:
+        n_space_invovled.add(ex[0])
+        n_space_invovled.add(ex[1])
+    assert len(n_space_invovled) == n_space
+
+    ne_change = ne_lose + ne_gain
+    ne_same_indexes = ((-ne_lose + ne_gain) - ne_change)//2
+
+    NNonZeroKOffset = 1
+    for i in range(n_space):
+        if ne_change[i] > 0:
+            NNonZeroKOffset *= comb(NOs[i]-NEs[i], int(ne_change[i]))
+        elif ne_change[i] < 0:
+            NNonZeroKOffset *= comb(NEs[i], int(-ne_change[i]))
+
+    NNonZeroK = 0
+    while not all(ne_same_indexes == 0):
+        NNonZeroKTemp = NNonZeroKOffset
+        for i in range(n_space):
+            ie = int(ne_same_indexes[i])
+            if ie != 0: NNonZeroKTemp *= comb(NOs[i]-NEs[i], ie)*comb(NEs[i], ie)
+        NNonZeroK += NNonZeroKTemp
+        ne_same_indexes[np.nonzero(ne_same_indexes)[0][0]] -= 1
+    NNonZeroK += NNonZeroKOffset
+
+    return 1 - NNonZeroK/NK
+
+def _comb(N, k):
+    """ binomial coefficients of integer arrays, k small, zero outside
+        0 <= k <= N """
+    N = np.asarray(N, dtype=np.float64)
+    k = np.asarray(k)
+    out = np.ones(np.broadcast(N, k).shape)
+    for i in range(max(int(k.max(initial=0)), 0)):
+        out *= np.where(i < k, (N - i)/(i + 1), 1.)
+    return np.where((k < 0) | (k > N), 0., out)
+
+def coupled_strings(NEs_I, NEs_J, NOs, n_elec):
+    """ number of strings of category J coupled to one string of category
+        I by an operator moving at most n_elec electrons
+
+        A string of J differs from a string of I by d_x lost and
+        d_x + delta_x gained electrons in each space x, with delta the
+        occupation change from I to J. Counting the choices space by
+        space and convolving over spaces up to sum d_x <= n_elec gives
+        the exact count.
+
+    Args:
+        NEs_I: array like (N, NGAS), occupations of the source categories
+        NEs_J: array like (N, NGAS), occupations of the target categories
+        NOs: list of int, number of orbitals in each space
+        n_elec: int, maximal number of moved electrons
+
+    Returns:
+        numpy 1d float64 array (N,)
+    """
+    NEs_I = np.atleast_2d(NEs_I)
+    delta = np.atleast_2d(NEs_J) - NEs_I
+    holes = np.asarray(NOs) - NEs_I
+
+    # poly[:,d] counts strings reached with d electrons lost so far
+    poly = np.zeros(shape=(NEs_I.shape[0], n_elec+1))
+    poly[:,0] = 1
+    d = np.arange(n_elec+1)
+    for x in range(NEs_I.shape[1]):
+        terms = (_comb(NEs_I[:,x,None], d[None,:])*
+                 _comb(holes[:,x,None], d[None,:] + delta[:,x,None]))
+        new = np.zeros_like(poly)
+        for a in range(n_elec+1):
+            new[:,a:] += poly[:,a,None]*terms[:,:n_elec+1-a]
+        poly = new
+
+    return poly.sum(axis=1)
+
+class BlockSparsity(object):
+    """Predicted nonzeros, FLOPs and memory of the H blocks of an
+       UCIEngine, one entry per edge (I, J) of Cats['graph_2e']
+
+       nnz_1e counts the elements of a one electron operator, nnz_2e of
+       the full Hamiltonian. Per sigma vector a block of an operator costs
+           dense:       2*NCnfs[I]*NCnfs[J] FLOPs and the stored block
+           replacement: 2*nnz FLOPs and REPLACEMENT_ENTRY_BYTES per
+                        nonzero, with integrals gathered on the fly
+       The dense kernel is recommended when the density nnz over the
+       block size reaches dense_threshold and the block fits in
+       max_dense_bytes. Attributes without suffix are of the full
+       Hamiltonian, the ones with suffix _1e of a one electron operator,
+       whose blocks without nonzeros cost nothing.
+
+    Attributes:
+        I, J: numpy 1d int arrays, source and target categories
+        level: numpy 1d int8 array, see CategoryGraph2e
+        size: numpy 1d float64 array, NCnfs[I]*NCnfs[J]
+        nnz_1e, nnz_2e: numpy 1d float64 arrays, predicted nonzeros
+        flops_dense, flops_replacement: numpy 1d float64 arrays
+        mem_dense, mem_replacement: numpy 1d float64 arrays, bytes
+        dense: numpy 1d boolean array, recommended kernel is dense
+        flops_dense_1e, flops_replacement_1e: numpy 1d float64 arrays
+        mem_dense_1e, mem_replacement_1e: numpy 1d float64 arrays, bytes
+        dense_1e: numpy 1d boolean array
+    """
+    def __init__(self, CIEng, itemsize=8, dense_threshold=0.25,
+                 max_dense_bytes=2**27):
+        """
+        Args:
+            CIEng: UCIEngine with initialized categories
+            itemsize: int, bytes per matrix element, 16 for complex
+            dense_threshold: float, minimal density of a dense block
+            max_dense_bytes: int, maximal memory of a dense block
+        """
+        graph = CIEng.Cats['graph_2e']
+        NEs   = np.array(CIEng.Cats['NEs'])
+        NCnfs = np.array([float(n) for n in CIEng.Cats['NCnfs']])
+        self.NCnf = NCnfs.sum()
+        self.itemsize = itemsize
+
+        self.I, self.J, self.level = graph.edges()[:3]
+        self.size   = NCnfs[self.I]*NCnfs[self.J]
+        self.nnz_1e = NCnfs[self.I]*coupled_strings(NEs[self.I], NEs[self.J], CIEng.NOs, 1)
+        self.nnz_2e = NCnfs[self.I]*coupled_strings(NEs[self.I], NEs[self.J], CIEng.NOs, 2)
+
+        self.flops_dense = 2*self.size
+        self.mem_dense   = itemsize*self.size
+        self.flops_replacement = 2*self.nnz_2e
+        self.mem_replacement   = REPLACEMENT_ENTRY_BYTES*self.nnz_2e
+
+        self.dense = ((self.nnz_2e >= dense_threshold*self.size) &
+                      (self.mem_dense <= max_dense_bytes))
+
+        coupled_1e = self.nnz_1e > 0
+        self.flops_dense_1e = np.where(coupled_1e, self.flops_dense, 0.)
+        self.mem_dense_1e   = np.where(coupled_1e, self.mem_dense, 0.)
+        self.flops_replacement_1e = 2*self.nnz_1e
+        self.mem_replacement_1e   = REPLACEMENT_ENTRY_BYTES*self.nnz_1e
+
+        self.dense_1e = ((self.nnz_1e >= dense_threshold*self.size) &
+                         (self.mem_dense <= max_dense_bytes))
+
+        return
+
+    def block(self, I, J):
+        """ estimates of block (I, J) as dict """
+        k = np.flatnonzero((self.I == I) & (self.J == J))
+        assert k.shape[0] == 1, 'categories %i and %i are not coupled' %(I, J)
+        k = k[0]
+        block = {key:float(getattr(self, key)[k]) for key in
+                 ['size', 'nnz_1e', 'nnz_2e', 'flops_dense', 'mem_dense',
+                  'flops_replacement', 'mem_replacement',
+                  'flops_dense_1e', 'mem_dense_1e',
+                  'flops_replacement_1e', 'mem_replacement_1e']}
+        block['level']  = int(self.level[k])
+        block['kernel'] = 'dense' if self.dense[k] else 'replacement'
+        block['kernel_1e'] = 'dense' if self.dense_1e[k] else 'replacement'
+        return block
+
+    def totals(self):
+        """ whole calculation estimates per sigma vector, all blocks dense,
+            all as replacement lists and with the recommended kernels """
+        totals = {'NCnf':self.NCnf, 'nnz_1e':self.nnz_1e.sum(),
+                  'nnz_2e':self.nnz_2e.sum(),
+                  'density':self.nnz_2e.sum()/self.NCnf**2,
+                  'density_1e':self.nnz_1e.sum()/self.NCnf**2,
+                  'n_blocks':self.I.shape[0],
+                  'n_blocks_1e':int((self.nnz_1e > 0).sum())}
+        for suffix, d in [('', self.dense), ('_1e', self.dense_1e)]:
+            flops_dense = getattr(self, 'flops_dense'+suffix)
+            flops_repl  = getattr(self, 'flops_replacement'+suffix)
+            mem_dense   = getattr(self, 'mem_dense'+suffix)
+            mem_repl    = getattr(self, 'mem_replacement'+suffix)
+            totals.update({'n_dense_blocks'+suffix:int(d.sum()),
+                           'flops_dense'+suffix:flops_dense.sum(),
+                           'flops_replacement'+suffix:flops_repl.sum(),
+                           'flops'+suffix:flops_dense[d].sum() + flops_repl[~d].sum(),
+                           'mem_dense'+suffix:mem_dense.sum(),
+                           'mem_replacement'+suffix:mem_repl.sum(),
+                           'mem'+suffix:mem_dense[d].sum() + mem_repl[~d].sum()})
+        return totals
+
+    def report(self):
+        """ print the totals """
+        t = self.totals()
+        print('Configurations: %i' %t['NCnf'])
+        for op, suffix in [('2e', ''), ('1e', '_1e')]:
+            print('%s operator: blocks %i (%i dense), nonzeros %.4E, density %.4E'
+                  %(op, t['n_blocks'+suffix], t['n_dense_blocks'+suffix],
+                    t['nnz_'+op], t['density'+suffix]))
+            for label, key in [('all dense', '_dense'), ('all replacement', '_replacement'),
+                               ('recommended', '')]:
+                print('  %-16s FLOPs %.4E  memory %.4E GB'
+                      %(label, t['flops'+key+suffix], t['mem'+key+suffix]/2**30))
+        return t
@@ -4,17 +4,18 @@
 """
 
 import numpy as np
-from scipy.special import comb
+from math import comb, prod
 
 def compute_NConf_GHF_CAS(no,ne):
-    return int(comb(no,ne))
+    return comb(no,ne)
 
 def compute_NConf_RHF_CAS(no,ne):
-    return int(comb(no,int(ne/2)))**2
+    return comb(no,int(ne/2))**2
 
 def compute_NConf_GHF_GAS_Cat(nos,nes):
     assert len(nes) == len(nos)
-    return np.prod([int(comb(nos[i], nes[i])) for i in range(len(nes))])
+    if min(nes) < 0: return 0
+    return prod([comb(nos[i], nes[i]) for i in range(len(nes))])
 
 def compute_NConf_GHF_RAS(mh, me, nos, ne):
     assert len(nos) == 3
@@ -36,3 +37,115 @@ def compute_NConf_RHF_RAS(mh, me, nos, ne_a, ne_b):
    
     return NConfs
 
+
+# maximal excitation level of the GAS_excitations letters
+GAS_EXCITATION_LEVELS = {'S':1, 'D':2, 'T':3, 'Q':4}
+
+def hf_category(nos, ne):
+    """ electron occupancy of each space filled in order, as HF """
+    occ = []
+    for no in nos:
+        occ.append(min(no, ne))
+        ne -= occ[-1]
+    assert ne == 0
+    return occ
+
+def enumerate_GAS_categories(nos, ne, cat_ref=None, excitations='F',
+                             occ_restriction=None):
+    """ categories of a GAS specification, enumerated space by space with
+        pruning instead of filtering all occupations
+
+    Args:
+        nos: list of int, number of orbitals in each space
+        ne: int, total number of electrons
+        cat_ref: list of int, occupancy of the reference category,
+                 default as HF
+        excitations: 'F' (all), 'S', 'D', 'T', 'Q' or int as the maximal
+                     number of electrons moved away from cat_ref,
+                     or list of tuples (x_from, x_to) or
+                     (x_from, x_to, max_n), up to max_n (default 1)
+                     electrons moved from space x_from to x_to, applied
+                     on top of each other, every intermediate occupancy
+                     has to satisfy occ_restriction
+        occ_restriction: list of tuples (min, max) of the occupancy of
+                         each space, default as (0, nos[x])
+
+    Returns:
+        cats: list of list of int, unique categories, the reference
+              category first when it is inside occ_restriction
+    """
+    ngas = len(nos)
+    if cat_ref is None: cat_ref = hf_category(nos, ne)
+    assert len(cat_ref) == ngas and sum(cat_ref) == ne
+
+    if occ_restriction is None: occ_restriction = [(0, no) for no in nos]
+    assert len(occ_restriction) == ngas
+    lo = [max(0, r[0]) for r in occ_restriction]
+    hi = [min(nos[x], occ_restriction[x][1]) for x in range(ngas)]
+
+    if not isinstance(excitations, str) and not isinstance(excitations, int):
+        return _enumerate_GAS_moves(cat_ref, list(excitations), lo, hi)
+
+    if excitations in ['F', 'f']:
+        level = ne
+    elif isinstance(excitations, int):
+        level = excitations
+    else:
+        level = GAS_EXCITATION_LEVELS[excitations.upper()]
+
+    # bounds of the electrons left for the spaces after x
+    lo_rest = np.cumsum(([0] + lo[::-1]))[::-1].tolist()[1:] + [0]
+    hi_rest = np.cumsum(([0] + hi[::-1]))[::-1].tolist()[1:] + [0]
+
+    cats = []
+    occ  = [0]*ngas
+    def fill(x, ne_left, holes, particles):
+        if x == ngas:
+            cats.append(list(occ))
+            return
+        # largest occupancy first, so the aufbau-like categories lead
+        for n in range(min(hi[x], ne_left - lo_rest[x]),
+                       max(lo[x], ne_left - hi_rest[x]) - 1, -1):
+            h = holes + max(cat_ref[x] - n, 0)
+            p = particles + max(n - cat_ref[x], 0)
+            if h > level or p > level: continue
+            occ[x] = n
+            fill(x+1, ne_left - n, h, p)
+
+    fill(0, ne, 0, 0)
+    # the reference leads, also when it is not the aufbau-like occupancy
+    cat_ref = list(cat_ref)
+    if cat_ref in cats:
+        cats.remove(cat_ref)
+        cats.insert(0, cat_ref)
+
+    return cats
+
+def _enumerate_GAS_moves(cat_ref, moves, lo, hi):
+    """ categories reached by explicit moves, see enumerate_GAS_categories
+
+        The moves are applied breadth first to the distinct occupations
+        reached so far, an occupation outside the bounds lo and hi is
+        dropped at the move that produces it.
+    """
+    moves = [tuple(m) if len(m) == 3 else (m[0], m[1], 1) for m in moves]
+
+    level = [tuple(cat_ref)]
+    if any(cat_ref[x] < lo[x] or cat_ref[x] > hi[x] for x in range(len(cat_ref))):
+        level = []
+    for x_from, x_to, max_n in moves:
+        seen = set()
+        new  = []
+        for occ in level:
+            for n in range(0, min(max_n, occ[x_from] - lo[x_from],
+                                  hi[x_to] - occ[x_to]) + 1):
+                occ_n = list(occ)
+                occ_n[x_from] -= n
+                occ_n[x_to]   += n
+                occ_n = tuple(occ_n)
+                if occ_n in seen: continue
+                seen.add(occ_n)
+                new.append(occ_n)
+        level = new
+
+    return [list(occ) for occ in level]
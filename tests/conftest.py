@@ -0,0 +1,15 @@
+import os
+import sys
+
+import pytest
+
+# the modules of UCIEngine import each other by flat names
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), os.pardir, 'UCIEngine'))
+
+from integrals import random_integrals
+
+
+@pytest.fixture
+def rand_ints():
+    """ random_integrals(NO, seed=0) of the integrals module """
+    return random_integrals
@@ -0,0 +1,192 @@
+import os
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from gLog_tools import ParseCache
+from RASCIState_analyzer import RASCIStates, format_state_config_report, \
+                                _StateParser, iter_states, analyze_logs
+
+# CAS of 2 electrons in 4 spin orbitals, addresses 1..6 are
+# 1100 1010 1001 0110 0101 0011
+LOG = '''\
+ Gaussian header
+ CAS(  2,  4)
+ State:    1  Energy (Hartree):  -1.5000000000
+  (     1) ( 0.900000, 0.000000)  (     6) ( 0.300000, 0.100000)  (******) ( 0.200000, 0.000000)
+
+ State:    2  Energy (Hartree):  -1.2500000000
+  (     4) ( 0.100000, 0.700000)  (     2) (-0.600000, 0.000000)
+  (     3) ( 0.050000, 0.000000)
+
+ Normal termination
+'''
+
+
+@pytest.fixture
+def log(tmp_path):
+    filename = tmp_path / 'job.log'
+    filename.write_text(LOG)
+    return str(filename)
+
+
+def test_parse_states(log):
+    rasci = RASCIStates(log)
+    assert rasci.CAS_spec == [2, 4]
+    assert rasci.RAS_spec is None
+    assert rasci.energies == [-1.5, -1.25]
+
+    s1, s2 = rasci.states
+    assert s1.addrs.tolist() == [1, 6, -1]
+    assert s1.na.tolist() == [False, False, True]
+    assert np.allclose(s1.coeffs, [0.9, 0.3+0.1j, 0.2])
+    assert s2.addrs.tolist() == [4, 2, 3]
+    assert np.allclose(s2.coeffs, [0.1+0.7j, -0.6, 0.05])
+    assert rasci.coeffs[0] == {1:0.9+0j, 6:0.3+0.1j, 'na0':0.2+0j}
+
+
+def test_state_config_table(log):
+    rasci = RASCIStates(log)
+    table = rasci.state_config_table(threshold=0.01, orb_assign={'A':[1, 2], 'B':[3, 4]})
+
+    assert table['state'].tolist() == [1, 1, 1, 2, 2]
+    assert table['addr'].tolist() == [1, 6, -1, 4, 2]
+    assert np.allclose(table['weight'], [0.81, 0.1, 0.04, 0.5, 0.36])
+    assert table['config'][:2].tolist() == ['1100', '0011']
+    assert pd.isna(table['config'][2])
+    assert table['A'].tolist() == [2, 0, -1, 1, 1]
+    assert table['B'].tolist() == [0, 2, -1, 1, 1]
+
+
+def test_format_state_config_report(log):
+    rasci = RASCIStates(log)
+    orb_assign = {'A':[1, 2], 'B':[3, 4]}
+    table = rasci.state_config_table(threshold=0.01, orb_assign=orb_assign)
+    # group columns are looked up by name
+    table = table[['B', 'A'] + [c for c in table.columns if c not in 'AB']]
+    report = format_state_config_report(table, rasci.energies, rasci.CAS_spec,
+                                        rasci.RAS_spec, 0.01, orb_assign)
+    lines = report.splitlines()
+
+    assert 'State 1, Energy:        -1.5000000000' in lines
+    assert '  |       1>:  0.90000+ 0.00000i; |C|^2: 8.10000E-01;  A 2 B 0' in lines
+    assert '  |********>:  0.20000+ 0.00000i; |C|^2: 4.00000E-02 ' in lines
+    assert not any('-1>' in line for line in lines)
+
+    report = format_state_config_report(rasci.state_config_table(0.01), rasci.energies,
+                                        rasci.CAS_spec, rasci.RAS_spec, 0.01)
+    assert '  |       6>:  0.30000+ 0.10000i; |C|^2: 1.00000E-01; 0011' in report.splitlines()
+
+
+REAL_LOG = '''\
+ CAS(  2,  4)
+ RAS(  1,  1,  1,  1)
+ State:    1  Energy (Hartree):  -2.0000000000
+  (     2)  0.800000  (     5) -0.500000  (******)  0.100000  (     1)  0.050000
+  (     3)  0.010000
+
+ State:    2  Energy (Hartree):  -1.0000000000
+  (     4) -0.700000
+
+'''
+
+
+def test_state_parser_real_and_truncated(tmp_path):
+    filename = tmp_path / 'real.log'
+    filename.write_text(REAL_LOG)
+
+    parser = _StateParser(maxNCoeff=3)
+    states = list(iter_states(str(filename), parser=parser))
+    assert parser.CAS_spec == [2, 4] and parser.RAS_spec == [1, 1, 1, 1]
+    assert not parser.complex
+
+    assert [s.energy for s in states] == [-2.0, -1.0]
+    # only the first maxNCoeff coefficients of a state are kept
+    assert states[0].addrs.tolist() == [2, 5, -1]
+    assert states[0].na.tolist() == [False, False, True]
+    assert np.array_equal(states[0].coeffs, [0.8, -0.5, 0.1])
+    assert states[1].addrs.tolist() == [4]
+    assert np.array_equal(states[1].coeffs, [-0.7])
+
+    rasci = RASCIStates(str(filename), maxNCoeff=10)
+    assert [len(s) for s in rasci.states] == [5, 1]
+    assert np.array_equal(rasci.states[0].coeffs.imag, np.zeros(5))
+
+
+def test_state_parser_line_by_line():
+    """ states split over lines are completed by the empty line """
+    parser = _StateParser()
+    out = [parser.feed_line(line + '\n') for line in LOG.splitlines()]
+    states = [s for s in out if s is not None]
+    assert [s.energy for s in states] == [-1.5, -1.25]
+    # the empty lines after the coefficients
+    assert out[4] is states[0] and out[8] is states[1]
+    assert np.allclose(states[1].coeffs, [0.1+0.7j, -0.6, 0.05])
+
+
+def test_parse_cache_hit_and_invalidation(log, monkeypatch):
+    ref = RASCIStates(log)
+    RASCIStates(log, cache=True)
+    assert os.path.exists(os.path.join(log + '.uci_cache', 'meta.json'))
+
+    # a valid entry is loaded without parsing
+    def no_parse(self, filename, maxNCoeff):
+        pytest.fail('parsed again')
+    with monkeypatch.context() as m:
+        m.setattr(RASCIStates, '_readStates', no_parse)
+        cached = RASCIStates(log, cache=True)
+    assert cached.energies == ref.energies and cached.CAS_spec == ref.CAS_spec
+    for a, b in zip(cached.states, ref.states):
+        assert np.array_equal(a.addrs, b.addrs) and np.array_equal(a.coeffs, b.coeffs)
+    # another maxNCoeff is another entry
+    assert len(RASCIStates(log, maxNCoeff=2, cache=True).states[0]) == 2
+
+    # same size, newer mtime
+    stat = os.stat(log)
+    text = open(log).read().replace('-1.5000000000', '-1.7500000000')
+    open(log, 'w').write(text)
+    os.utime(log, ns=(stat.st_atime_ns, stat.st_mtime_ns + 10**9))
+    assert os.path.getsize(log) == stat.st_size
+    assert RASCIStates(log, cache=True).energies == [-1.75, -1.25]
+
+    # appended state, new size
+    with open(log, 'a') as f:
+        f.write(' State:    3  Energy (Hartree):  -1.0000000000\n'
+                '  (     5) ( 1.000000, 0.000000)\n\n')
+    assert RASCIStates(log, cache=True).energies == [-1.75, -1.25, -1.0]
+    with monkeypatch.context() as m:
+        m.setattr(RASCIStates, '_readStates', no_parse)
+        assert RASCIStates(log, cache=True).energies == [-1.75, -1.25, -1.0]
+
+
+def test_parse_cache_drops_stale_files(log):
+    RASCIStates(log, cache=True)
+    path = log + '.uci_cache'
+    npy = {f for f in os.listdir(path) if f.endswith('.npy')}
+    assert len(npy) > 0
+
+    with open(log, 'a') as f: f.write(' more output\n')
+    pcache = ParseCache(log)
+    assert pcache.meta['entries'] == {}
+    assert npy.isdisjoint(os.listdir(path))
+
+
+@pytest.mark.parametrize('nproc', [1, 2])
+def test_analyze_logs_isolates_failures(tmp_path, nproc):
+    (tmp_path / 'a.log').write_text(LOG)
+    (tmp_path / 'b.log').write_text(LOG.replace('-1.5000000000', '-1.6000000000'))
+    # a coefficient that is not a number, and a log without CAS
+    (tmp_path / 'c.log').write_text(LOG.replace('0.900000', '0.9x0000'))
+    (tmp_path / 'd.log').write_text(' nothing here\n')
+
+    table, errors = analyze_logs(str(tmp_path / '*.log'), threshold=0.01,
+                                 nproc=nproc, verbose=False)
+
+    assert sorted(errors) == [str(tmp_path / 'c.log'), str(tmp_path / 'd.log')]
+    assert all(isinstance(error, str) and error for error in errors.values())
+    assert table['file'].unique().tolist() == [str(tmp_path / 'a.log'),
+                                               str(tmp_path / 'b.log')]
+    b = table[table['file'] == str(tmp_path / 'b.log')]
+    assert b['energy'].unique().tolist() == [-1.6, -1.25]
+    assert b['addr'].tolist() == [1, 6, -1, 4, 2]
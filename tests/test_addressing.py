@@ -0,0 +1,42 @@
+import numpy as np
+import pytest
+
+from addressing import occupation_matrix, addressing_batch, addressing_array
+from bitstrings import occ_to_bits
+from base import UCIEngine
+from RAS_addressing import RASAddrEngine
+
+
+def test_occupation_matrix_packed():
+    occ = np.array([[1, 0, 1, 1, 0], [0, 1, 1, 0, 1]], dtype=np.uint8)
+    bits = occ_to_bits(occ)
+    assert np.array_equal(occupation_matrix(bits, 5, packed=True), occ)
+    assert np.array_equal(occupation_matrix(bits[:,0].astype(np.int64), 5, packed=True), occ)
+    assert np.array_equal(occupation_matrix(['10110', '01101']), occ)
+    # an occupation matrix with uint64 entries is not taken as packed
+    assert np.array_equal(occupation_matrix(occ.astype(np.uint64), 5), occ)
+    with pytest.raises(AssertionError):
+        occupation_matrix(bits[:,0], 5)
+
+
+def test_addressing_batch_packed():
+    Z = addressing_array(3, 6)
+    occ = np.array([[1, 1, 1, 0, 0, 0], [0, 0, 1, 1, 0, 1]], dtype=np.uint8)
+    assert np.array_equal(addressing_batch(occ_to_bits(occ), Z, packed=True),
+                          addressing_batch(occ, Z))
+
+
+def test_RAS_addressing_packed():
+    for GHF, kwargs in [(True, {}), (False, {'NElec_a':3})]:
+        R = RASAddrEngine(6, 6, 2, 2, 2, 2, GHF=GHF, **kwargs)
+        addrs = np.arange(1, R.NConfigs+1)
+        bits = R.de_addressing_batch(addrs, as_bits=True)
+        assert (R.addressing_batch(bits, packed=True) == addrs).all()
+
+
+def test_config_index_packed():
+    for GHF in (True, False):
+        U = UCIEngine([2, 3, 2], 4, 'GAS', GHF=GHF, GAS_excitations='D')
+        idx = np.arange(U.NCnf)
+        occ = U.config_strings(idx)
+        assert (U.config_index(occ_to_bits(occ), packed=True) == idx).all()
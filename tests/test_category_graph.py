@@ -0,0 +1,29 @@
+import pickle
+
+import numpy as np
+
+from base import UCIEngine
+from category_graph import CategoryGraph2e, CategoryLookup
+
+
+def test_graph_2e_built_on_first_access():
+    CIEng = UCIEngine([2, 3, 2], 4, 'GAS', GAS_excitations='D', Cat_order='rcm')
+    assert 'graph_2e' not in CIEng.Cats
+
+    NEs, NCnfs = CIEng.Cats['NEs'], CIEng.Cats['NCnfs']
+    ref = CategoryGraph2e(NEs, CIEng.NOs, NCnfs, CategoryLookup(NEs, CIEng.NOs))
+    graph = CIEng.Cats['graph_2e']
+    assert CIEng.Cats['graph_2e'] is graph
+    for a, b in zip(graph.edges(), ref.edges()):
+        assert np.array_equal(a, b)
+
+    # also after pickling, as for worker processes
+    CIEng = pickle.loads(pickle.dumps(UCIEngine([2, 3, 2], 4, 'GAS')))
+    assert 'graph_2e' not in CIEng.Cats
+    assert CIEng.Cats['graph_2e'].NCat == CIEng.NCat
+
+
+def test_spin_engines_skip_graph_2e():
+    CIEng = UCIEngine([2, 2, 2], 6, 'GAS', GHF=False)
+    assert 'graph_2e' not in CIEng.Alpha.Cats
+    assert 'graph_2e' not in CIEng.Beta.Cats
@@ -0,0 +1,139 @@
+import numpy as np
+import pytest
+
+from davidson import davidson
+from civector import MemmapCIVectorStore
+from base import UCIEngine
+from sigma import SigmaEngine
+
+
+def rand_H(n, seed=0):
+    rng = np.random.default_rng(seed)
+    H = rng.normal(size=(n, n))*0.1
+    H = 0.5*(H + H.T) + np.diag(np.arange(n, dtype=np.float64))
+    return H
+
+
+def dense_sigma(H):
+    def sigma(C, out=None):
+        if out is None: return H @ C
+        out += H @ C
+        return out
+    return sigma
+
+
+class Crash(Exception):
+    pass
+
+
+def test_collapse_crash_restart(tmp_path):
+    """ a crash after the collapse rotated the subspace, before the next
+        checkpoint, restarts from intact vectors """
+    H = rand_H(60)
+    PSt, NCnfs = [0, 20, 40], [20, 20, 20]
+    ref = np.linalg.eigvalsh(H)[:2]
+
+    store = MemmapCIVectorStore(str(tmp_path), PSt, NCnfs, nvec=8)
+    sigma = dense_sigma(H)
+    switch = store.switch
+    def crash_sigma(C, out=None):
+        if store.slot == 1: raise Crash()
+        return sigma(C, out)
+    def checked_switch():
+        # the vectors of the checkpoint are untouched by the collapse
+        ckpt = store.load_checkpoint()
+        V = np.array(store.V[:int(ckpt['nvec'])])
+        assert np.allclose(V @ V.T, np.eye(V.shape[0]))
+        switch()
+    store.switch = checked_switch
+
+    with pytest.raises(Crash):
+        davidson(crash_sigma, np.diag(H), nroots=2, store=store, verbose=False)
+    ckpt = store.load_checkpoint()
+    assert int(ckpt['slot']) == 0
+    del store
+
+    store = MemmapCIVectorStore(str(tmp_path), PSt, NCnfs, nvec=8, restart=True)
+    V = np.array(store.V[:int(ckpt['nvec'])])
+    assert np.allclose(V @ V.T, np.eye(V.shape[0]))
+    energies, X, info = davidson(sigma, np.diag(H), nroots=2, store=store,
+                                 restart=True, verbose=False, max_iter=200)
+    assert all(info['converged'])
+    assert np.allclose(energies, ref, atol=1e-7)
+    assert store.slot == int(store.load_checkpoint()['slot'])
+
+
+@pytest.mark.parametrize('nproc', [1, 2])
+def test_davidson_sigma_engine(nproc, rand_ints):
+    CIEng = UCIEngine([2, 3, 3], 4, 'GAS', GAS_excitations='D')
+    h1e, h2e = rand_ints(CIEng.NO)
+    sigma_eng = SigmaEngine(CIEng, h1e, h2e, nproc=nproc)
+
+    H = np.array([sigma_eng.sigma(e) for e in np.eye(CIEng.NCnf)]).T
+    assert np.allclose(H, H.T)
+    ref = np.linalg.eigvalsh(H)[:3]
+
+    energies, X, info = davidson(sigma_eng.sigma, sigma_eng.diagonal(), nroots=3,
+                                 max_vecs=12, max_iter=200, verbose=False)
+    sigma_eng.close()
+    assert all(info['converged'])
+    assert np.allclose(energies, ref, atol=1e-7)
+    assert np.allclose(X @ X.T, np.eye(3), atol=1e-8)
+
+
+def test_davidson_chunked_store(tmp_path):
+    """ several chunks per vector and collapses give the in memory result """
+    H = rand_H(60, seed=3)
+    PSt, NCnfs = list(range(0, 60, 6)), [6]*10
+    sigma = dense_sigma(H)
+    ref = np.linalg.eigvalsh(H)[:3]
+
+    e_mem, X_mem, info_mem = davidson(sigma, np.diag(H), nroots=3, max_vecs=9,
+                                      max_iter=300, verbose=False)
+    store = MemmapCIVectorStore(str(tmp_path), PSt, NCnfs, nvec=9, chunk_bytes=100)
+    assert len(store.chunks()) > 1
+    e, X, info = davidson(sigma, np.diag(H), nroots=3, store=store,
+                          max_iter=300, verbose=False)
+
+    assert all(info['converged']) and all(info_mem['converged'])
+    assert np.allclose(e, ref, atol=1e-7) and np.allclose(e_mem, ref, atol=1e-7)
+    assert isinstance(X, np.memmap)
+    assert np.allclose(np.abs(np.sum(X*X_mem, axis=1)), 1, atol=1e-6)
+    assert np.allclose(X @ H @ X.T, np.diag(e), atol=1e-6)
+
+
+def test_davidson_restart_without_iterations(tmp_path):
+    """ a restart at max_iter or after convergence returns the vectors
+        of the restored subspace and counts the earlier iterations """
+    H = rand_H(40, seed=4)
+    PSt, NCnfs = [0, 20], [20, 20]
+    sigma = dense_sigma(H)
+    ref = np.linalg.eigvalsh(H)[:2]
+
+    store = MemmapCIVectorStore(str(tmp_path), PSt, NCnfs, nvec=10)
+    e, X, info = davidson(sigma, np.diag(H), nroots=2, store=store, max_iter=3,
+                          verbose=False)
+    assert info['iterations'] == 3 and not all(info['converged'])
+    X = np.array(X)
+
+    store = MemmapCIVectorStore(str(tmp_path), PSt, NCnfs, nvec=10, restart=True)
+    e_r, X_r, info_r = davidson(sigma, np.diag(H), nroots=2, store=store,
+                                max_iter=3, restart=True, verbose=False)
+    assert info_r['iterations'] == 3 and info_r['history'] == []
+    assert np.allclose(e_r, e)
+    assert np.allclose(np.abs(np.sum(X_r*X, axis=1)), 1, atol=1e-8)
+
+    store = MemmapCIVectorStore(str(tmp_path), PSt, NCnfs, nvec=10, restart=True)
+    e, X, info = davidson(sigma, np.diag(H), nroots=2, store=store,
+                          max_iter=200, restart=True, verbose=False)
+    assert all(info['converged']) and np.allclose(e, ref, atol=1e-7)
+    n_iter = info['iterations']
+    assert n_iter == 3 + len(info['history'])
+
+    store = MemmapCIVectorStore(str(tmp_path), PSt, NCnfs, nvec=10, restart=True)
+    e_r, X_r, info_r = davidson(sigma, np.diag(H), nroots=2, store=store,
+                                max_iter=200, restart=True, verbose=False)
+    assert all(info_r['converged']) and info_r['iterations'] == n_iter
+    assert info_r['history'] == []
+    assert np.allclose(e_r, e)
+    assert np.allclose(np.abs(np.sum(X_r*X, axis=1)), 1, atol=1e-6)
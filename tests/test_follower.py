@@ -0,0 +1,39 @@
+import threading
+import time
+
+from RASCIState_analyzer import RASCIFollower
+
+
+def test_poll_last_read(tmp_path):
+    log = tmp_path / 'job.log'
+    follower = RASCIFollower(str(log))
+    assert follower.poll() == [] and follower.last_read == 0
+
+    log.write_bytes(b' Entering Link 1\n partial')
+    follower.poll()
+    assert follower.last_read == 25
+    follower.poll()
+    assert follower.last_read == 0
+
+
+def test_follow_idle_resets_on_new_bytes(tmp_path):
+    """ output without completed states keeps the follower alive """
+    log = tmp_path / 'job.log'
+    log.write_bytes(b'')
+    duration = 0.4
+
+    def writer():
+        t_end = time.time() + duration
+        while time.time() < t_end:
+            with open(log, 'ab') as f: f.write(b' Iteration\n')
+            time.sleep(0.02)
+
+    thread = threading.Thread(target=writer)
+    t0 = time.time()
+    thread.start()
+    states = RASCIFollower(str(log)).follow(interval=0.01, timeout=0.1)
+    elapsed = time.time() - t0
+    thread.join()
+
+    assert states == []
+    assert elapsed >= duration
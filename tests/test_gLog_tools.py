@@ -0,0 +1,104 @@
+import json
+import os
+import re
+
+import numpy as np
+import pytest
+
+from gLog_tools import read_matrix, LogIndex
+
+
+def write_matrix(f, title, M, fmt='full'):
+    """ M printed as Gaussian does, panels of five columns and
+        Fortran D exponents """
+    n, m = M.shape
+    f.write(title + '\n')
+    for c0 in range(0, m, 5):
+        cols = range(c0, min(c0+5, m))
+        f.write(' '*16 + ''.join('%14i' %(c+1) for c in cols) + '\n')
+        for r in range(n):
+            if fmt == 'lt' and r < c0: continue
+            values = ['%15.6E' %M[r,c] for c in cols if fmt != 'lt' or c <= r]
+            f.write('%7i         ' %(r+1) + ''.join(values).replace('E', 'D') + '\n')
+
+
+@pytest.fixture
+def matrices(tmp_path):
+    rng = np.random.default_rng(0)
+    mats = {'     A:':(rng.normal(size=(12, 12)), 'full'),
+            '     B:':(rng.normal(size=(7, 9)), 'full'),
+            '     S:':(rng.normal(size=(11, 11)), 'lt')}
+    log = tmp_path / 'job.log'
+    with open(log, 'w') as f:
+        f.write(' Gaussian header\n\n')
+        for title, (M, fmt) in mats.items():
+            f.write(' some text before\n')
+            write_matrix(f, title, M, fmt)
+            f.write(' Leave Link\n')
+    return str(log), mats
+
+
+def test_read_matrix(matrices):
+    log, mats = matrices
+    A = mats['     A:'][0]
+    assert np.allclose(read_matrix(log, '     A:'), A, atol=1e-6)
+    assert np.allclose(read_matrix(log, '     A:', 'ut'), np.triu(A), atol=1e-6)
+
+    # more columns than rows
+    B = mats['     B:'][0]
+    assert np.allclose(read_matrix(log, '     B:'), B, atol=1e-6)
+
+    S = mats['     S:'][0]
+    assert np.allclose(read_matrix(log, '     S:', 'lt'), np.tril(S), atol=1e-6)
+    assert np.isnan(read_matrix(log, '     S:')).sum() == 11*10//2
+
+
+def test_read_matrix_missing(matrices):
+    log, _ = matrices
+    assert read_matrix(log, '     X:') is None
+
+
+def test_log_index_sidecar(matrices, monkeypatch):
+    log, mats = matrices
+    data = open(log, 'rb').read()
+
+    index = LogIndex(log)
+    assert os.path.exists(log + '.idx')
+    for title in mats:
+        offset = index.first(title, full_line=True)
+        assert data[offset:].startswith(title.encode() + b'\n')
+    assert index.first(' Leave Link') == data.index(b' Leave Link')
+    assert index.offsets(' Leave Link') == [m.start() for m in
+                                            re.finditer(b'^ Leave Link', data, re.M)]
+    assert index.first(' not there') is None
+
+    # the sidecar is reused, keys found later included
+    monkeypatch.setattr(LogIndex, '_build', lambda self, headers: pytest.fail('rebuilt'))
+    monkeypatch.setattr(LogIndex, '_scan', lambda self, pattern: pytest.fail('rescanned'))
+    index = LogIndex(log)
+    assert index.first(' Leave Link') == data.index(b' Leave Link')
+    assert index.first('     B:', full_line=True) == data.index(b'     B:')
+    monkeypatch.undo()
+
+    # reading through the index gives the same matrices
+    for title, (M, fmt) in mats.items():
+        assert np.array_equal(read_matrix(log, title, fmt, index=True),
+                              read_matrix(log, title, fmt), equal_nan=True)
+
+
+def test_log_index_stale_sidecar(matrices):
+    log, mats = matrices
+    index = LogIndex(log)
+    offset = index.first('     A:', full_line=True)
+
+    # a changed log is scanned again
+    with open(log, 'r+') as f:
+        text = f.read()
+        f.seek(0)
+        f.write(' one more line\n' + text)
+    stat = os.stat(log)
+    os.utime(log, ns=(stat.st_atime_ns, stat.st_mtime_ns + 10**9))
+
+    index = LogIndex(log)
+    assert index.first('     A:', full_line=True) == offset + len(' one more line\n')
+    assert json.load(open(log + '.idx'))['size'] == os.path.getsize(log)
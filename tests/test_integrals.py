@@ -0,0 +1,65 @@
+import numpy as np
+import pytest
+from integrals import GASIntegrals
+
+def write_fcidump(filename, h1e, h2e, ecore, orb_energies=None):
+    NO = h1e.shape[0]
+    with open(filename, 'w') as f:
+        f.write(' &FCI NORB=%i,NELEC=2,MS2=0,\n  ORBSYM=%s\n  ISYM=1,\n &END\n'
+                %(NO, '1,'*NO))
+        for p in range(NO):
+            for q in range(p+1):
+                for r in range(NO):
+                    for s in range(r+1):
+                        if p*(p+1)//2 + q >= r*(r+1)//2 + s:
+                            f.write('%23.16E %3i %3i %3i %3i\n' %(h2e[p,q,r,s], p+1, q+1, r+1, s+1))
+        for p in range(NO):
+            for q in range(p+1):
+                f.write('%23.16E %3i %3i   0   0\n' %(h1e[p,q], p+1, q+1))
+        if orb_energies is not None:
+            for p in range(NO):
+                f.write('%23.16E %3i   0   0   0\n' %(orb_energies[p], p+1))
+        f.write('%23.16E   0   0   0   0\n' %ecore)
+
+@pytest.mark.parametrize('NOs', [[5], [2, 3], [1, 2, 2]])
+def test_from_dense_blocks(NOs, rand_ints):
+    h1e, h2e = rand_ints(sum(NOs))
+    ints = GASIntegrals.from_dense(NOs, h1e, h2e)
+    M = sum(NOs)*(sum(NOs)+1)//2
+    assert ints.eri.shape == (M*(M+1)//2,)
+    assert np.array_equal(ints.to_dense(), h2e)
+    B = ints.bounds
+    for x in range(len(NOs)):
+        for y in range(len(NOs)):
+            assert np.array_equal(ints.block(x, y, x, y),
+                                  h2e[B[x]:B[x+1],B[y]:B[y+1],B[x]:B[x+1],B[y]:B[y+1]])
+
+def test_save_load(tmp_path, rand_ints):
+    h1e, h2e = rand_ints(5)
+    ints = GASIntegrals.from_dense([2, 3], h1e, h2e, ecore=1.5)
+    ints.save(str(tmp_path/'ints.bin'))
+    loaded = GASIntegrals.load(str(tmp_path/'ints.bin'))
+    assert isinstance(loaded.eri, np.memmap)
+    assert np.array_equal(loaded.to_dense(), h2e)
+    assert np.array_equal(loaded.h1e, h1e)
+    assert loaded.ecore == 1.5
+
+def test_fcidump_orbital_energies(tmp_path, rand_ints):
+    h1e, h2e = rand_ints(4, seed=1)
+    eps = np.arange(1., 5.)
+    write_fcidump(str(tmp_path/'FCIDUMP'), h1e, h2e, 2.25, eps)
+    ints = GASIntegrals.from_fcidump(str(tmp_path/'FCIDUMP'), [2, 2])
+    assert np.allclose(ints.h1e, h1e)
+    assert np.allclose(ints.to_dense(), h2e)
+    assert np.allclose(ints.orb_energies, eps)
+    assert ints.ecore == 2.25
+
+    ints.save(str(tmp_path/'ints.bin'))
+    assert np.allclose(GASIntegrals.load(str(tmp_path/'ints.bin')).orb_energies, eps)
+
+def test_fcidump_without_orbital_energies(tmp_path, rand_ints):
+    h1e, h2e = rand_ints(3, seed=2)
+    write_fcidump(str(tmp_path/'FCIDUMP'), h1e, h2e, 0.5)
+    ints = GASIntegrals.from_fcidump(str(tmp_path/'FCIDUMP'))
+    assert np.allclose(ints.h1e, h1e)
+    assert ints.orb_energies is None
@@ -0,0 +1,66 @@
+import numpy as np
+import pytest
+
+from base import UCIEngine
+from sigma import SigmaEngine
+from civector import SharedCIVector
+
+
+@pytest.fixture
+def engines(rand_ints):
+    CIEng = UCIEngine([2, 3, 3], 4, 'GAS', GAS_excitations='D')
+    h1e, h2e = rand_ints(CIEng.NO)
+    serial = SigmaEngine(CIEng, h1e, h2e)
+    pooled = SigmaEngine(CIEng, h1e, h2e, nproc=2)
+    yield CIEng, serial, pooled
+    pooled.close()
+
+
+def test_pooled_sigma(engines):
+    CIEng, serial, pooled = engines
+    rng = np.random.default_rng(1)
+    for _ in range(2):
+        # the pool and shared buffers are reused by the second call
+        C = rng.normal(size=(CIEng.NCnf,))
+        assert np.allclose(pooled.sigma(C), serial.sigma(C))
+
+    out = rng.normal(size=(CIEng.NCnf,))
+    ref = out + serial.sigma(C)
+    assert pooled.sigma(C, out=out) is out
+    assert np.allclose(out, ref)
+
+
+def test_pooled_sigma_shared_input(engines):
+    CIEng, serial, pooled = engines
+    C = np.random.default_rng(2).normal(size=(CIEng.NCnf,))
+    with SharedCIVector.from_engine(CIEng) as C_shared:
+        C_shared.vector(0)[:] = C
+        assert np.allclose(pooled.sigma(C_shared), serial.sigma(C))
+        # used in place, not copied
+        assert pooled._shared_C is None
+        assert pooled._shared_out.nvec == 1
+        assert np.allclose(serial.sigma(C_shared), serial.sigma(C))
+        # the input is not modified
+        assert np.array_equal(C_shared.vector(0), C)
+
+
+@pytest.mark.parametrize('nparts', [1, 2, 3, 5])
+def test_owned_tasks(engines, nparts):
+    """ every category written by exactly one owner, the owned tasks
+        together give the serial sigma """
+    CIEng, serial, _ = engines
+    bins = serial.owned_tasks(nparts)
+    assert len(bins) <= nparts
+
+    written = []
+    for tasks in bins:
+        cats = {task[1] for task in tasks if task[0] == '1e'}
+        assert all(set(task[2]) <= cats for task in tasks if task[0] == '2e')
+        written.extend(cats)
+    assert sorted(written) == list(range(CIEng.NCat))
+
+    C = np.random.default_rng(3).normal(size=(CIEng.NCnf,))
+    out = np.zeros(CIEng.NCnf)
+    for tasks in bins:
+        for task in tasks: serial.run_task(task, C, out)
+    assert np.allclose(out, serial.sigma(C))
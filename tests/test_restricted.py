@@ -0,0 +1,80 @@
+import itertools
+
+import numpy as np
+import pytest
+
+from base import UCIEngine
+from RAS_addressing import RASAddrEngine
+from utils import compute_NConf_RHF_RAS
+
+
+@pytest.mark.parametrize('NOs, NE, NE_a', [([2, 2, 2], 6, 3), ([2, 2], 5, 4),
+                                           ([3], 4, 3), ([2, 2], 8, 4)])
+def test_restricted_engine_roundtrip(NOs, NE, NE_a):
+    """ includes a filled alpha shell, NE_a == NO """
+    U = UCIEngine(NOs, NE, 'GAS', GHF=False, NE_a=NE_a)
+    idx = np.arange(U.NCnf)
+    occ = U.config_strings(idx)
+    assert len({o.tobytes() for o in occ}) == U.NCnf
+    assert (U.config_index(occ) == idx).all()
+    assert (occ[:,:U.NO].sum(axis=1) == NE_a).all()
+    assert (occ[:,U.NO:].sum(axis=1) == NE - NE_a).all()
+
+
+@pytest.mark.parametrize('NE, NE_a', [(5, 5), (5, 2), (3, 4)])
+def test_restricted_engine_bad_spins(NE, NE_a):
+    with pytest.raises(ValueError):
+        UCIEngine([2, 2], NE, 'GAS', GHF=False, NE_a=NE_a)
+
+
+@pytest.mark.parametrize('NElec, NElec_a', [(6, 3), (6, 4), (8, 4)])
+def test_restricted_RAS_roundtrip(NElec, NElec_a):
+    R = RASAddrEngine(4, NElec, 0, 0, 0, 0, GHF=False, NElec_a=NElec_a)
+    addrs = np.arange(1, R.NConfigs+1)
+    occ = R.de_addressing_batch(addrs)
+    assert len({o.tobytes() for o in occ}) == R.NConfigs
+    assert (R.addressing_batch(occ) == addrs).all()
+
+
+def brute_RAS(NOrb, NElec_a, NElec_b, MxHole, NORAS1, MxElec, NORAS3):
+    """ alpha and beta occupations whose holes in RAS1 and electrons in
+        RAS3 summed over both spins are within the limits """
+    def strings(ne):
+        for orbs in itertools.combinations(range(NOrb), ne):
+            occ = np.zeros(NOrb, dtype=np.int8)
+            occ[list(orbs)] = 1
+            yield occ
+    configs = set()
+    for occ_a in strings(NElec_a):
+        for occ_b in strings(NElec_b):
+            tot = occ_a + occ_b
+            if (2*NORAS1 - tot[:NORAS1].sum() <= MxHole and
+                tot[NOrb-NORAS3:].sum() <= MxElec):
+                configs.add(np.concatenate([occ_a, occ_b]).tobytes())
+    return configs
+
+
+@pytest.mark.parametrize('NOrb, NElec, MxHole, NORAS1, MxElec, NORAS3, NElec_a',
+                         [(6, 6, 2, 2, 2, 2, 3), (6, 5, 1, 2, 2, 2, 3),
+                          (7, 6, 2, 3, 1, 2, 3), (5, 4, 0, 2, 2, 2, 2)])
+def test_restricted_RAS_limits(NOrb, NElec, MxHole, NORAS1, MxElec, NORAS3, NElec_a):
+    R = RASAddrEngine(NOrb, NElec, MxHole, NORAS1, MxElec, NORAS3,
+                      GHF=False, NElec_a=NElec_a)
+    NElec_b = NElec - NElec_a
+    assert R.NConfigs == compute_NConf_RHF_RAS(MxHole, MxElec, R.NORAS, NElec_a, NElec_b)
+
+    addrs = np.arange(1, R.NConfigs+1)
+    occ = R.de_addressing_batch(addrs).astype(np.int8)
+    assert {o.tobytes() for o in occ} == brute_RAS(NOrb, NElec_a, NElec_b, MxHole,
+                                                   NORAS1, MxElec, NORAS3)
+    assert (R.addressing_batch(occ) == addrs).all()
+    bits = R.de_addressing_batch(addrs, as_bits=True)
+    assert (R.addressing_batch(bits, packed=True) == addrs).all()
+
+
+@pytest.mark.parametrize('NElec, RAS1, kwargs', [(5, 2, {'NElec_a':4}),
+                                                 (5, 0, {'NElec_a':4, 'NElec_b':2}),
+                                                 (6, 0, {'NElec_a':5})])
+def test_restricted_RAS_bad_spins(NElec, RAS1, kwargs):
+    with pytest.raises(ValueError):
+        RASAddrEngine(4, NElec, 0, RAS1, 0, 0, GHF=False, **kwargs)
@@ -0,0 +1,56 @@
+import numpy as np
+import pytest
+
+from base import UCIEngine
+from sigma import SigmaEngine
+from integrals import GASIntegrals
+
+
+def apply_ops(occ, ops):
+    """ string and sign of a product of creation (True) and
+        annihilation (False) operators, applied right to left """
+    occ = occ.copy()
+    sign = 1
+    for orb, create in reversed(ops):
+        if create == bool(occ[orb]): return None, 0
+        sign *= (-1)**int(occ[:orb].sum())
+        occ[orb] = create
+    return occ, sign
+
+
+def slater_condon_H(CIEng, h1e, h2e):
+    """ explicit H over the strings of the categories in address order """
+    strings = np.vstack([CIEng.cat_strings(NEs) for NEs in CIEng.Cats['NEs']])
+    index = {s.tobytes():i for i, s in enumerate(strings)}
+    NO = CIEng.NO
+    H = np.zeros((strings.shape[0],)*2)
+    for j, s in enumerate(strings):
+        for p in range(NO):
+            for q in range(NO):
+                t, sign = apply_ops(s, [(p, True), (q, False)])
+                if t is not None and t.tobytes() in index:
+                    H[index[t.tobytes()], j] += sign*h1e[p,q]
+                for r in range(NO):
+                    for u in range(NO):
+                        t, sign = apply_ops(s, [(p, True), (r, True), (u, False), (q, False)])
+                        if t is not None and t.tobytes() in index:
+                            H[index[t.tobytes()], j] += 0.5*sign*h2e[p,q,r,u]
+    return H
+
+
+@pytest.mark.parametrize('NOs, NE, excitations', [([6], 3, 'F'),
+                                                  ([2, 3, 2], 3, 'D'),
+                                                  ([2, 2, 3], 4, 'S')])
+@pytest.mark.parametrize('packed', [False, True])
+def test_sigma_slater_condon(NOs, NE, excitations, packed, rand_ints):
+    CIEng = UCIEngine(NOs, NE, 'GAS', GAS_excitations=excitations)
+    h1e, h2e = rand_ints(CIEng.NO)
+    H = slater_condon_H(CIEng, h1e, h2e)
+    assert H.shape == (CIEng.NCnf,)*2
+
+    ints = GASIntegrals.from_dense(NOs, h1e, h2e) if packed else h2e
+    sigma_eng = SigmaEngine(CIEng, h1e, ints)
+    assert np.allclose(sigma_eng.diagonal(), np.diag(H))
+
+    C = np.random.default_rng(1).normal(size=(CIEng.NCnf,))
+    assert np.allclose(sigma_eng.sigma(C), H @ C)
@@ -0,0 +1,74 @@
+import itertools
+
+import numpy as np
+import pytest
+
+from base import UCIEngine
+from sigma import SigmaEngine
+from sparsity import compute_matrix_sparcity, coupled_strings, BlockSparsity
+
+
+def test_matrix_sparcity_notebook_values():
+    assert np.isclose(compute_matrix_sparcity([10], [5], [(0, 0)]), 0.8968253968253969)
+    assert np.isclose(compute_matrix_sparcity([6], [3], [(0, 0)]), 0.5)
+
+
+def test_matrix_sparcity_all_spaces_involved():
+    with pytest.raises(AssertionError):
+        compute_matrix_sparcity([3, 3], [2, 1], [(0, 0)])
+    # the exact count has no such restriction
+    assert compute_matrix_sparcity([3, 3], [2, 1], [(0, 0)], exact=True) < 1
+
+
+def strings(NOs, NEs):
+    """ occupations of a category as sets of orbitals """
+    bounds = np.cumsum([0] + list(NOs))
+    spaces = [itertools.combinations(range(bounds[x], bounds[x+1]), NEs[x])
+              for x in range(len(NOs))]
+    return [set(sum(s, ())) for s in itertools.product(*spaces)]
+
+
+@pytest.mark.parametrize('NOs, NEs, Excitations', [([6], [3], [(0, 0)]),
+                                                   ([3, 3], [1, 2], [(0, 1)]),
+                                                   ([3, 3], [1, 2], [(0, 1), (1, 1)]),
+                                                   ([2, 3, 2], [1, 1, 2], [(0, 2), (1, 0)])])
+def test_matrix_sparcity_exact(NOs, NEs, Excitations):
+    NEs_L = list(NEs)
+    for x_lose, x_gain in Excitations:
+        NEs_L[x_lose] += 1
+        NEs_L[x_gain] -= 1
+    ref = strings(NOs, NEs_L)[0]
+    K = strings(NOs, NEs)
+    nnz = sum(len(ref - s) <= len(Excitations) for s in K)
+
+    assert np.isclose(coupled_strings([NEs_L], [NEs], NOs, len(Excitations))[0], nnz)
+    assert np.isclose(compute_matrix_sparcity(NOs, NEs, Excitations, exact=True),
+                      1 - nnz/len(K))
+
+
+@pytest.mark.parametrize('NOs, NE, excitations', [([2, 3, 2], 3, 'D'),
+                                                  ([2, 3, 3], 4, 'S')])
+def test_block_sparsity_explicit_H(NOs, NE, excitations, rand_ints):
+    """ generic integrals have no accidental zeros, the nonzeros of the
+        explicit H blocks are the predicted ones """
+    CIEng = UCIEngine(NOs, NE, 'GAS', GAS_excitations=excitations)
+    h1e, h2e = rand_ints(CIEng.NO)
+    E = np.eye(CIEng.NCnf)
+    H_2e = np.array([SigmaEngine(CIEng, h1e, h2e).sigma(e) for e in E]).T
+    H_1e = np.array([SigmaEngine(CIEng, h1e, 0*h2e).sigma(e) for e in E]).T
+
+    sp = BlockSparsity(CIEng)
+    PSt, NCnfs = CIEng.Cats['PSt'], CIEng.Cats['NCnfs']
+    blocks = lambda I, J: (slice(PSt[J], PSt[J]+NCnfs[J]), slice(PSt[I], PSt[I]+NCnfs[I]))
+    for k, (I, J) in enumerate(zip(sp.I, sp.J)):
+        assert sp.nnz_2e[k] == np.count_nonzero(np.abs(H_2e[blocks(I, J)]) > 1e-12)
+        assert sp.nnz_1e[k] == np.count_nonzero(np.abs(H_1e[blocks(I, J)]) > 1e-12)
+    assert sp.nnz_2e.sum() == np.count_nonzero(np.abs(H_2e) > 1e-12)
+    assert sp.nnz_1e.sum() == np.count_nonzero(np.abs(H_1e) > 1e-12)
+
+    t = sp.totals()
+    assert t['flops_replacement_1e'] == 2*t['nnz_1e']
+    assert t['flops_1e'] <= t['flops']
+    assert t['n_blocks_1e'] == np.count_nonzero(sp.nnz_1e)
+    block = sp.block(sp.I[0], sp.J[0])
+    assert block['flops_replacement_1e'] == 2*block['nnz_1e']
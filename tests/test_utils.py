@@ -0,0 +1,94 @@
+import itertools
+import random
+
+import pytest
+
+from utils import enumerate_GAS_categories, hf_category, GAS_EXCITATION_LEVELS
+
+
+def brute_moves(cat_ref, moves, lo, hi):
+    """ every combination of move counts, kept when all intermediate
+        occupations are inside the bounds """
+    moves = [tuple(m) if len(m) == 3 else (m[0], m[1], 1) for m in moves]
+    inside = lambda occ: all(lo[x] <= occ[x] <= hi[x] for x in range(len(occ)))
+    cats = []
+    for ns in itertools.product(*[range(m[2]+1) for m in moves]):
+        occ = list(cat_ref)
+        ok = inside(occ)
+        for (x_from, x_to, _), n in zip(moves, ns):
+            occ[x_from] -= n
+            occ[x_to]   += n
+            ok = ok and inside(occ)
+        if ok and occ not in cats: cats.append(occ)
+    return cats
+
+
+@pytest.mark.parametrize('seed', range(5))
+def test_GAS_moves_brute(seed):
+    rng = random.Random(seed)
+    for _ in range(200):
+        ngas = rng.randint(2, 4)
+        nos  = [rng.randint(1, 4) for _ in range(ngas)]
+        ne   = rng.randint(1, sum(nos))
+        moves = []
+        for _ in range(rng.randint(1, 4)):
+            x_from, x_to = rng.sample(range(ngas), 2)
+            moves.append((x_from, x_to) if rng.random() < 0.5 else
+                         (x_from, x_to, rng.randint(1, 3)))
+        restriction = [(rng.randint(0, 1), rng.randint(no-1, no)) for no in nos]
+        lo = [r[0] for r in restriction]
+        hi = [min(no, r[1]) for no, r in zip(nos, restriction)]
+
+        cat_ref = hf_category(nos, ne)
+        cats = enumerate_GAS_categories(nos, ne, cat_ref, moves, restriction)
+        assert cats == brute_moves(cat_ref, moves, lo, hi)
+        assert all(sum(c) == ne for c in cats)
+
+
+def test_GAS_moves_reference_first():
+    cats = enumerate_GAS_categories([2, 2, 2], 2, None, [(0, 1, 2), (1, 2)])
+    assert cats[0] == [2, 0, 0]
+    assert sorted(cats) == sorted([[2, 0, 0], [1, 1, 0], [0, 2, 0], [1, 0, 1],
+                                   [0, 1, 1]])
+
+
+def brute_level(nos, ne, cat_ref, level, lo, hi):
+    """ occupations within the bounds with at most level holes and
+        level particles relative to cat_ref """
+    cats = []
+    for occ in itertools.product(*[range(lo[x], hi[x]+1) for x in range(len(nos))]):
+        if sum(occ) != ne: continue
+        holes     = sum(max(r - n, 0) for r, n in zip(cat_ref, occ))
+        particles = sum(max(n - r, 0) for r, n in zip(cat_ref, occ))
+        if holes <= level and particles <= level: cats.append(list(occ))
+    return cats
+
+
+@pytest.mark.parametrize('excitations', ['S', 'D', 'T', 'Q', 's', 2, 0, 'F'])
+@pytest.mark.parametrize('seed', range(3))
+def test_GAS_levels_brute(excitations, seed):
+    rng = random.Random(seed)
+    for _ in range(50):
+        ngas = rng.randint(1, 4)
+        nos  = [rng.randint(1, 4) for _ in range(ngas)]
+        ne   = rng.randint(1, sum(nos))
+        if excitations == 'F':
+            level = ne
+        elif isinstance(excitations, int):
+            level = excitations
+        else:
+            level = GAS_EXCITATION_LEVELS[excitations.upper()]
+        restriction = None
+        lo, hi = [0]*ngas, list(nos)
+        if rng.random() < 0.5:
+            restriction = [(rng.randint(0, 1), rng.randint(no-1, no)) for no in nos]
+            lo = [r[0] for r in restriction]
+            hi = [min(no, r[1]) for no, r in zip(nos, restriction)]
+        # a reference other than HF half of the time
+        cat_ref = hf_category(nos, ne)
+        if rng.random() < 0.5: cat_ref = hf_category(nos[::-1], ne)[::-1]
+
+        cats = enumerate_GAS_categories(nos, ne, cat_ref, excitations, restriction)
+        ref = brute_level(nos, ne, cat_ref, level, lo, hi)
+        assert sorted(cats) == sorted(ref) and len(cats) == len(ref)
+        if cat_ref in ref: assert cats[0] == cat_ref